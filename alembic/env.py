@@ -8,6 +8,7 @@ import os
 
 sys.path.insert(0, os.path.abspath("."))
 from app.db.database import Base, engine
+from app.db import models  # noqa: F401  (registers models on Base.metadata)
 
 config = context.config
 if config.config_file_name is not None:
@@ -0,0 +1,44 @@
+"""create query_hist table
+
+Revision ID: 0b1d5e3f7a92
+Revises: 
+Create Date: 2026-10-18 09:02:10.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b1d5e3f7a92'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'query_hist',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('session_id', sa.String(), nullable=False),
+        sa.Column('query_text', sa.Text(), nullable=False),
+        sa.Column('response_text', sa.Text(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_query_hist_id'), 'query_hist', ['id'], unique=False)
+    op.create_index(op.f('ix_query_hist_user_id'), 'query_hist', ['user_id'], unique=False)
+    op.create_index(op.f('ix_query_hist_session_id'), 'query_hist', ['session_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_query_hist_session_id'), table_name='query_hist')
+    op.drop_index(op.f('ix_query_hist_user_id'), table_name='query_hist')
+    op.drop_index(op.f('ix_query_hist_id'), table_name='query_hist')
+    op.drop_table('query_hist')
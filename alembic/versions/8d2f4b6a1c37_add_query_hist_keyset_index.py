@@ -0,0 +1,37 @@
+"""add query_hist keyset pagination index
+
+Revision ID: 8d2f4b6a1c37
+Revises: 3a7c1e9b5d20
+Create Date: 2026-10-18 10:05:17.284610
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f4b6a1c37'
+down_revision: Union[str, Sequence[str], None] = '3a7c1e9b5d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so writes to query_hist are not blocked while the index is created.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_query_hist_user_id_timestamp_id',
+            'query_hist',
+            ['user_id', sa.text('timestamp DESC'), sa.text('id DESC')],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_query_hist_user_id_timestamp_id', table_name='query_hist', postgresql_concurrently=True)
@@ -0,0 +1,57 @@
+"""store structured answers once in an answers table keyed by content hash
+
+Revision ID: a8c3e5f1d276
+Revises: f2a6c8e0d913
+Create Date: 2026-10-18 20:14:37.520917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8c3e5f1d276'
+down_revision: Union[str, Sequence[str], None] = 'f2a6c8e0d913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'answers',
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('structured_data', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('search_vector', postgresql.TSVECTOR(),
+                  sa.Computed("to_tsvector('english', structured_data)", persisted=True), nullable=True),
+        sa.PrimaryKeyConstraint('content_hash')
+    )
+    op.create_index('ix_answers_search_vector', 'answers', ['search_vector'], unique=False, postgresql_using='gin')
+
+    # Existing rows keep their rendered text; new structured answers only reference answers.
+    op.add_column('query_hist', sa.Column('answer_hash', sa.String(length=64), nullable=True))
+    op.alter_column('query_hist', 'response_text', existing_type=sa.Text(), nullable=True)
+    op.create_index('ix_query_hist_answer_hash', 'query_hist', ['answer_hash'], unique=False,
+                    postgresql_where=sa.text('answer_hash IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # The Markdown rendering lives in the application, so rows that only reference an answer
+    # get its general_response (or the raw JSON) back as text.
+    op.execute("""
+        UPDATE query_hist SET response_text = coalesce(answers.structured_data ->> 'general_response',
+                                                       answers.structured_data::text)
+        FROM answers
+        WHERE query_hist.answer_hash = answers.content_hash AND query_hist.response_text IS NULL
+    """)
+    op.execute("UPDATE query_hist SET response_text = '' WHERE response_text IS NULL")
+    op.drop_index('ix_query_hist_answer_hash', table_name='query_hist')
+    op.alter_column('query_hist', 'response_text', existing_type=sa.Text(), nullable=False)
+    op.drop_column('query_hist', 'answer_hash')
+    op.drop_index('ix_answers_search_vector', table_name='answers', postgresql_using='gin')
+    op.drop_table('answers')
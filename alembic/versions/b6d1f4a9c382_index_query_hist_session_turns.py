@@ -0,0 +1,32 @@
+"""index query_hist on (session_id, timestamp, id) for session context
+
+Revision ID: b6d1f4a9c382
+Revises: a8c3e5f1d276
+Create Date: 2026-10-18 20:52:09.318440
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d1f4a9c382'
+down_revision: Union[str, Sequence[str], None] = 'a8c3e5f1d276'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Replaces ix_query_hist_session_id: equality lookups on session_id are served by the new index too.
+    op.create_index('ix_query_hist_session_id_timestamp_id', 'query_hist',
+                    ['session_id', sa.text('timestamp DESC'), sa.text('id DESC')], unique=False)
+    op.drop_index('ix_query_hist_session_id', table_name='query_hist')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_query_hist_session_id', 'query_hist', ['session_id'], unique=False)
+    op.drop_index('ix_query_hist_session_id_timestamp_id', table_name='query_hist')
@@ -0,0 +1,52 @@
+"""add query_hist full-text search column and GIN index
+
+Revision ID: c41e7a9f2b68
+Revises: 8d2f4b6a1c37
+Create Date: 2026-10-18 18:40:12.519307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e7a9f2b68'
+down_revision: Union[str, Sequence[str], None] = '8d2f4b6a1c37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A stored generated column rewrites query_hist once; afterwards Postgres keeps it current on every write.
+    op.add_column(
+        'query_hist',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "to_tsvector('english', coalesce(query_text, '') || ' ' || coalesce(response_text, ''))",
+                persisted=True
+            ),
+            nullable=True
+        )
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_query_hist_search_vector',
+            'query_hist',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_query_hist_search_vector', table_name='query_hist', postgresql_concurrently=True)
+    op.drop_column('query_hist', 'search_vector')
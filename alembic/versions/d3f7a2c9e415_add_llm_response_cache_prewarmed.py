@@ -0,0 +1,32 @@
+"""add prewarmed flag to llm_response_cache
+
+Revision ID: d3f7a2c9e415
+Revises: b6d1f4a9c382
+Create Date: 2026-10-18 22:14:37.602915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f7a2c9e415'
+down_revision: Union[str, Sequence[str], None] = 'b6d1f4a9c382'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('llm_response_cache',
+                  sa.Column('prewarmed', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.create_index('ix_llm_response_cache_prewarmed_created_at', 'llm_response_cache',
+                    [sa.text('created_at DESC')], unique=False, postgresql_where=sa.text('prewarmed'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_llm_response_cache_prewarmed_created_at', table_name='llm_response_cache')
+    op.drop_column('llm_response_cache', 'prewarmed')
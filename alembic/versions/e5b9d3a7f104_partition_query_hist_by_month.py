@@ -0,0 +1,114 @@
+"""partition query_hist by month on timestamp
+
+Revision ID: e5b9d3a7f104
+Revises: c41e7a9f2b68
+Create Date: 2026-10-18 19:02:44.106382
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b9d3a7f104'
+down_revision: Union[str, Sequence[str], None] = 'c41e7a9f2b68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created ahead of the current month; `python -m app.db.partitions create` keeps this up.
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, user_id, session_id, query_text, response_text, timestamp"
+SEARCH_VECTOR = "to_tsvector('english', coalesce(query_text, '') || ' ' || coalesce(response_text, ''))"
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + (month.month - 1) + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _month_start(value: datetime) -> datetime:
+    value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _drop_history_indexes() -> None:
+    for index in ('ix_query_hist_id', 'ix_query_hist_user_id', 'ix_query_hist_session_id',
+                  'ix_query_hist_user_id_timestamp_id', 'ix_query_hist_search_vector'):
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+
+    op.execute("ALTER TABLE query_hist RENAME TO query_hist_legacy")
+    op.execute("ALTER TABLE query_hist_legacy RENAME CONSTRAINT query_hist_pkey TO query_hist_legacy_pkey")
+    _drop_history_indexes()
+
+    # The partition key has to be part of the primary key. ix_query_hist_id and ix_query_hist_user_id
+    # are not recreated: the primary key and ix_query_hist_user_id_timestamp_id already cover them.
+    op.execute(f"""
+        CREATE TABLE query_hist (
+            id UUID NOT NULL,
+            user_id VARCHAR NOT NULL,
+            session_id VARCHAR NOT NULL,
+            query_text TEXT NOT NULL,
+            response_text TEXT NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            search_vector TSVECTOR GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED,
+            CONSTRAINT query_hist_pkey PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute("CREATE INDEX ix_query_hist_user_id_timestamp_id ON query_hist (user_id, timestamp DESC, id DESC)")
+    op.execute("CREATE INDEX ix_query_hist_session_id ON query_hist (session_id)")
+    op.execute("CREATE INDEX ix_query_hist_search_vector ON query_hist USING gin (search_vector)")
+    # Catches rows outside every monthly partition so inserts never fail if maintenance falls behind.
+    op.execute("CREATE TABLE query_hist_default PARTITION OF query_hist DEFAULT")
+
+    current = _month_start(datetime.now(timezone.utc))
+    oldest = conn.execute(sa.text("SELECT min(timestamp) FROM query_hist_legacy")).scalar()
+    month = min(_month_start(oldest), current) if oldest is not None else current
+    last = _add_months(current, MONTHS_AHEAD)
+    while month <= last:
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE query_hist_p{month.year:04d}_{month.month:02d} PARTITION OF query_hist "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        month = upper
+
+    op.execute(f"INSERT INTO query_hist ({COLUMNS}) SELECT {COLUMNS} FROM query_hist_legacy")
+    op.execute("DROP TABLE query_hist_legacy")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE query_hist RENAME TO query_hist_partitioned")
+    op.execute("ALTER TABLE query_hist_partitioned RENAME CONSTRAINT query_hist_pkey TO query_hist_partitioned_pkey")
+    _drop_history_indexes()
+
+    op.execute(f"""
+        CREATE TABLE query_hist (
+            id UUID NOT NULL,
+            user_id VARCHAR NOT NULL,
+            session_id VARCHAR NOT NULL,
+            query_text TEXT NOT NULL,
+            response_text TEXT NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            search_vector TSVECTOR GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED,
+            CONSTRAINT query_hist_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute(f"INSERT INTO query_hist ({COLUMNS}) SELECT {COLUMNS} FROM query_hist_partitioned")
+    # Dropping the partitioned parent drops all of its partitions.
+    op.execute("DROP TABLE query_hist_partitioned")
+
+    op.execute("CREATE INDEX ix_query_hist_id ON query_hist (id)")
+    op.execute("CREATE INDEX ix_query_hist_user_id ON query_hist (user_id)")
+    op.execute("CREATE INDEX ix_query_hist_session_id ON query_hist (session_id)")
+    op.execute("CREATE INDEX ix_query_hist_user_id_timestamp_id ON query_hist (user_id, timestamp DESC, id DESC)")
+    op.execute("CREATE INDEX ix_query_hist_search_vector ON query_hist USING gin (search_vector)")
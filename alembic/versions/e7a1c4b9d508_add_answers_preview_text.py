@@ -0,0 +1,29 @@
+"""add preview_text to answers
+
+Revision ID: e7a1c4b9d508
+Revises: d3f7a2c9e415
+Create Date: 2026-10-19 10:41:22.370561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a1c4b9d508'
+down_revision: Union[str, Sequence[str], None] = 'd3f7a2c9e415'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Left NULL for existing answers: they are rendered for previews, and get a preview when reused.
+    op.add_column('answers', sa.Column('preview_text', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('answers', 'preview_text')
@@ -0,0 +1,49 @@
+"""add query_jobs table
+
+Revision ID: f2a6c8e0d913
+Revises: e5b9d3a7f104
+Create Date: 2026-10-18 19:41:08.772015
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6c8e0d913'
+down_revision: Union[str, Sequence[str], None] = 'e5b9d3a7f104'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'query_jobs',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('session_id', sa.String(), nullable=False),
+        sa.Column('query_text', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=16), server_default='pending', nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_query_jobs_pending_created_at', 'query_jobs', ['created_at'], unique=False,
+                    postgresql_where=sa.text("status = 'pending'"))
+    op.create_index('ix_query_jobs_running_started_at', 'query_jobs', ['started_at'], unique=False,
+                    postgresql_where=sa.text("status = 'running'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_query_jobs_running_started_at', table_name='query_jobs')
+    op.drop_index('ix_query_jobs_pending_created_at', table_name='query_jobs')
+    op.drop_table('query_jobs')
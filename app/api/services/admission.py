@@ -0,0 +1,237 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+from fastapi import HTTPException, status
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from app.core.config import settings
+from app.api.services.metrics import stage_timer
+from app.api.services.cache import response_cache, make_cache_key
+from app.api.services.tiering import route_query, LIGHT_TIER
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first.
+PRIORITY_CACHED = 0
+PRIORITY_CHEAP = 1
+PRIORITY_FULL = 2
+
+
+def _retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, int(seconds + 0.999)))}
+
+
+class SlidingWindowQuota:
+    """
+    Per-key request quota over a sliding time window, kept in process.
+    Only the most recently seen max_keys keys are tracked.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100_000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits: "OrderedDict[str, Deque[float]]" = OrderedDict()
+
+    def hit(self, key: str, cost: int = 1) -> float:
+        """
+        Records cost requests for key. Returns 0 if they fit in the quota,
+        otherwise the seconds until they would, without recording anything.
+        """
+        now = time.monotonic()
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = deque()
+            self._hits[key] = hits
+        self._hits.move_to_end(key)
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+
+        if len(hits) + cost > self.limit:
+            if cost > self.limit:
+                return self.window
+            # Wait until enough of the oldest requests leave the window.
+            return hits[len(hits) + cost - self.limit - 1] + self.window - now
+
+        hits.extend([now] * cost)
+        while len(self._hits) > self.max_keys:
+            self._hits.popitem(last=False)
+        return 0.0
+
+    def tracked_keys(self) -> int:
+        return len(self._hits)
+
+
+class AdmissionController:
+    """
+    Bounds how many queries are worked on at once. Requests beyond max_concurrency wait in a
+    bounded priority queue, cached and cheap queries first. A request is shed with 503 and a
+    Retry-After header when the queue is full or it has waited longer than queue_timeout,
+    so that under overload some users get fast answers instead of everyone timing out.
+    Queries are counted even when admission control is disabled, so shutdown can wait for them.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float, enabled: bool = True):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._heap: List[List[Any]] = []
+        self._sequence = itertools.count()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.draining = False
+        self.shed: Dict[str, int] = {"queue_full": 0, "deadline": 0, "quota": 0, "draining": 0}
+        self._hold_avg = 1.0
+
+    def _retry_after(self) -> float:
+        # Roughly how long until the current queue drains.
+        return self._hold_avg * (self.waiting + 1) / max(self.max_concurrency, 1)
+
+    def _reject(self, reason: str, detail: str) -> HTTPException:
+        self.shed[reason] += 1
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail,
+                             headers=_retry_after_header(self._retry_after()))
+
+    async def acquire(self, priority: int = PRIORITY_FULL) -> None:
+        """
+        Waits for a slot. Raises 503 if the queue is full, the queue deadline passes or the server is draining.
+        """
+        if self.draining:
+            raise self._reject("draining", "Server is shutting down. Please retry.")
+        if not self.enabled:
+            self.in_flight += 1
+            return
+        if self.in_flight < self.max_concurrency and self.waiting == 0:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if self.waiting >= self.max_queue:
+            raise self._reject("queue_full", "Server is busy. Please retry later.")
+
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, [priority, next(self._sequence), granted])
+        self.waiting += 1
+        try:
+            with stage_timer("admission_wait"):
+                await asyncio.wait_for(asyncio.shield(granted), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if granted.done() and not granted.cancelled():
+                self.admitted += 1
+                return
+            granted.cancel()
+            raise self._reject("deadline", "Server is busy. Please retry later.")
+        except asyncio.CancelledError:
+            # The slot may have been handed over just as the caller went away.
+            if granted.done() and not granted.cancelled():
+                self.release()
+            else:
+                granted.cancel()
+            raise
+        finally:
+            self.waiting -= 1
+        self.admitted += 1
+
+    def release(self, held: Optional[float] = None) -> None:
+        """
+        Frees a slot, handing it straight to the highest-priority waiter if there is one.
+        """
+        if not self.enabled:
+            self.in_flight -= 1
+            return
+        if held is not None:
+            self._hold_avg = 0.9 * self._hold_avg + 0.1 * held
+        while self._heap:
+            _, _, granted = heapq.heappop(self._heap)
+            if not granted.done():
+                granted.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def admit(self, priority: int = PRIORITY_FULL) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stops admitting queries and waits up to timeout for admitted and queued ones to finish.
+        Returns whether they all did.
+        """
+        self.draining = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.in_flight > 0 or self.waiting > 0:
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "draining": self.draining,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "hold_avg_seconds": round(self._hold_avg, 3),
+        }
+
+
+admission = AdmissionController(
+    max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    enabled=settings.ADMISSION_ENABLED
+)
+
+user_quota = SlidingWindowQuota(
+    limit=settings.USER_QUOTA_REQUESTS,
+    window=settings.USER_QUOTA_WINDOW_SECONDS
+)
+
+
+def check_user_quota(user_key: str, cost: int = 1) -> None:
+    """
+    Raises 429 with Retry-After when the user is over their request quota.
+    """
+    if settings.USER_QUOTA_REQUESTS <= 0:
+        return
+    retry_after = user_quota.hit(user_key, cost)
+    if retry_after > 0:
+        admission.shed["quota"] += 1
+        logger.info(f"Quota exceeded for {user_key}. Retry in {retry_after:.1f} seconds.")
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Too many requests. Please slow down.",
+                            headers=_retry_after_header(retry_after))
+
+
+def admission_priority(query: str) -> int:
+    """
+    Cached answers are cheapest to serve, then queries routed to the light tier.
+    """
+    route = route_query(query)
+    if settings.RESPONSE_CACHE_ENABLED and response_cache.contains(make_cache_key(query, route.template)):
+        return PRIORITY_CACHED
+    if route.tier.name == LIGHT_TIER:
+        return PRIORITY_CHEAP
+    return PRIORITY_FULL
+
+
+def quota_key(user_id: Optional[str], client_host: Optional[str]) -> str:
+    """
+    Quotas are per user_id; anonymous requests are grouped by client address.
+    """
+    return user_id if user_id else f"ip:{client_host or 'unknown'}"
@@ -0,0 +1,80 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+import uuid
+
+from app.schemas.qna import QueryResponse, LLMResponseContent
+from app.api.services.llm import call_routed_llm, render_llm_response, parse_llm_response
+from app.api.services.tiering import route_query
+from app.api.services.cache import make_cache_key, get_cached_response, store_cached_response
+from app.api.services.history_writer import record_query_history
+from app.api.services.session_context import load_session_context
+from app.api.services.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+
+async def answer_query(
+    db_session: AsyncSession,
+    query: str,
+    user_id: str,
+    session_id: str,
+    timestamp: datetime,
+    new_session: bool = False,
+    history_id: Optional[uuid.UUID] = None
+) -> QueryResponse:
+    """
+    Answers a query from the response cache or the LLM and stores it in the query history.
+    Follow-up queries in a session are sent with the session's earlier turns and bypass the
+    response cache, since their answer depends on the conversation. Shared by POST /query and the job workers.
+    With history_id set, the history row is stored under that ID, so answering again does not store it twice.
+    """
+    route = route_query(query)
+    template = route.template
+    cache_key = make_cache_key(query, template)
+
+    structured_data: Optional[LLMResponseContent] = None
+    ai_response_text: str = ""
+    cache_tier: Optional[str] = None
+
+    context = None if new_session else await load_session_context(db_session, user_id, session_id)
+    if context is None:
+        with stage_timer("cache_lookup"):
+            structured_data, cache_tier = await get_cached_response(db_session, cache_key)
+    cached = structured_data is not None
+
+    if cached:
+        logger.info(f"Serving query from {cache_tier} response cache for user_id: {user_id}")
+        with stage_timer("render"):
+            ai_response_text = render_llm_response(structured_data)
+    else:
+        with stage_timer("llm"):
+            llm_raw_response = await call_routed_llm(query, route, context)
+        structured_data, ai_response_text = parse_llm_response(llm_raw_response)
+
+        if structured_data is not None and context is None:
+            with stage_timer("cache_store"):
+                await store_cached_response(db_session, cache_key, query, template, structured_data)
+
+    with stage_timer("db_write"):
+        await record_query_history(
+            db_session,
+            user_id=user_id,
+            session_id=session_id,
+            query_text=query,
+            response_text=ai_response_text,
+            timestamp=timestamp,
+            structured_data=structured_data,
+            history_id=history_id
+        )
+    logger.info(f"Query stored in DB for user_id: {user_id}, session_id: {session_id}")
+
+    return QueryResponse(
+        ai_response=ai_response_text,
+        structured_data=structured_data,
+        session_id=session_id,
+        user_id=user_id,
+        timestamp=timestamp,
+        cached=cached
+    )
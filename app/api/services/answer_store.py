@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import logging
+
+import orjson
+
+from app.core.config import settings
+from app.crud.query import HIGHLIGHT_START
+from app.schemas.qna import LLMResponseContent
+from app.api.services.llm import render_llm_response
+
+logger = logging.getLogger(__name__)
+
+SNIPPET_SEPARATOR = " … "
+MISSING_ANSWER_TEXT = "The stored answer for this query is no longer available."
+
+
+def answer_hash(structured_data: Dict[str, Any]) -> str:
+    """
+    Content hash of a structured answer. Keys are sorted so equal answers always hash the same.
+    """
+    return hashlib.sha256(orjson.dumps(structured_data, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def history_answer_fields(structured_data: Optional[LLMResponseContent], response_text: str) -> Dict[str, Any]:
+    """
+    The answer columns of a query history row. Structured answers are stored once in the answers
+    table, with the start of their rendered text as a preview, and referenced by hash; answers
+    without structured data keep their text.
+    """
+    if structured_data is None:
+        return {"response_text": response_text, "answer_hash": None, "structured_data": None, "answer_preview": None}
+    data = structured_data.model_dump(exclude_none=True)
+    # One character more than a preview shows, so readers can tell whether it was cut.
+    answer_preview = response_text[:settings.HISTORY_PREVIEW_CHARS + 1]
+    return {"response_text": None, "answer_hash": answer_hash(data), "structured_data": data, "answer_preview": answer_preview}
+
+
+class AnswerRenderer:
+    """
+    LRU memo of stored answers, validated and rendered as Markdown, keyed by content hash.
+    Popular answers are shared by many history rows, so most reads skip validation and rendering.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[LLMResponseContent, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, content_hash: str, structured_data: Dict[str, Any]) -> Tuple[LLMResponseContent, str]:
+        entry = self._entries.get(content_hash)
+        if entry is not None:
+            self._entries.move_to_end(content_hash)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        content = LLMResponseContent.model_validate(structured_data)
+        entry = (content, render_llm_response(content))
+        if self.max_entries > 0:
+            self._entries[content_hash] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+answer_renderer = AnswerRenderer(max_entries=settings.ANSWER_RENDER_CACHE_SIZE)
+
+
+def history_answer(
+    response_text: Optional[str],
+    content_hash: Optional[str],
+    structured_data: Optional[Dict[str, Any]]
+) -> Tuple[Optional[LLMResponseContent], str]:
+    """
+    Returns the structured data and Markdown text of a stored history row.
+    """
+    if content_hash is None:
+        return None, response_text or ""
+    if structured_data is None:
+        logger.warning(f"History row references answer {content_hash}, which is not stored.")
+        return None, response_text or MISSING_ANSWER_TEXT
+    return answer_renderer.render(content_hash, structured_data)
+
+
+def answer_snippet(highlighted: Any) -> str:
+    """
+    Joins the string values of an answer highlighted by ts_headline, preferring those with a match.
+    """
+    values = []
+
+    def collect(value: Any) -> None:
+        if isinstance(value, str):
+            values.append(value)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+
+    collect(highlighted)
+    matches = [value for value in values if HIGHLIGHT_START in value]
+    return SNIPPET_SEPARATOR.join(matches or values[:1])
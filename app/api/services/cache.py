@@ -0,0 +1,220 @@
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Dict, Tuple
+import hashlib
+import logging
+import re
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.crud.cache import get_persistent_cache_entry, upsert_persistent_cache_entry, get_prewarmed_cache_entries
+from app.schemas.qna import LLMResponseContent
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query so trivially different spellings share a cache entry.
+    """
+    return _WHITESPACE_RE.sub(" ", query.strip().lower()).rstrip("?!. ")
+
+
+def make_cache_key(query: str, template: str) -> str:
+    """
+    Builds the cache key from the normalized query and the prompt template name.
+    """
+    return hashlib.sha256(f"{template}:{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _CacheEntry:
+    value: LLMResponseContent
+    size: int
+    expires_at: float
+
+
+class ResponseCache:
+    """
+    Bounded in-process LRU cache with a TTL and a total size limit.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[LLMResponseContent]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def contains(self, key: str) -> bool:
+        """
+        Returns whether a live entry exists, without touching recency or hit counters.
+        """
+        entry = self._entries.get(key)
+        return entry is not None and entry.expires_at > time.monotonic()
+
+    def set(self, key: str, value: LLMResponseContent, ttl_seconds: Optional[float] = None) -> None:
+        size = len(value.model_dump_json())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = _CacheEntry(value=value, size=size, expires_at=time.monotonic() + ttl)
+        self._size += size
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS
+)
+
+persistent_stats: Dict[str, int] = {"hits": 0, "misses": 0, "errors": 0}
+
+
+async def get_cached_response(db_session: AsyncSession, key: str) -> Tuple[Optional[LLMResponseContent], Optional[str]]:
+    """
+    Looks the key up in the in-process tier, then in the persistent tier.
+    Returns the cached content and the tier it came from.
+    """
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None, None
+
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached, "memory"
+
+    if not settings.RESPONSE_CACHE_PERSISTENT:
+        return None, None
+
+    try:
+        entry = await get_persistent_cache_entry(db_session, key)
+    except Exception as e:
+        logger.warning(f"Persistent response cache lookup failed: {e}")
+        persistent_stats["errors"] += 1
+        await db_session.rollback()
+        return None, None
+
+    if entry is None:
+        persistent_stats["misses"] += 1
+        return None, None
+
+    persistent_stats["hits"] += 1
+    content = LLMResponseContent(**entry.response)
+    remaining = (entry.expires_at - datetime.now(timezone.utc)).total_seconds()
+    response_cache.set(key, content, ttl_seconds=min(remaining, settings.RESPONSE_CACHE_TTL_SECONDS))
+    return content, "persistent"
+
+
+async def store_cached_response(
+    db_session: AsyncSession,
+    key: str,
+    query: str,
+    template: str,
+    content: LLMResponseContent,
+    ttl_seconds: Optional[int] = None,
+    prewarmed: bool = False
+) -> None:
+    """
+    Stores a parsed response in both cache tiers. Failures are logged and never raised.
+    """
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return
+
+    ttl_seconds = ttl_seconds or settings.RESPONSE_CACHE_TTL_SECONDS
+    response_cache.set(key, content, ttl_seconds=ttl_seconds)
+
+    if not settings.RESPONSE_CACHE_PERSISTENT:
+        return
+
+    try:
+        await upsert_persistent_cache_entry(
+            db_session,
+            cache_key=key,
+            template=template,
+            normalized_query=normalize_query(query),
+            response=content.model_dump(),
+            ttl_seconds=ttl_seconds,
+            prewarmed=prewarmed
+        )
+    except Exception as e:
+        logger.warning(f"Persistent response cache write failed: {e}")
+        persistent_stats["errors"] += 1
+        await db_session.rollback()
+
+
+async def load_prewarmed_responses(db_session: AsyncSession, limit: int) -> int:
+    """
+    Copies up to limit pre-warmed entries from the persistent tier into the in-process tier,
+    each for the rest of its TTL. Returns how many were loaded. Failures are logged and never raised.
+    """
+    if not (settings.RESPONSE_CACHE_ENABLED and settings.RESPONSE_CACHE_PERSISTENT) or limit <= 0:
+        return 0
+
+    try:
+        entries = await get_prewarmed_cache_entries(db_session, limit)
+    except Exception as e:
+        logger.warning(f"Could not load pre-warmed responses: {e}")
+        persistent_stats["errors"] += 1
+        await db_session.rollback()
+        return 0
+
+    now = datetime.now(timezone.utc)
+    # Oldest first, so the most recently refreshed entries are the last to be evicted.
+    for entry in reversed(entries):
+        remaining = (entry.expires_at - now).total_seconds()
+        response_cache.set(entry.cache_key, LLMResponseContent(**entry.response), ttl_seconds=remaining)
+    return len(entries)
+
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Returns hit/miss/eviction counters for both cache tiers.
+    """
+    return {"memory": response_cache.stats(), "persistent": dict(persistent_stats)}
@@ -0,0 +1,164 @@
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, TypeVar, Any
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.api.services.metrics import LLM_HEDGES, LLM_HEDGE_SAVED_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class HedgedRequests:
+    """
+    Hedging for upstream calls. If a call has been at the upstream for longer than the recent
+    LLM_HEDGE_QUANTILE latency of its model, the same request is sent again; the first usable response
+    wins and the other request is cancelled. Latencies and the hedge delay cover only the time at the
+    upstream, not time spent waiting for a local slot, so a local backlog does not trigger hedges.
+    Hedges are paid for with credits earned at LLM_HEDGE_BUDGET per call, which caps the extra upstream
+    load at that fraction of calls, and are not sent when the caller reports no spare capacity.
+    """
+
+    def __init__(self, enabled: bool, quantile: float, min_delay: float, budget: float, window: int, min_samples: int):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self._latencies: Dict[str, Deque[float]] = {}
+        # At most about one window's worth of unused hedges can be saved up for a burst.
+        self._max_credits = 1 + budget * window
+        self._credits = 0.0
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.saturated = 0
+        self.latency_saved = 0.0
+
+    def threshold(self, key: str) -> Optional[float]:
+        """
+        Seconds to wait before hedging a call for key, or None until enough latencies are known.
+        """
+        samples = self._latencies.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return max(self.min_delay, ordered[int(self.quantile * (len(ordered) - 1))])
+
+    def _record(self, key: str, latency: float) -> None:
+        samples = self._latencies.get(key)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._latencies[key] = samples
+        samples.append(latency)
+
+    def _expected_latency_beyond(self, key: str, elapsed: float) -> float:
+        # The cancelled call's latency is unknown; estimate it from recent calls that took longer than elapsed.
+        slower = [latency for latency in self._latencies.get(key, ()) if latency > elapsed]
+        return sum(slower) / len(slower) if slower else elapsed
+
+    async def send(
+        self,
+        key: str,
+        request: Callable[[asyncio.Event], Awaitable[T]],
+        is_failure: Callable[[T], bool],
+        latency: Callable[[T], float],
+        has_capacity: Callable[[], bool] = lambda: True
+    ) -> T:
+        """
+        Runs request(sent), hedged once if it is slow. request sets sent when it starts talking to the
+        upstream, and latency(result) returns how long it spent there. A result for which is_failure is
+        true, or an exception, only wins if the other request fails too; then the first request that
+        returned a result wins, the primary if both did, and the primary's exception is raised otherwise.
+        """
+        if not self.enabled:
+            return await request(asyncio.Event())
+
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+        self._credits = min(self._max_credits, self._credits + self.budget)
+        delay = self.threshold(key)
+        primary_sent = asyncio.Event()
+        primary = asyncio.ensure_future(request(primary_sent))
+        tasks: List["asyncio.Future[T]"] = [primary]
+        sent_at = None
+
+        try:
+            if delay is not None:
+                # The hedge delay starts once the primary is at the upstream, not while it waits for a slot.
+                sent = asyncio.ensure_future(primary_sent.wait())
+                try:
+                    await asyncio.wait({primary, sent}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    sent.cancel()
+                sent_at = loop.time()
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    if not has_capacity():
+                        self.saturated += 1
+                        LLM_HEDGES.inc("saturated")
+                    elif self._credits >= 1:
+                        self._credits -= 1
+                        self.hedged += 1
+                        tasks.append(asyncio.ensure_future(request(asyncio.Event())))
+                    else:
+                        self.budget_denied += 1
+                        LLM_HEDGES.inc("budget_denied")
+
+            pending = set(tasks)
+            while pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if not task.done() or task.cancelled() or task.exception() is not None or is_failure(task.result()):
+                        continue
+                    self._record(key, latency(task.result()))
+                    if task is primary:
+                        if len(tasks) > 1:
+                            LLM_HEDGES.inc("primary_won")
+                    else:
+                        primary_elapsed = loop.time() - sent_at
+                        saved = self._expected_latency_beyond(key, primary_elapsed) - primary_elapsed
+                        self.hedge_wins += 1
+                        self.latency_saved += saved
+                        LLM_HEDGES.inc("hedge_won")
+                        LLM_HEDGE_SAVED_SECONDS.inc(amount=saved)
+                    return task.result()
+
+            if len(tasks) > 1:
+                LLM_HEDGES.inc("both_failed")
+            for task in tasks:
+                if task.exception() is None:
+                    return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": self.hedged / self.calls if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "budget_denied": self.budget_denied,
+            "saturated": self.saturated,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+            "thresholds_seconds": {key: self.threshold(key) for key in self._latencies},
+        }
+
+
+llm_hedging = HedgedRequests(
+    enabled=settings.LLM_HEDGING_ENABLED,
+    quantile=settings.LLM_HEDGE_QUANTILE,
+    min_delay=settings.LLM_HEDGE_MIN_DELAY,
+    budget=settings.LLM_HEDGE_BUDGET,
+    window=settings.LLM_HEDGE_WINDOW,
+    min_samples=settings.LLM_HEDGE_MIN_SAMPLES
+)
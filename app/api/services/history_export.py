@@ -0,0 +1,113 @@
+"""
+Streaming export of query history as NDJSON or CSV.
+
+    python -m app.api.services.history_export --user-id u123 > u123.ndjson
+    python -m app.api.services.history_export --start 2026-01-01 --end 2026-02-01 --format csv -o january.csv
+
+Rows are read through a server-side cursor and written one batch at a time, so memory use stays
+flat regardless of how many rows are exported.
+Stored answers are rendered to Markdown for response_text; NDJSON also carries their structured_data.
+"""
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional
+import argparse
+import asyncio
+import csv
+import io
+import logging
+import sys
+
+import orjson
+
+from app.core.config import settings
+from app.crud.query import stream_query_history
+from app.db import database
+from app.api.services.answer_store import history_answer
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_FIELDS = ("id", "user_id", "session_id", "query_text", "response_text", "timestamp")
+
+
+def _response_text(row: Any) -> str:
+    return history_answer(row.response_text, row.answer_hash, row.structured_data)[1]
+
+
+def format_ndjson(rows: List[Any]) -> bytes:
+    lines = []
+    for row in rows:
+        record = {field: getattr(row, field) for field in EXPORT_FIELDS}
+        record["response_text"] = _response_text(row)
+        record["structured_data"] = row.structured_data
+        lines.append(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+    return b"".join(lines)
+
+
+def format_csv(rows: List[Any], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow((str(row.id), row.user_id, row.session_id, row.query_text, _response_text(row),
+                         row.timestamp.isoformat() if isinstance(row.timestamp, datetime) else row.timestamp))
+    return buffer.getvalue().encode("utf-8")
+
+
+async def export_history(
+    export_format: str,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yields the encoded export one batch at a time. Uses its own session, since it outlives the request handler.
+    """
+    batch_size = batch_size or settings.HISTORY_EXPORT_BATCH_SIZE
+    exported = 0
+    if export_format == "csv":
+        yield format_csv([], header=True)
+
+    async with database.AsyncSessionLocal() as db_session:
+        async for rows in stream_query_history(db_session, user_id=user_id, start=start, end=end, batch_size=batch_size):
+            exported += len(rows)
+            yield format_csv(rows) if export_format == "csv" else format_ndjson(rows)
+
+    logger.info(f"Exported {exported} history rows (user_id={user_id}, start={start}, end={end}, format={export_format})")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Export query history as NDJSON or CSV.")
+    parser.add_argument("--user-id", help="Only export this user's history.")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Earliest timestamp, inclusive (ISO 8601).")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Latest timestamp, exclusive (ISO 8601).")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--batch-size", type=int, default=settings.HISTORY_EXPORT_BATCH_SIZE)
+    parser.add_argument("-o", "--output", help="Output file; defaults to stdout.")
+    args = parser.parse_args(argv)
+    # Logs go to stderr so stdout carries only the export.
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    async def run() -> None:
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            async for chunk in export_history(args.format, args.user_id, args.start, args.end, args.batch_size):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+            else:
+                output.flush()
+            await database.engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
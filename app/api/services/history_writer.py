@@ -0,0 +1,272 @@
+
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+from app.core.config import settings
+from app.crud.query import create_query_history, bulk_create_query_history
+from app.db.database import AsyncSessionLocal
+from app.schemas.qna import LLMResponseContent
+from app.api.services.answer_store import history_answer_fields
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """
+    Write-behind persistence for query history.
+
+    Rows are put on a bounded queue and written by a background task in multi-row INSERTs,
+    flushed when a batch fills up or the flush interval passes. When the queue is full,
+    callers wait (backpressure) and fall back to a direct write if the wait times out.
+    Batches that cannot be written are appended to a local spill file and replayed on the next start.
+    """
+
+    def __init__(
+        self,
+        queue_size: int,
+        batch_size: int,
+        flush_interval: float,
+        enqueue_timeout: float,
+        spill_path: Optional[str],
+        stop_timeout: float
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.spill_path = spill_path
+        self.stop_timeout = stop_timeout
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        # Serializes access to the spill file, which is written from worker threads.
+        self._spill_lock = asyncio.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.direct_writes = 0
+        self.spilled = 0
+        self.replayed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        await self.replay_spill()
+        self._task = asyncio.create_task(self._run(), name="history-writer")
+        logger.info("History write-behind task started.")
+
+    async def stop(self) -> None:
+        """
+        Stops the background task after every queued row has been flushed, waiting at most
+        stop_timeout seconds. Rows still queued after that are spilled.
+        """
+        if self._task is None:
+            return
+        if not self._task.done():
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=self.stop_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"History rows were not written within {self.stop_timeout}s. Spilling {self._queue.qsize()} queued rows.")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"History write-behind task failed: {e}")
+        self._task = None
+
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if pending:
+            try:
+                await self._spill(pending)
+            except Exception as e:
+                logger.error(f"Could not spill {len(pending)} history rows. They were lost: {e}")
+        logger.info(f"History write-behind task stopped. {self.written} rows written in {self.batches} batches.")
+
+    async def enqueue(self, row: Dict[str, Any]) -> None:
+        row.setdefault("id", uuid.uuid4())
+        try:
+            await asyncio.wait_for(self._queue.put(row), timeout=self.enqueue_timeout)
+            self.enqueued += 1
+        except asyncio.TimeoutError:
+            logger.warning("History write queue is full. Writing row directly.")
+            self.direct_writes += 1
+            await self._write([row])
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            except Exception as e:
+                # _write only raises when the spill file cannot be written either; keep serving later rows.
+                logger.error(f"Could not spill {len(batch)} history rows. They were lost: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        try:
+            async with AsyncSessionLocal() as db_session:
+                await bulk_create_query_history(db_session, rows)
+            self.written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} history rows: {e}")
+            await self._spill(rows)
+
+    @staticmethod
+    def _encode(rows: List[Dict[str, Any]]) -> str:
+        return "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+    def _append_spill(self, rows: List[Dict[str, Any]]) -> None:
+        with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+            spill_file.write(self._encode(rows))
+
+    def _read_spill(self) -> Optional[List[Dict[str, Any]]]:
+        if not os.path.exists(self.spill_path):
+            return None
+        with open(self.spill_path, encoding="utf-8") as spill_file:
+            return [json.loads(line) for line in spill_file if line.strip()]
+
+    def _rewrite_spill(self, rows: List[Dict[str, Any]]) -> None:
+        # Written to a temporary file first so a crash never leaves a truncated spill file behind.
+        temporary_path = f"{self.spill_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as spill_file:
+            spill_file.write(self._encode(rows))
+        os.replace(temporary_path, self.spill_path)
+
+    async def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        if not self.spill_path:
+            logger.error(f"No HISTORY_SPILL_PATH configured. {len(rows)} history rows were lost.")
+            return
+        async with self._spill_lock:
+            await asyncio.to_thread(self._append_spill, rows)
+        self.spilled += len(rows)
+        logger.warning(f"Spilled {len(rows)} history rows to {self.spill_path}.")
+
+    async def replay_spill(self) -> None:
+        """
+        Writes rows left in the spill file by an earlier failure, one committed batch at a time.
+        The file is removed once every row is written; if a batch fails, only the rows not yet
+        written are kept, so the next replay does not insert committed rows again.
+        """
+        if not self.spill_path:
+            return
+        async with self._spill_lock:
+            rows = await asyncio.to_thread(self._read_spill)
+            if rows is None:
+                return
+            for row in rows:
+                row["id"] = uuid.UUID(row["id"])
+                row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+
+            written = 0
+            try:
+                async with AsyncSessionLocal() as db_session:
+                    for start in range(0, len(rows), self.batch_size):
+                        written += await bulk_create_query_history(db_session, rows[start:start + self.batch_size])
+            except Exception as e:
+                logger.error(f"Could not replay {len(rows) - written} spilled history rows, keeping them in {self.spill_path}: {e}")
+                await asyncio.to_thread(self._rewrite_spill, rows[written:])
+                self.replayed += written
+                return
+            await asyncio.to_thread(os.remove, self.spill_path)
+        self.replayed += len(rows)
+        logger.info(f"Replayed {len(rows)} spilled history rows.")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "direct_writes": self.direct_writes,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+        }
+
+
+history_writer = HistoryWriter(
+    queue_size=settings.HISTORY_WRITE_QUEUE_SIZE,
+    batch_size=settings.HISTORY_WRITE_BATCH_SIZE,
+    flush_interval=settings.HISTORY_WRITE_FLUSH_INTERVAL,
+    enqueue_timeout=settings.HISTORY_WRITE_ENQUEUE_TIMEOUT,
+    spill_path=settings.HISTORY_SPILL_PATH,
+    stop_timeout=settings.HISTORY_WRITE_STOP_TIMEOUT
+)
+
+
+async def record_query_history_batch(
+    db_session: AsyncSession,
+    rows: List[Dict[str, Any]]
+) -> None:
+    """
+    Stores several query history rows, with one multi-row INSERT unless write-behind is enabled.
+    """
+    if settings.HISTORY_WRITE_BEHIND and history_writer.running:
+        for row in rows:
+            await history_writer.enqueue(row)
+        return
+
+    await bulk_create_query_history(db_session, rows)
+
+
+async def record_query_history(
+    db_session: AsyncSession,
+    user_id: str,
+    session_id: str,
+    query_text: str,
+    response_text: str,
+    timestamp: datetime,
+    structured_data: Optional[LLMResponseContent] = None,
+    history_id: Optional[uuid.UUID] = None
+) -> None:
+    """
+    Stores a query history row, through the write-behind queue when it is enabled and running.
+    Structured answers are stored by reference to the answers table instead of as rendered text.
+    With history_id set, the row is stored under that ID at most once.
+    """
+    answer_fields = history_answer_fields(structured_data, response_text)
+    if settings.HISTORY_WRITE_BEHIND and history_writer.running:
+        await history_writer.enqueue({
+            "id": history_id or uuid.uuid4(),
+            "user_id": user_id,
+            "session_id": session_id,
+            "query_text": query_text,
+            "timestamp": timestamp,
+            **answer_fields,
+        })
+        return
+
+    await create_query_history(
+        db_session,
+        user_id=user_id,
+        session_id=session_id,
+        query_text=query_text,
+        timestamp=timestamp,
+        id=history_id,
+        **answer_fields
+    )
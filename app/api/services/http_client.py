@@ -0,0 +1,101 @@
+
+from typing import Optional
+import asyncio
+import httpx
+import logging
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Builds a pooled AsyncClient configured from settings.
+    A custom transport can be passed in (e.g. httpx.MockTransport in tests).
+    """
+    http2 = settings.LLM_HTTP2
+    if http2 and transport is None and not _http2_available():
+        logger.warning("LLM_HTTP2 is enabled but the 'h2' package is not installed. Falling back to HTTP/1.1.")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(
+        connect=settings.LLM_CONNECT_TIMEOUT,
+        read=settings.LLM_READ_TIMEOUT,
+        write=settings.LLM_WRITE_TIMEOUT,
+        pool=settings.LLM_POOL_TIMEOUT
+    )
+
+    if transport is not None:
+        return httpx.AsyncClient(transport=transport, timeout=timeout)
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+
+async def init_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Creates the shared client for this worker. Called from the app lifespan.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = build_http_client(transport)
+    logger.info("Shared LLM HTTP client initialized.")
+    return _client
+
+
+async def close_http_client() -> None:
+    """
+    Closes the shared client and releases its pooled connections.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Shared LLM HTTP client closed.")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared client, creating it lazily when used outside the app lifespan (scripts, jobs).
+    """
+    global _client
+    if _client is None:
+        _client = build_http_client()
+    return _client
+
+
+def http_client_ready() -> bool:
+    """
+    Returns whether the shared client is open.
+    """
+    return _client is not None and not _client.is_closed
+
+
+async def warm_up_http_client(url: str, connections: int) -> None:
+    """
+    Sends concurrent requests to url so the first LLM calls find open connections in the pool and
+    skip the TCP and TLS handshakes. Any response will do; the request is not authenticated.
+    """
+    if connections <= 0:
+        return
+    client = get_http_client()
+    results = await asyncio.gather(*(client.get(url) for _ in range(connections)), return_exceptions=True)
+    errors = [e for e in results if isinstance(e, BaseException)]
+    if errors:
+        logger.warning(f"LLM HTTP client warm-up failed for {len(errors)}/{connections} connections. First error: {errors[0]!r}")
+    else:
+        logger.info(f"LLM HTTP client warmed up with {connections} connections.")
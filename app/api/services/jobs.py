@@ -0,0 +1,179 @@
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+import asyncio
+import logging
+import uuid
+import weakref
+
+from app.core.config import settings
+from app.core.logging_config import correlation_id_var
+from app.crud.jobs import claim_jobs, finish_job, fail_job
+from app.db.database import AsyncSessionLocal
+from app.db.models import QueryJob
+from app.api.services.answer import answer_query
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorkerPool:
+    """
+    In-process workers that drain the query_jobs table.
+
+    Each worker claims one job at a time with SELECT ... FOR UPDATE SKIP LOCKED, so several processes
+    can share the table. Idle workers sleep until a job is submitted in this process or the poll
+    interval passes. Long-pollers in this process are woken as soon as their job finishes; jobs
+    finished by another process are picked up on the next poll.
+    """
+
+    def __init__(self, workers: int, poll_interval: float, stale_after: float, max_attempts: int):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._waiters: "weakref.WeakValueDictionary[uuid.UUID, asyncio.Event]" = weakref.WeakValueDictionary()
+        self.in_flight = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._run(), name=f"job-worker-{index}") for index in range(self.workers)]
+        logger.info(f"Started {self.workers} job workers.")
+
+    async def stop(self, timeout: float = 0.0) -> None:
+        """
+        Stops claiming jobs and gives running ones up to timeout seconds to finish, then cancels
+        the workers. Jobs they were still running are put back to pending.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks and timeout > 0:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Job workers stopped. {self.succeeded} succeeded, {self.failed} failed.")
+
+    def notify(self) -> None:
+        """
+        Wakes idle workers after a job is submitted.
+        """
+        self._wakeup.set()
+
+    async def wait_for(self, job_id: uuid.UUID, timeout: float) -> None:
+        """
+        Waits until a worker in this process finishes the job or the timeout passes.
+        """
+        event = self._waiters.get(job_id)
+        if event is None:
+            event = asyncio.Event()
+            self._waiters[job_id] = event
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _finished(self, job_id: uuid.UUID) -> None:
+        event = self._waiters.get(job_id)
+        if event is not None:
+            event.set()
+
+    async def _claim(self) -> Optional[QueryJob]:
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+        async with AsyncSessionLocal() as db_session:
+            jobs = await claim_jobs(db_session, limit=1, stale_before=stale_before)
+        return jobs[0] if jobs else None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            await self._process(job)
+
+    async def _process(self, job: QueryJob) -> None:
+        self.in_flight += 1
+        # Log records written while the job runs carry its ID.
+        correlation_token = correlation_id_var.set(str(job.id))
+        try:
+            async with AsyncSessionLocal() as db_session:
+                # Jobs are standalone queries, so no session context is loaded. The history row is
+                # keyed on the job, so a retry after it was written, but before the job was marked
+                # finished, does not store it again.
+                response = await answer_query(
+                    db_session,
+                    job.query_text,
+                    user_id=job.user_id,
+                    session_id=job.session_id,
+                    timestamp=job.created_at,
+                    new_session=True,
+                    history_id=job.id
+                )
+                await finish_job(db_session, job.id, response.model_dump(mode="json"))
+            self.succeeded += 1
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so this or another process can run it.
+            await asyncio.shield(self._release(job, "Worker stopped before the job finished.", retry=True))
+            raise
+        except HTTPException as e:
+            retry = (e.status_code == 429 or e.status_code >= 500) and job.attempts < self.max_attempts
+            logger.warning(f"Job {job.id} attempt {job.attempts} failed ({e.status_code}: {e.detail}). Retrying: {retry}")
+            await self._release(job, str(e.detail), retry=retry)
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed unexpectedly: {e}")
+            await self._release(job, "An internal server error occurred while processing the job.", retry=False)
+        finally:
+            self.in_flight -= 1
+            correlation_id_var.reset(correlation_token)
+        self._finished(job.id)
+
+    async def _release(self, job: QueryJob, error: str, retry: bool) -> None:
+        try:
+            async with AsyncSessionLocal() as db_session:
+                await fail_job(db_session, job.id, error, retry=retry)
+        except Exception as e:
+            # The job stays running and is claimed again once it is stale.
+            logger.error(f"Could not record the outcome of job {job.id}: {e}")
+            return
+        if retry:
+            self.retried += 1
+        else:
+            self.failed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._tasks),
+            "in_flight": self.in_flight,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+job_workers = JobWorkerPool(
+    workers=settings.JOB_WORKERS,
+    poll_interval=settings.JOB_POLL_INTERVAL,
+    stale_after=settings.JOB_STALE_AFTER,
+    max_attempts=settings.JOB_MAX_ATTEMPTS
+)
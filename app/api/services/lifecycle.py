@@ -0,0 +1,111 @@
+from types import FrameType
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import signal
+import threading
+
+from app.core.config import settings
+from app.db.database import ping_db
+from app.api.services.admission import admission
+from app.api.services.http_client import http_client_ready
+from app.api.services.scheduler import gemini_scheduler, CircuitBreaker
+from app.api.services.history_writer import history_writer
+from app.api.services.jobs import job_workers
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    Tracks whether startup has finished, reports the state of the process's dependencies for /ready,
+    and starts draining when the server is told to stop.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.startup_seconds = 0.0
+        self._exit_requested = False
+        self._server_handlers: Dict[int, Callable[[int, Optional[FrameType]], Any]] = {}
+
+    def mark_started(self, startup_seconds: float) -> None:
+        self.started = True
+        self.startup_seconds = startup_seconds
+
+    def install_signal_handlers(self, delay: float) -> None:
+        """
+        Puts a handler in front of the server's SIGTERM and SIGINT handlers. uvicorn closes its
+        listening sockets and waits for in-flight requests as soon as its handler runs, so the first
+        signal instead makes the process stop admitting queries and fail /ready, and passes the signal
+        on to the server delay seconds later; load balancers see the failing probe in the meantime.
+        A second signal is passed on at once. Signal handlers can only be set from the main thread.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        self._exit_requested = False
+
+        def handle_exit(sig: int, frame: Optional[FrameType]) -> None:
+            server_handler = self._server_handlers[sig]
+            if self._exit_requested:
+                server_handler(sig, frame)
+                return
+            self._exit_requested = True
+            loop.call_soon_threadsafe(self._begin_drain, loop, delay, server_handler, sig, frame)
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            server_handler = signal.getsignal(sig)
+            if callable(server_handler):
+                self._server_handlers[sig] = server_handler
+                signal.signal(sig, handle_exit)
+
+    def _begin_drain(self, loop: asyncio.AbstractEventLoop, delay: float,
+                     server_handler: Callable[[int, Optional[FrameType]], Any], sig: int, frame: Optional[FrameType]) -> None:
+        admission.draining = True
+        logger.info(f"Received {signal.Signals(sig).name}. Draining; the server stops in {delay:.1f}s.")
+        loop.call_later(delay, server_handler, sig, frame)
+
+    def restore_signal_handlers(self) -> None:
+        for sig, server_handler in self._server_handlers.items():
+            signal.signal(sig, server_handler)
+        self._server_handlers = {}
+
+    async def _check_database(self) -> str:
+        try:
+            await asyncio.wait_for(ping_db(), timeout=settings.READY_CHECK_TIMEOUT)
+        except asyncio.TimeoutError:
+            return "timeout"
+        except Exception as e:
+            logger.warning(f"Readiness check could not reach the database: {e}")
+            return "unreachable"
+        return "ok"
+
+    def _check_llm(self) -> str:
+        if not settings.GEMINI_API_KEY:
+            return "not_configured"
+        if not http_client_ready():
+            return "client_closed"
+        if gemini_scheduler.breaker.state == CircuitBreaker.OPEN:
+            return "circuit_open"
+        return "ok"
+
+    async def readiness(self) -> Tuple[bool, Dict[str, str]]:
+        """
+        Returns whether the process should receive traffic, and the status of each check.
+        An open circuit breaker is reported but does not fail readiness: every process shares the
+        upstream, and cached answers and history are still served.
+        """
+        checks = {
+            "lifecycle": "draining" if admission.draining else "ok" if self.started else "starting",
+            "database": await self._check_database(),
+            "llm": self._check_llm(),
+        }
+        if settings.HISTORY_WRITE_BEHIND:
+            checks["history_writer"] = "ok" if history_writer.running else "stopped"
+        if settings.JOBS_ENABLED:
+            checks["job_workers"] = "ok" if job_workers.running else "stopped"
+        ready = all(status in ("ok", "circuit_open") for status in checks.values())
+        return ready, checks
+
+
+lifecycle = Lifecycle()
@@ -1,104 +1,166 @@
 
 from fastapi import HTTPException, status
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Optional, Tuple, TYPE_CHECKING
 import httpx
 import asyncio
-import json
+import orjson
 import logging
+import time
 from app.core.config import settings
+from app.schemas.qna import LLMResponseContent
+from app.api.services.http_client import get_http_client
+from app.api.services.singleflight import llm_singleflight, prompt_key
+from app.api.services.scheduler import gemini_scheduler, parse_retry_after
+from app.api.services.hedging import llm_hedging
+from app.api.services.metrics import stage_timer, record_stage, record_token_usage, UPSTREAM_RESPONSES, UPSTREAM_RETRIES, TIER_REQUESTS, TIER_FALLBACKS
+from app.api.services.tiering import (
+    TRAVEL_DOCUMENTS_TEMPLATE, GENERAL_TEMPLATE, LIGHT_TEMPLATE, FULL_RESPONSE_SCHEMA,
+    Tier, Route, route_query, full_tier, light_tier, full_template,
+)
+
+if TYPE_CHECKING:
+    from app.api.services.session_context import SessionContext
 
 logger = logging.getLogger(__name__)
 
-async def call_gemini_llm(prompt: str) -> Dict[str, Any]:
-   
+NO_CLEAR_RESPONSE = "The AI did not provide a clear response."
+UNEXPECTED_RESPONSE_FORMAT = "The AI provided an unexpected response format."
+
+HEADERS = {
+    "Content-Type": "application/json"
+}
+
+
+def model_url(model: str) -> str:
+    return f"{settings.GEMINI_API_BASE_URL}/models/{model}"
+
+
+def _is_upstream_failure(status_code: int) -> bool:
+    """
+    Rate limiting and server errors count against the circuit breaker and are retried.
+    """
+    return status_code == 429 or status_code >= 500
+
+
+def _ensure_api_key() -> None:
     if not settings.GEMINI_API_KEY:
         logger.error("Attempted to call LLM without API key.")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="LLM API key is not configured.")
 
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={settings.GEMINI_API_KEY}"
-    chat_history = []
-    chat_history.append({ "role": "user", "parts": [{ "text": prompt }] })
 
-    response_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "required_visa_documentation": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"}
-            },
-            "passport_requirements": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"}
-            },
-            "additional_necessary_documents": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"}
-            },
-            "relevant_travel_advisories": {
-                "type": "ARRAY",
-                "items": {"type": "STRING"}
-            },
-            "general_response": {
-                "type": "STRING"
-            }
-        }
-    }
+def build_gemini_payload(
+    prompt: str,
+    response_schema: Optional[Dict[str, Any]] = None,
+    context: Optional["SessionContext"] = None
+) -> Dict[str, Any]:
+    """
+    Builds the generateContent request body for a prompt.
+    With session context, earlier turns precede the prompt and the summary of older turns is the system instruction.
+    """
+    chat_history = list(context.contents) if context is not None else []
+    chat_history.append({ "role": "user", "parts": [{ "text": prompt }] })
 
     payload = {
         "contents": chat_history,
         "generationConfig": {
             "responseMimeType": "application/json",
-            "responseSchema": response_schema
+            "responseSchema": response_schema or FULL_RESPONSE_SCHEMA
         }
     }
+    if context is not None and context.summary:
+        payload["systemInstruction"] = {"parts": [{"text": context.summary}]}
+    return payload
 
-    headers = {
-        "Content-Type": "application/json"
-    }
 
-    max_retries = 5
-    base_delay = 1
+async def call_gemini_llm(prompt: str, tier: Optional[Tier] = None, context: Optional["SessionContext"] = None) -> Dict[str, Any]:
+   
+    _ensure_api_key()
+
+    tier = tier or full_tier()
+    api_url = f"{model_url(tier.model)}:generateContent?key={settings.GEMINI_API_KEY}"
+    body = orjson.dumps(build_gemini_payload(prompt, tier.response_schema, context))
+    headers = HEADERS
+
+    max_retries = settings.LLM_MAX_RETRIES
+
+    client = get_http_client()
+
+    async def post(sent: asyncio.Event) -> Tuple[httpx.Response, float]:
+        async with gemini_scheduler.slot():
+            sent.set()
+            started = time.perf_counter()
+            response = await client.post(api_url, headers=headers, content=body)
+            return response, time.perf_counter() - started
 
     for attempt in range(max_retries):
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(api_url, headers=headers, json=payload)
-                response.raise_for_status()
+            # Slow calls may be hedged with a second identical request; see app/api/services/hedging.py.
+            # Only the request whose response is used is timed, not a cancelled hedge or primary.
+            response, elapsed = await llm_hedging.send(
+                tier.model, post,
+                is_failure=lambda hedged: _is_upstream_failure(hedged[0].status_code),
+                latency=lambda hedged: hedged[1],
+                has_capacity=gemini_scheduler.has_capacity
+            )
+            record_stage("llm_request", elapsed)
+            UPSTREAM_RESPONSES.inc(str(response.status_code))
+            if _is_upstream_failure(response.status_code):
+                gemini_scheduler.breaker.record_failure()
+            else:
+                gemini_scheduler.breaker.record_success()
+            response.raise_for_status()
 
-            result = response.json()
+            with stage_timer("decode"):
+                result = orjson.loads(response.content)
+            record_token_usage(result.get("usageMetadata"))
             if result.get("candidates") and result["candidates"][0].get("content") and result["candidates"][0]["content"].get("parts"):
                 llm_text_response = result["candidates"][0]["content"]["parts"][0].get("text")
                 if llm_text_response:
                     try:
-                        parsed_json = json.loads(llm_text_response)
+                        with stage_timer("decode"):
+                            parsed_json = orjson.loads(llm_text_response)
                         return parsed_json
-                    except json.JSONDecodeError:
+                    except orjson.JSONDecodeError:
                         logger.warning(f"LLM response was not valid JSON: {llm_text_response}")
                         return {"general_response": llm_text_response}
                 else:
                     logger.warning("LLM response content part is empty.")
-                    return {"general_response": "The AI did not provide a clear response."}
+                    return {"general_response": NO_CLEAR_RESPONSE}
             else:
                 logger.warning(f"Unexpected LLM response structure: {result}")
-                return {"general_response": "The AI provided an unexpected response format."}
+                return {"general_response": UNEXPECTED_RESPONSE_FORMAT}
 
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error calling Gemini API (status: {e.response.status_code}): {e.response.text}")
-            if e.response.status_code == 429:
-                delay = base_delay * (2 ** attempt)
-                logger.info(f"Rate limited. Retrying in {delay:.2f} seconds...")
-                await asyncio.sleep(delay)
+            if _is_upstream_failure(e.response.status_code) and attempt < max_retries - 1:
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                delay = gemini_scheduler.backoff_delay(attempt, retry_after)
+                if e.response.status_code == 429:
+                    gemini_scheduler.pause(delay)
+                    UPSTREAM_RETRIES.inc("rate_limited")
+                    logger.info(f"Rate limited. Retrying in {delay:.2f} seconds...")
+                else:
+                    UPSTREAM_RETRIES.inc("server_error")
+                    logger.info(f"Upstream error. Retrying in {delay:.2f} seconds...")
+                with stage_timer("retry_sleep"):
+                    await asyncio.sleep(delay)
             else:
                 raise HTTPException(status_code=e.response.status_code, detail=f"LLM API error: {e.response.text}")
         except httpx.RequestError as e:
+            gemini_scheduler.breaker.record_failure()
+            UPSTREAM_RESPONSES.inc("network_error")
             logger.error(f"Network error calling Gemini API: {e}")
             if attempt < max_retries - 1:
-                delay = base_delay * (2 ** attempt)
+                delay = gemini_scheduler.backoff_delay(attempt)
+                UPSTREAM_RETRIES.inc("network_error")
                 logger.info(f"Network error. Retrying in {delay:.2f} seconds...")
-                await asyncio.sleep(delay)
+                with stage_timer("retry_sleep"):
+                    await asyncio.sleep(delay)
             else:
                 raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not connect to LLM service.")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"An unexpected error occurred during LLM call: {e}")
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An internal server error occurred.")
@@ -106,11 +168,197 @@ async def call_gemini_llm(prompt: str) -> Dict[str, Any]:
     raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get response from LLM after multiple retries.")
 
 
-def construct_llm_prompt(query: str) -> str:
+async def stream_gemini_llm(prompt: str, tier: Optional[Tier] = None, context: Optional["SessionContext"] = None) -> AsyncIterator[str]:
+    """
+    Calls streamGenerateContent and yields the response text as it arrives.
+    Rate-limit and network errors are retried only until the first chunk is received.
+    """
+    _ensure_api_key()
+
+    tier = tier or full_tier()
+    api_url = f"{model_url(tier.model)}:streamGenerateContent?alt=sse&key={settings.GEMINI_API_KEY}"
+    body = orjson.dumps(build_gemini_payload(prompt, tier.response_schema, context))
+    client = get_http_client()
+    max_retries = settings.LLM_MAX_RETRIES
+    started = False
+    usage_metadata = None
+
+    for attempt in range(max_retries):
+        try:
+            async with gemini_scheduler.slot():
+                async with client.stream("POST", api_url, headers=HEADERS, content=body) as response:
+                    UPSTREAM_RESPONSES.inc(str(response.status_code))
+                    if response.status_code >= 400:
+                        error_body = (await response.aread()).decode("utf-8", errors="replace")
+                        logger.error(f"HTTP error opening Gemini stream (status: {response.status_code}): {error_body}")
+                        if not _is_upstream_failure(response.status_code):
+                            raise HTTPException(status_code=response.status_code, detail=f"LLM API error: {error_body}")
+                        gemini_scheduler.breaker.record_failure()
+                        if attempt == max_retries - 1:
+                            raise HTTPException(status_code=response.status_code, detail=f"LLM API error: {error_body}")
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        delay = gemini_scheduler.backoff_delay(attempt, retry_after)
+                        if response.status_code == 429:
+                            gemini_scheduler.pause(delay)
+                        UPSTREAM_RETRIES.inc("rate_limited" if response.status_code == 429 else "server_error")
+                    else:
+                        gemini_scheduler.breaker.record_success()
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if not data:
+                                continue
+                            try:
+                                chunk = orjson.loads(data)
+                            except orjson.JSONDecodeError:
+                                logger.warning(f"Skipping malformed stream chunk: {data}")
+                                continue
+                            # Each chunk carries the running usage; the last one holds the totals.
+                            usage_metadata = chunk.get("usageMetadata") or usage_metadata
+                            candidates = chunk.get("candidates") or []
+                            if not candidates:
+                                continue
+                            parts = (candidates[0].get("content") or {}).get("parts") or []
+                            for part in parts:
+                                text = part.get("text")
+                                if text:
+                                    started = True
+                                    yield text
+                        record_token_usage(usage_metadata)
+                        return
+
+        except httpx.RequestError as e:
+            gemini_scheduler.breaker.record_failure()
+            UPSTREAM_RESPONSES.inc("network_error")
+            logger.error(f"Network error calling Gemini stream API: {e}")
+            if attempt == max_retries - 1 or started:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not connect to LLM service.")
+            delay = gemini_scheduler.backoff_delay(attempt)
+            UPSTREAM_RETRIES.inc("network_error")
+
+        logger.info(f"Stream could not be opened. Retrying in {delay:.2f} seconds...")
+        with stage_timer("retry_sleep"):
+            await asyncio.sleep(delay)
+
+    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get response from LLM after multiple retries.")
+
+
+def render_llm_response(structured_data: LLMResponseContent) -> str:
+    """
+    Renders the structured LLM response as Markdown.
+    """
+    response_parts = []
+    if structured_data.required_visa_documentation:
+        response_parts.append("**Required Visa Documentation:**\n" + "\n".join(f"- {doc}" for doc in structured_data.required_visa_documentation))
+    if structured_data.passport_requirements:
+        response_parts.append("**Passport Requirements:**\n" + "\n".join(f"- {req}" for req in structured_data.passport_requirements))
+    if structured_data.additional_necessary_documents:
+        response_parts.append("**Additional Necessary Documents:**\n" + "\n".join(f"- {doc}" for doc in structured_data.additional_necessary_documents))
+    if structured_data.relevant_travel_advisories:
+        response_parts.append("**Relevant Travel Advisories:**\n" + "\n".join(f"- {adv}" for adv in structured_data.relevant_travel_advisories))
+    if structured_data.general_response:
+        response_parts.append(structured_data.general_response)
+
+    return "\n\n".join(response_parts) if response_parts else structured_data.general_response or "No specific information found."
+
+
+def warm_up_prompts() -> None:
+    """
+    Builds and serializes a request body for every prompt template and tier, and validates, renders and
+    serializes a sample answer, so the first query does not pay for lazy setup on these paths.
+    """
+    query = "What documents do I need to travel to Japan?"
+    for template, tier in ((TRAVEL_DOCUMENTS_TEMPLATE, full_tier()), (GENERAL_TEMPLATE, full_tier()), (LIGHT_TEMPLATE, light_tier())):
+        orjson.dumps(build_gemini_payload(construct_llm_prompt(query, template), tier.response_schema))
+    sample = LLMResponseContent.model_validate({field: ["-"] if field != "general_response" else "-"
+                                                for field in LLMResponseContent.model_fields})
+    render_llm_response(sample)
+    sample.model_dump_json()
+
+
+async def call_gemini_llm_coalesced(prompt: str, tier: Optional[Tier] = None, context: Optional["SessionContext"] = None) -> Dict[str, Any]:
+    """
+    Calls the LLM through the single-flight layer so concurrent identical prompts share one upstream call.
+    Prompts with session context are specific to their session and are never coalesced.
+    """
+    tier = tier or full_tier()
+    if not settings.LLM_SINGLEFLIGHT_ENABLED or context is not None:
+        return await call_gemini_llm(prompt, tier, context)
+    return await llm_singleflight.do(prompt_key(f"{tier.model}\n{prompt}"), lambda: call_gemini_llm(prompt, tier))
+
+
+def _is_empty_answer(llm_raw_response: Dict[str, Any]) -> bool:
+    general_response = llm_raw_response.get("general_response") if llm_raw_response else None
+    if not isinstance(general_response, str) or not general_response.strip():
+        return True
+    return general_response in (NO_CLEAR_RESPONSE, UNEXPECTED_RESPONSE_FORMAT)
+
+
+async def call_routed_llm(query: str, route: Optional[Route] = None, context: Optional["SessionContext"] = None) -> Dict[str, Any]:
+    """
+    Answers the query on the tier chosen by the router, with the session context if there is one.
+    A light-tier failure or empty answer is retried once on the full tier.
+    """
+    route = route or route_query(query)
+    TIER_REQUESTS.inc(route.tier.name, route.reason)
+    with stage_timer("prompt"):
+        prompt = construct_llm_prompt(query, route.template)
+    if route.template != LIGHT_TEMPLATE:
+        return await call_gemini_llm_coalesced(prompt, route.tier, context)
+
+    try:
+        llm_raw_response = await call_gemini_llm_coalesced(prompt, route.tier, context)
+        if not _is_empty_answer(llm_raw_response):
+            return llm_raw_response
+        TIER_FALLBACKS.inc("empty_answer")
+        logger.info("Light tier returned an empty answer, falling back to the full tier.")
+    except HTTPException as e:
+        TIER_FALLBACKS.inc("error")
+        logger.warning(f"Light tier failed ({e.status_code}: {e.detail}), falling back to the full tier.")
+
+    with stage_timer("prompt"):
+        prompt = construct_llm_prompt(query, full_template(query))
+    return await call_gemini_llm_coalesced(prompt, full_tier(), context)
+
+
+def parse_llm_response(llm_raw_response: Dict[str, Any]) -> Tuple[Optional[LLMResponseContent], str]:
+    """
+    Validates the raw LLM JSON into LLMResponseContent and renders it as Markdown.
+    Returns the structured data (None if it could not be parsed) and the response text.
+    """
+    if not llm_raw_response:
+        return None, "The AI did not provide a response."
+
+    try:
+        with stage_timer("validate"):
+            structured_data = LLMResponseContent.model_validate(llm_raw_response)
+        with stage_timer("render"):
+            return structured_data, render_llm_response(structured_data)
+    except Exception as e:
+        logger.warning(f"Failed to parse LLM raw response into structured data model: {e}. Raw response: {llm_raw_response}")
+        return None, llm_raw_response.get("general_response", "The AI provided an unstructured or unparseable response.")
+
+
+def select_prompt_template(query: str) -> str:
+    """
+    Returns the name of the prompt template used for the query.
+    """
+    return route_query(query).template
+
+
+def construct_llm_prompt(query: str, template: Optional[str] = None) -> str:
     """
     Constructs the prompt for the LLM based on the user's query.
     """
-    if "travel" in query.lower() and ("documents" in query.lower() or "visa" in query.lower()):
+    template = template or select_prompt_template(query)
+    if template == LIGHT_TEMPLATE:
+        return f"""
+        You are a concise and helpful AI assistant.
+        Answer the following question in a few sentences: "{query}".
+        Respond with a JSON object whose only key is "general_response".
+        """
+    if template == TRAVEL_DOCUMENTS_TEMPLATE:
         return f"""
         You are a concise and expert travel assistant. The user is asking about travel documentation.
         Please provide a comprehensive and well-formatted response for the query: "{query}".
@@ -0,0 +1,290 @@
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import bisect
+import logging
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (non-cumulative, last is +Inf), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        series = self._values.get(labelvalues)
+        if series is None:
+            series = ([0] * (len(self.buckets) + 1), [0.0])
+            self._values[labelvalues] = series
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackGauge:
+    """
+    Gauge whose samples are read from a callback at scrape time.
+    The callback returns {label values tuple: value}.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], callback: Callable[[], Dict[LabelValues, float]], kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            samples = self.callback()
+        except Exception as e:
+            logger.warning(f"Metrics callback for {self.name} failed: {e}")
+            return lines
+        for labelvalues, value in samples.items():
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name: str, documentation: str, labelnames: Sequence[str], callback: Callable[[], Dict[LabelValues, float]], kind: str = "gauge") -> CallbackGauge:
+        return self.register(CallbackGauge(name, documentation, labelnames, callback, kind))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "qna_stage_duration_seconds", "Time spent in each stage of answering a query.", ["stage"])
+UPSTREAM_RESPONSES = registry.counter(
+    "llm_upstream_responses_total", "Responses from the LLM API by status code.", ["status"])
+UPSTREAM_RETRIES = registry.counter(
+    "llm_upstream_retries_total", "Retried LLM API calls by reason.", ["reason"])
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "Tokens reported in the LLM API usageMetadata.", ["kind"])
+TIER_REQUESTS = registry.counter(
+    "llm_tier_requests_total", "Queries routed to each model tier.", ["tier", "reason"])
+TIER_FALLBACKS = registry.counter(
+    "llm_tier_fallbacks_total", "Light-tier answers retried on the full tier.", ["reason"])
+LLM_HEDGES = registry.counter(
+    "llm_hedged_requests_total", "Outcomes of LLM calls that ran past the hedge threshold.", ["outcome"])
+LLM_HEDGE_SAVED_SECONDS = registry.counter(
+    "llm_hedge_latency_saved_seconds_total", "Estimated latency saved by hedged LLM calls that won.")
+SESSION_CONTEXT_TOKENS = registry.histogram(
+    "session_context_tokens", "Estimated tokens of session context sent with a query.", ["part"],
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000))
+
+_server_timing: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("server_timing", default=None)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """
+    Records the duration of a stage in the stage histogram and, when enabled for the
+    current request, in its Server-Timing header. Does nothing when metrics are disabled.
+    """
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_stage(stage: str, elapsed: float) -> None:
+    """
+    Records a stage duration measured by the caller, as stage_timer does.
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    STAGE_DURATION.observe(elapsed, stage)
+    timings = _server_timing.get()
+    if timings is not None:
+        timings.append((stage, elapsed))
+
+
+def record_token_usage(usage_metadata: Optional[Dict[str, int]]) -> None:
+    """
+    Adds the token counts from a Gemini usageMetadata block to the token counter.
+    """
+    if not usage_metadata:
+        return
+    for field, kind in (("promptTokenCount", "prompt"), ("candidatesTokenCount", "completion"), ("totalTokenCount", "total")):
+        if usage_metadata.get(field):
+            LLM_TOKENS.inc(kind, amount=usage_metadata[field])
+
+
+def start_server_timing() -> List[Tuple[str, float]]:
+    """
+    Starts collecting stage timings for the current request.
+    """
+    timings: List[Tuple[str, float]] = []
+    _server_timing.set(timings)
+    return timings
+
+
+def format_server_timing(timings: List[Tuple[str, float]]) -> str:
+    """
+    Formats collected timings as a Server-Timing header value (durations in milliseconds).
+    Repeated stages, such as retries, are summed.
+    """
+    totals: Dict[str, float] = {}
+    for stage, elapsed in timings:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in totals.items())
+
+
+def register_default_collectors() -> None:
+    """
+    Exposes the counters kept by the cache, single-flight, scheduler, admission control, history writer, job workers, DB pool and logging.
+    Called once at app setup; the imports are local so any of those modules can import this one.
+    """
+    from app.api.services.cache import get_cache_stats
+    from app.api.services.singleflight import llm_singleflight
+    from app.api.services.scheduler import gemini_scheduler
+    from app.api.services.history_writer import history_writer
+    from app.api.services.jobs import job_workers
+    from app.api.services.admission import admission
+    from app.db.database import get_pool_stats
+    from app.core.logging_config import dropped as log_dropped
+
+    def cache_counters():
+        stats = get_cache_stats()
+        return {(tier, result): stats[tier][key] for tier in stats for key, result in (("hits", "hit"), ("misses", "miss"))}
+
+    def cache_evictions():
+        memory = get_cache_stats()["memory"]
+        return {("evicted",): memory["evictions"], ("expired",): memory["expirations"]}
+
+    def cache_size():
+        memory = get_cache_stats()["memory"]
+        return {("entries",): memory["entries"], ("bytes",): memory["bytes"]}
+
+    def coalescing():
+        stats = llm_singleflight.stats()
+        return {("executed",): stats["executions"], ("collapsed",): stats["collapsed"], ("abandoned",): stats["abandoned"]}
+
+    def scheduler_gauges():
+        stats = gemini_scheduler.stats()
+        return {("waiting",): stats["waiting"], ("in_flight",): stats["in_flight"]}
+
+    def breaker_state():
+        state = gemini_scheduler.breaker.state
+        return {(name,): 1 if name == state else 0 for name in ("closed", "open", "half_open")}
+
+    def history_writer_gauges():
+        stats = history_writer.stats()
+        return {(key,): value for key, value in stats.items()}
+
+    def admission_gauges():
+        return {("in_flight",): admission.in_flight, ("queue_depth",): admission.waiting}
+
+    def admission_shed():
+        return {(reason,): count for reason, count in admission.shed.items()}
+
+    def job_worker_gauges():
+        return {(key,): value for key, value in job_workers.stats().items()}
+
+    def pool_gauges():
+        stats = get_pool_stats()
+        return {(key,): value for key, value in stats.items() if key != "pooled"}
+
+    registry.gauge_callback("response_cache_lookups_total", "Response cache lookups by tier and result.", ["tier", "result"], cache_counters, kind="counter")
+    registry.gauge_callback("response_cache_removals_total", "Entries removed from the in-process response cache.", ["reason"], cache_evictions, kind="counter")
+    registry.gauge_callback("response_cache_size", "Size of the in-process response cache.", ["unit"], cache_size)
+    registry.gauge_callback("llm_coalesced_calls_total", "LLM calls by single-flight outcome.", ["outcome"], coalescing, kind="counter")
+    registry.gauge_callback("llm_scheduler_calls", "LLM calls waiting for or holding a scheduler slot.", ["state"], scheduler_gauges)
+    registry.gauge_callback("llm_scheduler_queue_wait_seconds_max", "Longest time a call has waited for a scheduler slot.", [],
+                            lambda: {(): gemini_scheduler.queue_wait_max})
+    registry.gauge_callback("llm_circuit_breaker_state", "1 for the current circuit breaker state.", ["state"], breaker_state)
+    registry.gauge_callback("history_writer", "Write-behind history writer counters and queue depth.", ["metric"], history_writer_gauges)
+    registry.gauge_callback("admission_requests", "Queries being worked on or waiting for an admission slot.", ["state"], admission_gauges)
+    registry.gauge_callback("admission_shed_total", "Queries rejected by admission control, by reason.", ["reason"], admission_shed, kind="counter")
+    registry.gauge_callback("job_workers", "Job worker pool size, in-flight jobs and job outcomes.", ["metric"], job_worker_gauges)
+    registry.gauge_callback("db_pool_connections", "Database connection pool state.", ["state"], pool_gauges)
+    registry.gauge_callback("log_records_dropped_total", "Log records not written, by reason.", ["reason"],
+                            lambda: {(reason,): count for reason, count in log_dropped.items()}, kind="counter")
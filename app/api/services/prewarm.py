@@ -0,0 +1,166 @@
+"""
+Pre-warms the response cache with fresh answers to the most frequent recent queries.
+
+    python -m app.api.services.prewarm --top-k 200
+    python -m app.api.services.prewarm --loop    # refresh every PREWARM_INTERVAL_SECONDS
+
+Queries asked in the last PREWARM_WINDOW_DAYS are clustered by response cache key (normalized text
+and prompt template), so spellings the API would serve from one entry count together. Clusters are
+ranked by how often they were asked, halved for every PREWARM_RECENCY_HALF_LIFE_HOURS since they were
+last asked. The top K are answered again through the LLM under a rate limit and written to the
+persistent cache tier with PREWARM_TTL_SECONDS, marked as pre-warmed. API processes load pre-warmed
+entries into memory at startup, so the most common questions are served from the first request.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+import argparse
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.crud.query import get_frequent_queries
+from app.db import database
+from app.api.services.cache import make_cache_key, store_cached_response
+from app.api.services.http_client import init_http_client, close_http_client
+from app.api.services.llm import call_routed_llm, parse_llm_response
+from app.api.services.scheduler import TokenBucket
+from app.api.services.tiering import route_query
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HotQuery:
+    """
+    A cluster of query texts that share a response cache entry.
+    """
+    cache_key: str
+    template: str
+    # The most frequent spelling in the cluster; it is the one sent to the LLM.
+    query_text: str
+    asked: int
+    last_asked: datetime
+    score: float
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite returns naive timestamps; they are stored in UTC.
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def rank_hot_queries(rows: List[Any], now: datetime, top_k: int, half_life_hours: float) -> List[HotQuery]:
+    """
+    Clusters (query_text, asked, last_asked) rows by cache key and returns the top_k clusters by score.
+    Rows come most asked first, so each cluster keeps its most frequent spelling.
+    """
+    clusters: Dict[str, HotQuery] = {}
+    for row in rows:
+        route = route_query(row.query_text)
+        key = make_cache_key(row.query_text, route.template)
+        last_asked = _aware(row.last_asked)
+        age_hours = max(0.0, (now - last_asked).total_seconds() / 3600)
+        score = row.asked * 0.5 ** (age_hours / half_life_hours)
+
+        cluster = clusters.get(key)
+        if cluster is None:
+            clusters[key] = HotQuery(key, route.template, row.query_text, row.asked, last_asked, score)
+            continue
+        cluster.asked += row.asked
+        cluster.score += score
+        cluster.last_asked = max(cluster.last_asked, last_asked)
+
+    return sorted(clusters.values(), key=lambda cluster: cluster.score, reverse=True)[:top_k]
+
+
+async def find_hot_queries(top_k: int, window_days: int) -> List[HotQuery]:
+    now = datetime.now(timezone.utc)
+    async with database.AsyncSessionLocal() as db_session:
+        rows = await get_frequent_queries(db_session, since=now - timedelta(days=window_days),
+                                          limit=settings.PREWARM_SCAN_LIMIT)
+    return rank_hot_queries(rows, now, top_k, settings.PREWARM_RECENCY_HALF_LIFE_HOURS)
+
+
+async def prewarm_cache(
+    top_k: Optional[int] = None,
+    window_days: Optional[int] = None,
+    rate: Optional[float] = None,
+    concurrency: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    Answers the hottest queries again and stores them as pre-warmed cache entries.
+    Returns how many were refreshed and how many failed.
+    """
+    top_k = top_k or settings.PREWARM_TOP_K
+    window_days = window_days or settings.PREWARM_WINDOW_DAYS
+    bucket = TokenBucket(rate=rate or settings.PREWARM_RATE_PER_SECOND, capacity=1)
+    semaphore = asyncio.Semaphore(concurrency or settings.PREWARM_CONCURRENCY)
+    outcome = {"refreshed": 0, "failed": 0}
+
+    hot = await find_hot_queries(top_k, window_days)
+    logger.info(f"Pre-warming {len(hot)} queries from the last {window_days} days of history.")
+
+    async def warm(entry: HotQuery) -> None:
+        async with semaphore:
+            await bucket.acquire()
+            try:
+                llm_raw_response = await call_routed_llm(entry.query_text, route_query(entry.query_text))
+            except HTTPException as e:
+                logger.warning(f"Could not pre-warm {entry.cache_key} ({e.status_code}: {e.detail})")
+                outcome["failed"] += 1
+                return
+            structured_data, _ = parse_llm_response(llm_raw_response)
+            if structured_data is None:
+                logger.warning(f"Could not pre-warm {entry.cache_key}: the answer had no structured data.")
+                outcome["failed"] += 1
+                return
+            async with database.AsyncSessionLocal() as db_session:
+                await store_cached_response(db_session, entry.cache_key, entry.query_text, entry.template,
+                                            structured_data, ttl_seconds=settings.PREWARM_TTL_SECONDS, prewarmed=True)
+            outcome["refreshed"] += 1
+
+    await asyncio.gather(*(warm(entry) for entry in hot))
+    logger.info(f"Pre-warmed {outcome['refreshed']} queries; {outcome['failed']} failed.")
+    return outcome
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Pre-warm the response cache from query history.")
+    parser.add_argument("--top-k", type=int, default=settings.PREWARM_TOP_K)
+    parser.add_argument("--window-days", type=int, default=settings.PREWARM_WINDOW_DAYS)
+    parser.add_argument("--rate", type=float, default=settings.PREWARM_RATE_PER_SECOND, help="Upstream calls per second.")
+    parser.add_argument("--concurrency", type=int, default=settings.PREWARM_CONCURRENCY)
+    parser.add_argument("--loop", action="store_true", help="Keep running, refreshing every --interval seconds.")
+    parser.add_argument("--interval", type=float, default=settings.PREWARM_INTERVAL_SECONDS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if not (settings.RESPONSE_CACHE_ENABLED and settings.RESPONSE_CACHE_PERSISTENT):
+        parser.exit(1, "Pre-warming needs RESPONSE_CACHE_ENABLED and RESPONSE_CACHE_PERSISTENT.\n")
+    if args.loop and args.interval >= settings.PREWARM_TTL_SECONDS:
+        logger.warning(f"--interval {args.interval}s is not shorter than PREWARM_TTL_SECONDS; "
+                       f"pre-warmed answers will expire between runs.")
+
+    async def run() -> None:
+        await init_http_client()
+        try:
+            while True:
+                try:
+                    await prewarm_cache(args.top_k, args.window_days, args.rate, args.concurrency)
+                except Exception as e:
+                    if not args.loop:
+                        raise
+                    logger.error(f"Pre-warm run failed: {e}")
+                if not args.loop:
+                    break
+                await asyncio.sleep(args.interval)
+        finally:
+            await close_http_client()
+            await database.engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
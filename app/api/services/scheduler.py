@@ -0,0 +1,257 @@
+
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from fastapi import HTTPException, status
+from typing import AsyncIterator, Dict, Any, Optional
+import asyncio
+import logging
+import random
+import time
+
+from app.core.config import settings
+from app.api.services.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # The lock makes waiters take tokens in arrival order.
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures and rejects calls for
+    `reset_timeout` seconds. After that a single probe call is let through (half-open);
+    its outcome closes the breaker again or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and self.retry_after() <= 0:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN:
+            # A probe that never reported back (e.g. its caller was cancelled) is replaced after reset_timeout.
+            now = time.monotonic()
+            if not self._probe_in_flight or now - self._probe_started > self.reset_timeout:
+                self._probe_in_flight = True
+                self._probe_started = now
+                return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("LLM circuit breaker closed.")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"LLM circuit breaker opened after {self.consecutive_failures} consecutive failures.")
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a Retry-After header given either in seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class UpstreamScheduler:
+    """
+    Shared gate in front of the LLM API: a circuit breaker, a requests-per-minute token bucket,
+    a bounded number of concurrent calls and a shared cool-down after rate limiting.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        burst: int,
+        max_concurrency: int,
+        queue_timeout: float,
+        backoff_base: float,
+        backoff_max: float,
+        breaker: CircuitBreaker
+    ):
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst) if requests_per_minute > 0 else None
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._paused_until = 0.0
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.timed_out = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def _reject(self, detail: str, retry_after: float) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        )
+
+    async def _wait_for_capacity(self) -> None:
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        await self._semaphore.acquire()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Waits for permission to make one upstream call. Raises 503 if the breaker is open
+        or no slot frees up within the queue timeout.
+        """
+        if not self.breaker.allow():
+            raise self._reject("LLM service is temporarily unavailable. Please retry later.", self.breaker.retry_after())
+
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            with stage_timer("queue_wait"):
+                await asyncio.wait_for(self._wait_for_capacity(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise self._reject("LLM service is busy. Please retry later.", self.queue_timeout)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.queue_wait_total += waited
+        self.queue_wait_max = max(self.queue_wait_max, waited)
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Full-jitter exponential backoff, never shorter than the upstream's Retry-After.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def pause(self, seconds: float) -> None:
+        """
+        Holds back every queued call for `seconds`, so a 429 slows all callers down together
+        instead of each retrying on its own schedule.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def has_capacity(self) -> bool:
+        """
+        Whether a call made now would get a slot without queueing behind other calls.
+        """
+        return self.waiting == 0 and self.in_flight < self.max_concurrency and self._paused_until <= time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "admitted": self.admitted,
+            "timed_out": self.timed_out,
+            "queue_wait_avg_seconds": self.queue_wait_total / self.admitted if self.admitted else 0.0,
+            "queue_wait_max_seconds": self.queue_wait_max,
+            "tokens_available": round(self.bucket.tokens, 2) if self.bucket is not None else None,
+            "paused_for_seconds": max(0.0, self._paused_until - time.monotonic()),
+            "breaker": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.consecutive_failures,
+                "times_opened": self.breaker.times_opened,
+                "rejected": self.breaker.rejected,
+                "retry_after_seconds": self.breaker.retry_after() if self.breaker.state == CircuitBreaker.OPEN else 0.0,
+            },
+        }
+
+
+gemini_scheduler = UpstreamScheduler(
+    requests_per_minute=settings.LLM_RATE_LIMIT_RPM,
+    burst=settings.LLM_RATE_LIMIT_BURST,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+    backoff_base=settings.LLM_BACKOFF_BASE,
+    backoff_max=settings.LLM_BACKOFF_MAX,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.LLM_BREAKER_RESET_TIMEOUT
+    )
+)
@@ -0,0 +1,155 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+import re
+import uuid
+
+from app.core.config import settings
+from app.crud.query import get_recent_session_turns
+from app.api.services.answer_store import history_answer
+from app.api.services.metrics import stage_timer, SESSION_CONTEXT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "Summary of earlier turns in this conversation, oldest first:"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count; Gemini averages about four characters per token on English text.
+    """
+    return len(text) // 4 + 1
+
+
+def _excerpt(text: str, max_chars: int) -> str:
+    text = _WHITESPACE.sub(" ", text).strip()
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+@dataclass(frozen=True)
+class SessionContext:
+    """
+    Earlier turns of a session, as Gemini contents oldest first, and a summary of the turns before them.
+    """
+    contents: List[Dict[str, Any]]
+    summary: Optional[str]
+    turns: int
+    tokens: int
+
+
+@dataclass
+class _Summary:
+    lines: Deque[str] = field(default_factory=deque)
+    tokens: int = 0
+    # (timestamp, id) of the newest turn folded into the summary.
+    covered: Optional[Tuple[datetime, uuid.UUID]] = None
+    text: str = ""
+
+
+class SessionSummaries:
+    """
+    Rolling extractive summaries of the turns that no longer fit in a session's context window,
+    kept per session in an LRU. Each turn is folded in once, as it leaves the window; when the
+    summary outgrows its token budget the oldest lines are dropped.
+    """
+
+    def __init__(self, max_sessions: int, token_budget: int):
+        self.max_sessions = max_sessions
+        self.token_budget = token_budget
+        self._entries: "OrderedDict[str, _Summary]" = OrderedDict()
+        self.folded = 0
+
+    def fold(self, session_id: str, older_turns: List[Any]) -> Optional[str]:
+        """
+        Folds turns (newest first) that are not in the summary yet and returns the summary text.
+        """
+        entry = self._entries.get(session_id)
+        covered = entry.covered if entry is not None else None
+        new_turns = [turn for turn in reversed(older_turns) if covered is None or (turn.timestamp, turn.id) > covered]
+        if entry is None and not new_turns:
+            return None
+        if entry is None:
+            entry = _Summary()
+
+        if new_turns:
+            for turn in new_turns:
+                structured_data, response_text = history_answer(turn.response_text, turn.answer_hash, turn.structured_data)
+                gist = structured_data.general_response if structured_data is not None and structured_data.general_response else response_text
+                line = f"- Q: {_excerpt(turn.query_text, 160)} A: {_excerpt(gist, 240)}"
+                entry.lines.append(line)
+                entry.tokens += estimate_tokens(line)
+            while entry.tokens > self.token_budget and len(entry.lines) > 1:
+                entry.tokens -= estimate_tokens(entry.lines.popleft())
+            entry.covered = (new_turns[-1].timestamp, new_turns[-1].id)
+            entry.text = SUMMARY_HEADER + "\n" + "\n".join(entry.lines)
+            self.folded += len(new_turns)
+
+        self._entries[session_id] = entry
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+        return entry.text
+
+    def stats(self) -> Dict[str, int]:
+        return {"sessions": len(self._entries), "folded_turns": self.folded}
+
+
+session_summaries = SessionSummaries(
+    max_sessions=settings.SESSION_SUMMARY_CACHE_SIZE,
+    token_budget=settings.SESSION_SUMMARY_TOKEN_BUDGET
+)
+
+
+async def load_session_context(db_session: AsyncSession, user_id: str, session_id: str) -> Optional[SessionContext]:
+    """
+    Fetches the latest turns of the session and packs as many as fit in SESSION_CONTEXT_TOKEN_BUDGET,
+    newest first. Older fetched turns go into the session's rolling summary. Returns None for a
+    session without earlier turns, or if they cannot be loaded.
+    """
+    if not settings.SESSION_CONTEXT_ENABLED:
+        return None
+
+    since = datetime.now(timezone.utc) - timedelta(hours=settings.SESSION_CONTEXT_MAX_AGE_HOURS)
+    try:
+        with stage_timer("session_context"):
+            turns = await get_recent_session_turns(
+                db_session, user_id, session_id, limit=settings.SESSION_CONTEXT_MAX_TURNS, since=since
+            )
+    except Exception as e:
+        logger.warning(f"Could not load context for session {session_id}: {e}")
+        await db_session.rollback()
+        return None
+    if not turns:
+        return None
+
+    budget = settings.SESSION_CONTEXT_TOKEN_BUDGET
+    # No single answer may take more than half of the budget.
+    max_answer_chars = budget * 2
+    window: List[List[Dict[str, Any]]] = []
+    used = 0
+    for turn in turns:
+        _, response_text = history_answer(turn.response_text, turn.answer_hash, turn.structured_data)
+        answer = _excerpt(response_text, max_answer_chars)
+        cost = estimate_tokens(turn.query_text) + estimate_tokens(answer)
+        if used + cost > budget:
+            break
+        window.append([
+            {"role": "user", "parts": [{"text": turn.query_text}]},
+            {"role": "model", "parts": [{"text": answer}]},
+        ])
+        used += cost
+
+    summary = session_summaries.fold(session_id, turns[len(window):])
+    summary_tokens = estimate_tokens(summary) if summary else 0
+    SESSION_CONTEXT_TOKENS.observe(used, "turns")
+    SESSION_CONTEXT_TOKENS.observe(summary_tokens, "summary")
+
+    contents = [content for pair in reversed(window) for content in pair]
+    return SessionContext(contents=contents, summary=summary, turns=len(window), tokens=used + summary_tokens)
@@ -0,0 +1,82 @@
+
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key so only one of them runs.
+
+    The shared call runs in its own task, so cancelling any single caller (including the
+    one that started it) does not cancel the call for the others. The task is cancelled
+    only once every caller has gone away. Results and exceptions are delivered to every caller.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.calls = 0
+        self.executions = 0
+        self.collapsed = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        call = self._calls.get(key)
+        if call is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            call = _Call(task)
+            self._calls[key] = call
+            task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+        else:
+            self.collapsed += 1
+            logger.debug(f"Joining in-flight call for key {key[:12]} ({call.waiters} waiting)")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.task.done():
+                raise
+            if call.waiters == 1:
+                self.abandoned += 1
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # Mark the exception as retrieved so a failure nobody waits for is not logged as unhandled.
+            call.task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "executions": self.executions,
+            "collapsed": self.collapsed,
+            "abandoned": self.abandoned,
+        }
+
+
+def prompt_key(prompt: str) -> str:
+    """
+    Hashes a constructed prompt into a compact coalescing key.
+    """
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+llm_singleflight = SingleFlight()
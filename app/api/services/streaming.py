@@ -0,0 +1,76 @@
+
+from typing import Any, Dict, List, Tuple
+import orjson
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    Formats a single server-sent event.
+    """
+    return f"event: {event}\ndata: {orjson.dumps(data, default=str).decode()}\n\n"
+
+
+class StructuredFieldParser:
+    """
+    Incrementally parses a streamed JSON object and reports each top-level field
+    as soon as its value is complete.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._field_start = None
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self._buffer += text
+        fields: List[Tuple[str, Any]] = []
+        buffer = self._buffer
+
+        for i in range(self._pos, len(buffer)):
+            if self.done:
+                break
+            char = buffer[i]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._field_start = i + 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    fields.extend(self._emit(buffer[self._field_start:i]))
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                fields.extend(self._emit(buffer[self._field_start:i]))
+                self._field_start = i + 1
+
+        self._pos = len(buffer)
+        return fields
+
+    def _emit(self, segment: str) -> List[Tuple[str, Any]]:
+        segment = segment.strip()
+        if not segment:
+            return []
+        try:
+            return list(orjson.loads("{" + segment + "}").items())
+        except orjson.JSONDecodeError:
+            logger.warning(f"Could not parse streamed field: {segment[:200]}")
+            return []
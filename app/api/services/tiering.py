@@ -0,0 +1,129 @@
+import re
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TRAVEL_DOCUMENTS_TEMPLATE = "travel_documents"
+GENERAL_TEMPLATE = "general"
+LIGHT_TEMPLATE = "light"
+
+LIGHT_TIER = "light"
+FULL_TIER = "full"
+
+FULL_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "required_visa_documentation": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "passport_requirements": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "additional_necessary_documents": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "relevant_travel_advisories": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "general_response": {
+            "type": "STRING"
+        }
+    }
+}
+
+LIGHT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "general_response": {
+            "type": "STRING"
+        }
+    },
+    "required": ["general_response"]
+}
+
+# Keyword index, compiled once. Any hit means the query may need the structured travel answer.
+_TRAVEL_TERMS = re.compile(
+    r"\b(?:travel\w*|visas?|passports?|documents?|documentation|embassy|embassies|consulates?|"
+    r"immigration|customs|permits?|residency|schengen|transit|entry|border|vaccinations?|"
+    r"yellow fever|advisor(?:y|ies)|itinerar(?:y|ies))\b",
+    re.IGNORECASE,
+)
+_TRAVEL_WORD = re.compile(r"travel", re.IGNORECASE)
+_DOCUMENT_WORDS = re.compile(r"documents|visa", re.IGNORECASE)
+# Phrasing that usually asks for a longer or multi-part answer.
+_COMPLEXITY_TERMS = re.compile(
+    r"\b(?:compare|comparison|difference|differences|versus|vs|explain|why|steps?|step-by-step|"
+    r"list|pros|cons|plan|detailed|analy[sz]e|summari[sz]e|write|code|example|examples)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    model: str
+    response_schema: Dict[str, Any]
+
+
+@dataclass(frozen=True)
+class Route:
+    tier: Tier
+    template: str
+    reason: str
+
+
+def full_tier() -> Tier:
+    return Tier(FULL_TIER, settings.GEMINI_MODEL, FULL_RESPONSE_SCHEMA)
+
+
+def light_tier() -> Tier:
+    return Tier(LIGHT_TIER, settings.LLM_LIGHT_MODEL, LIGHT_RESPONSE_SCHEMA)
+
+
+def full_template(query: str) -> str:
+    """
+    Returns the full-tier prompt template for the query.
+    """
+    if _TRAVEL_WORD.search(query) and _DOCUMENT_WORDS.search(query):
+        return TRAVEL_DOCUMENTS_TEMPLATE
+    return GENERAL_TEMPLATE
+
+
+def complexity_score(query: str) -> int:
+    """
+    Counts signals that the query needs more than a short factual answer.
+    """
+    score = len(_COMPLEXITY_TERMS.findall(query))
+    if query.count("?") > 1:
+        score += 1
+    if query.count(",") + query.count(";") > 2:
+        score += 1
+    if "\n" in query.strip():
+        score += 1
+    return score
+
+
+def route_query(query: str) -> Route:
+    """
+    Picks the tier, prompt template and response schema for a query.
+    Short factual questions without travel keywords go to the light tier; everything else uses the full tier.
+    """
+    template = full_template(query)
+    if not settings.LLM_TIERING_ENABLED:
+        return Route(full_tier(), template, "tiering_disabled")
+    if template == TRAVEL_DOCUMENTS_TEMPLATE:
+        return Route(full_tier(), template, "travel_documents")
+    if _TRAVEL_TERMS.search(query):
+        return Route(full_tier(), template, "travel_keyword")
+    if len(query.split()) > settings.LLM_LIGHT_MAX_WORDS:
+        return Route(full_tier(), template, "length")
+    if complexity_score(query) > 0:
+        return Route(full_tier(), template, "complexity")
+    return Route(light_tier(), LIGHT_TEMPLATE, "short_factual")
@@ -0,0 +1,78 @@
+
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import uuid
+import logging
+
+from app.schemas.qna import QueryRequest, QueryResponse, JobResponse
+from app.crud.jobs import create_job, get_job, FINISHED_JOB_STATUSES, JOB_SUCCEEDED
+from app.db.database import get_db, AsyncSessionLocal
+from app.db.models import QueryJob
+from app.api.services.jobs import job_workers
+from app.api.services.admission import check_user_quota, quota_key
+from app.core.config import settings
+from app.core.responses import model_response
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def job_response(job: QueryJob) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        status=job.status,
+        attempts=job.attempts,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        result=QueryResponse.model_validate(job.result) if job.status == JOB_SUCCEEDED and job.result else None,
+        error=job.error
+    )
+
+@router.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(request_data: QueryRequest, request: Request, db_session: AsyncSession = Depends(get_db)):
+    """
+    Accepts a query for asynchronous processing and returns 202 with the job ID.
+    Poll GET /jobs/{job_id}, optionally with wait, for the result. The answer is stored in the query history as usual.
+    """
+    if not settings.JOBS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job mode is disabled.")
+    if not settings.GEMINI_API_KEY:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="LLM service is not configured. Please set GEMINI_API_KEY.")
+    check_user_quota(quota_key(request_data.user_id, request.client.host if request.client else None))
+
+    job = await create_job(
+        db_session,
+        user_id=request_data.user_id if request_data.user_id else str(uuid.uuid4()),
+        session_id=request_data.session_id if request_data.session_id else str(uuid.uuid4()),
+        query_text=request_data.query
+    )
+    job_workers.notify()
+    logger.info(f"Accepted job {job.id} for user_id: {job.user_id}")
+
+    return model_response(job_response(job), status_code=status.HTTP_202_ACCEPTED,
+                          headers={"Location": f"/api/v1/jobs/{job.id}"})
+
+@router.get("/jobs/{job_id}", response_model=JobResponse, status_code=status.HTTP_200_OK)
+async def get_job_endpoint(
+    job_id: uuid.UUID,
+    wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish before answering."),
+):
+    """
+    Returns the state of a job. With wait, holds the request until the job finishes or the wait runs out.
+    No database connection is held while waiting.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(wait, settings.JOB_MAX_WAIT)
+
+    while True:
+        async with AsyncSessionLocal() as db_session:
+            job = await get_job(db_session, job_id)
+        if job is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+
+        remaining = deadline - loop.time()
+        if job.status in FINISHED_JOB_STATUSES or remaining <= 0:
+            return model_response(job_response(job))
+        await job_workers.wait_for(job_id, timeout=min(remaining, settings.JOB_POLL_INTERVAL))
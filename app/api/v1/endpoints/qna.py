@@ -1,111 +1,441 @@
 
-from fastapi import APIRouter, Depends, status, HTTPException
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from collections import Counter
+import time
+from typing import List, Optional, Dict, Any, AsyncIterator
+import asyncio
+import orjson
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import uuid
 import logging
 
-from app.schemas.qna import QueryRequest, QueryResponse, HistoryItem, QueryHistoryResponse, LLMResponseContent
-from app.crud.query import create_query_history, get_query_history_by_user_id
+from app.schemas.qna import (QueryRequest, QueryResponse, HistoryItem, QueryHistoryResponse, LLMResponseContent,
+                             BatchQueryRequest, BatchQueryResponse, BatchQueryItemResult, BatchQueryError,
+                             HistorySearchHit, HistorySearchResponse)
+from app.crud.query import get_query_history_page, encode_history_cursor, decode_history_cursor, search_query_history
 from app.db.database import get_db
-from app.api.services.llm import call_gemini_llm, construct_llm_prompt
+from app.db.database import AsyncSessionLocal
+from app.api.services.llm import call_routed_llm, stream_gemini_llm, construct_llm_prompt, render_llm_response, parse_llm_response
+from app.api.services.tiering import route_query
+from app.api.services.cache import make_cache_key, get_cached_response, store_cached_response, get_cache_stats
+from app.api.services.streaming import StructuredFieldParser, format_sse
+from app.api.services.singleflight import llm_singleflight
+from app.api.services.scheduler import gemini_scheduler
+from app.api.services.hedging import llm_hedging
+from app.api.services.history_writer import record_query_history, record_query_history_batch
+from app.api.services.history_export import export_history, EXPORT_FORMATS
+from app.api.services.answer import answer_query
+from app.api.services.session_context import load_session_context, session_summaries
+from app.api.services.answer_store import history_answer_fields, history_answer, answer_snippet, answer_renderer
+from app.api.services.admission import admission, admission_priority, check_user_quota, quota_key, PRIORITY_FULL
+from app.api.services.metrics import stage_timer
 from app.core.config import settings
+from app.core.responses import model_response
+from app.core.logging_config import log_preview
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/query", response_model=QueryResponse, status_code=status.HTTP_200_OK)
-async def handle_query(request_data: QueryRequest, db_session: AsyncSession = Depends(get_db)):
+async def handle_query(request_data: QueryRequest, request: Request, db_session: AsyncSession = Depends(get_db)):
     """
     Handles a user's question, sends it to the LLM, and returns the AI-generated response.
     Stores the query and response for history in the database.
+    Over-quota users get 429; when the server is saturated the request waits for a slot or is shed with 503.
     """
-    logger.info(f"Received query: '{request_data.query}' from user_id: '{request_data.user_id}'")
+    logger.info(f"Received query: '{log_preview(request_data.query)}' from user_id: '{request_data.user_id}'")
 
     if not settings.GEMINI_API_KEY:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                             detail="LLM service is not configured. Please set GEMINI_API_KEY.")
 
+    check_user_quota(quota_key(request_data.user_id, request.client.host if request.client else None))
+
     current_user_id = request_data.user_id if request_data.user_id else str(uuid.uuid4())
     session_id = request_data.session_id if request_data.session_id else str(uuid.uuid4())
     timestamp = datetime.now()
 
     try:
-        llm_prompt = construct_llm_prompt(request_data.query)
-        llm_raw_response = await call_gemini_llm(llm_prompt)
+        async with admission.admit(admission_priority(request_data.query)):
+            response = await answer_query(
+                db_session,
+                request_data.query,
+                user_id=current_user_id,
+                session_id=session_id,
+                timestamp=timestamp,
+                new_session=not (request_data.user_id and request_data.session_id)
+            )
+        return model_response(response)
 
-        structured_data: Optional[LLMResponseContent] = None
-        ai_response_text: str = ""
+    except HTTPException as e:
+        logger.error(f"HTTPException during query handling: {e.detail}")
+        raise e
+    except Exception as e:
+        logger.exception(f"An unexpected error occurred during query handling: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="An internal server error occurred while processing your request.")
+
+@router.post("/query/stream", status_code=status.HTTP_200_OK)
+async def handle_query_stream(request_data: QueryRequest, request: Request):
+    """
+    Streaming variant of /query. Sends server-sent events:
+    `delta` for each chunk of generated text, `field` for each structured field as soon as it is complete,
+    `done` with the final QueryResponse once the answer is stored, and `error` if the call fails.
+    """
+    logger.info(f"Received streaming query: '{log_preview(request_data.query)}' from user_id: '{request_data.user_id}'")
+
+    if not settings.GEMINI_API_KEY:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="LLM service is not configured. Please set GEMINI_API_KEY.")
+
+    check_user_quota(quota_key(request_data.user_id, request.client.host if request.client else None))
+    # Admitted before the response starts so a shed request still gets a 503 status.
+    await admission.acquire(admission_priority(request_data.query))
+    admitted_at = time.monotonic()
+    released = False
+
+    def release_slot() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(time.monotonic() - admitted_at)
+
+    current_user_id = request_data.user_id if request_data.user_id else str(uuid.uuid4())
+    session_id = request_data.session_id if request_data.session_id else str(uuid.uuid4())
+    timestamp = datetime.now()
 
-        if llm_raw_response:
+    async def event_stream() -> AsyncIterator[str]:
+        route = route_query(request_data.query)
+        template = route.template
+        cache_key = make_cache_key(request_data.query, template)
+
+        async with AsyncSessionLocal() as db_session:
             try:
-                structured_data = LLMResponseContent(**llm_raw_response)
-                response_parts = []
-                if structured_data.required_visa_documentation:
-                    response_parts.append("**Required Visa Documentation:**\n" + "\n".join(f"- {doc}" for doc in structured_data.required_visa_documentation))
-                if structured_data.passport_requirements:
-                    response_parts.append("**Passport Requirements:**\n" + "\n".join(f"- {req}" for req in structured_data.passport_requirements))
-                if structured_data.additional_necessary_documents:
-                    response_parts.append("**Additional Necessary Documents:**\n" + "\n".join(f"- {doc}" for doc in structured_data.additional_necessary_documents))
-                if structured_data.relevant_travel_advisories:
-                    response_parts.append("**Relevant Travel Advisories:**\n" + "\n".join(f"- {adv}" for adv in structured_data.relevant_travel_advisories))
-                if structured_data.general_response:
-                    response_parts.append(structured_data.general_response)
-
-                ai_response_text = "\n\n".join(response_parts) if response_parts else structured_data.general_response or "No specific information found."
+                # Follow-ups are answered with the session's earlier turns and bypass the response cache.
+                context = None
+                if request_data.user_id and request_data.session_id:
+                    context = await load_session_context(db_session, current_user_id, session_id)
+                structured_data, cache_tier = None, None
+                if context is None:
+                    structured_data, cache_tier = await get_cached_response(db_session, cache_key)
+                cached = structured_data is not None
+
+                if cached:
+                    logger.info(f"Serving streaming query from {cache_tier} response cache for user_id: {current_user_id}")
+                    ai_response_text = render_llm_response(structured_data)
+                    for name, value in structured_data.model_dump(exclude_none=True).items():
+                        yield format_sse("field", {"name": name, "value": value})
+                else:
+                    parser = StructuredFieldParser()
+                    chunks = []
+                    with stage_timer("prompt"):
+                        prompt = construct_llm_prompt(request_data.query, template)
+                    async for text in stream_gemini_llm(prompt, route.tier, context):
+                        chunks.append(text)
+                        yield format_sse("delta", {"text": text})
+                        for name, value in parser.feed(text):
+                            yield format_sse("field", {"name": name, "value": value})
+
+                    full_text = "".join(chunks)
+                    try:
+                        llm_raw_response = orjson.loads(full_text) if full_text else {}
+                    except orjson.JSONDecodeError:
+                        logger.warning(f"Streamed LLM response was not valid JSON: {full_text}")
+                        llm_raw_response = {"general_response": full_text}
+                    structured_data, ai_response_text = parse_llm_response(llm_raw_response)
+
+                    if structured_data is not None and context is None:
+                        await store_cached_response(db_session, cache_key, request_data.query, template, structured_data)
+
+                await record_query_history(
+                    db_session,
+                    user_id=current_user_id,
+                    session_id=session_id,
+                    query_text=request_data.query,
+                    response_text=ai_response_text,
+                    timestamp=timestamp,
+                    structured_data=structured_data
+                )
+                logger.info(f"Streamed query stored in DB for user_id: {current_user_id}, session_id: {session_id}")
 
+                final_response = QueryResponse(
+                    ai_response=ai_response_text,
+                    structured_data=structured_data,
+                    session_id=session_id,
+                    user_id=current_user_id,
+                    timestamp=timestamp,
+                    cached=cached
+                )
+                yield format_sse("done", final_response.model_dump(mode="json"))
+
+            except HTTPException as e:
+                logger.error(f"HTTPException during streaming query handling: {e.detail}")
+                yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
             except Exception as e:
-                logger.warning(f"Failed to parse LLM raw response into structured data model: {e}. Raw response: {llm_raw_response}")
-                ai_response_text = llm_raw_response.get("general_response", "The AI provided an unstructured or unparseable response.")
-                structured_data = None
+                logger.exception(f"An unexpected error occurred during streaming query handling: {e}")
+                await db_session.rollback()
+                yield format_sse("error", {"status_code": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                           "detail": "An internal server error occurred while processing your request."})
+            finally:
+                release_slot()
 
-        else:
-            ai_response_text = "The AI did not provide a response."
+    # The background task frees the slot if the stream never started, e.g. the client went away first.
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_slot)
+    )
 
-        await create_query_history(
-            db_session,
-            user_id=current_user_id,
-            session_id=session_id, # New
-            query_text=request_data.query,
-            response_text=ai_response_text,
-            timestamp=timestamp
-        )
-        logger.info(f"Query stored in DB for user_id: {current_user_id}, session_id: {session_id}")
+@router.post("/query/batch", response_model=BatchQueryResponse, status_code=status.HTTP_200_OK)
+async def handle_query_batch(request_data: BatchQueryRequest, request: Request, db_session: AsyncSession = Depends(get_db)):
+    """
+    Answers a list of queries in one request. Items are answered concurrently, up to BATCH_MAX_CONCURRENCY
+    at a time, and results are returned in request order with a per-item error for items that failed.
+    History for all successful items is stored with a single bulk insert. Items are answered without session context.
+    """
+    logger.info(f"Received batch of {len(request_data.items)} queries")
+
+    if not settings.GEMINI_API_KEY:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="LLM service is not configured. Please set GEMINI_API_KEY.")
+    if len(request_data.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"A batch may contain at most {settings.BATCH_MAX_ITEMS} items.")
+
+    # Each item counts against its user's quota.
+    client_host = request.client.host if request.client else None
+    for key, cost in Counter(quota_key(item.user_id, client_host) for item in request_data.items).items():
+        check_user_quota(key, cost)
+
+    timestamp = datetime.now()
+    items = request_data.items
+    routes = [route_query(item.query) for item in items]
+    cache_keys = [make_cache_key(item.query, route.template) for item, route in zip(items, routes)]
+
+    # The session is not safe for concurrent use, so cache lookups and writes run sequentially
+    # and only the upstream calls are fanned out.
+    cached_answers: List[Optional[LLMResponseContent]] = []
+    for cache_key in cache_keys:
+        cached_answers.append((await get_cached_response(db_session, cache_key))[0])
 
-        return QueryResponse(
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
+    async def answer(index: int):
+        if cached_answers[index] is not None:
+            return cached_answers[index], render_llm_response(cached_answers[index])
+        async with semaphore:
+            llm_raw_response = await call_routed_llm(items[index].query, routes[index])
+        return parse_llm_response(llm_raw_response)
+
+    # The whole fan-out holds one admission slot; BATCH_MAX_CONCURRENCY bounds it from there.
+    async with admission.admit(PRIORITY_FULL):
+        outcomes = await asyncio.gather(*(answer(index) for index in range(len(items))), return_exceptions=True)
+
+    results: List[BatchQueryItemResult] = []
+    history_rows: List[Dict[str, Any]] = []
+    for index, (item, outcome) in enumerate(zip(items, outcomes)):
+        if isinstance(outcome, HTTPException):
+            results.append(BatchQueryItemResult(index=index, error=BatchQueryError(status_code=outcome.status_code, detail=str(outcome.detail))))
+            continue
+        if isinstance(outcome, Exception):
+            logger.error(f"Unexpected error answering batch item {index}: {outcome}")
+            results.append(BatchQueryItemResult(index=index, error=BatchQueryError(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="An internal server error occurred while processing this item.")))
+            continue
+
+        structured_data, ai_response_text = outcome
+        cached = cached_answers[index] is not None
+        if not cached and structured_data is not None:
+            await store_cached_response(db_session, cache_keys[index], item.query, routes[index].template, structured_data)
+
+        current_user_id = item.user_id if item.user_id else str(uuid.uuid4())
+        session_id = item.session_id if item.session_id else str(uuid.uuid4())
+        history_rows.append({
+            "id": uuid.uuid4(),
+            "user_id": current_user_id,
+            "session_id": session_id,
+            "query_text": item.query,
+            "timestamp": timestamp,
+            **history_answer_fields(structured_data, ai_response_text),
+        })
+        results.append(BatchQueryItemResult(index=index, response=QueryResponse(
             ai_response=ai_response_text,
             structured_data=structured_data,
-            session_id=session_id, # New
+            session_id=session_id,
             user_id=current_user_id,
-            timestamp=timestamp
-        )
+            timestamp=timestamp,
+            cached=cached
+        )))
 
-    except HTTPException as e:
-        logger.error(f"HTTPException during query handling: {e.detail}")
-        raise e
+    try:
+        await record_query_history_batch(db_session, history_rows)
     except Exception as e:
-        logger.exception(f"An unexpected error occurred during query handling: {e}")
+        logger.exception(f"Failed to store batch history: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="An internal server error occurred while processing your request.")
+    logger.info(f"Batch answered: {len(history_rows)} succeeded, {len(items) - len(history_rows)} failed")
+
+    return model_response(BatchQueryResponse(results=results))
 
 @router.get("/history/{user_id}", response_model=QueryHistoryResponse, status_code=status.HTTP_200_OK)
-async def get_query_history_endpoint(user_id: str, db_session: AsyncSession = Depends(get_db)):
+async def get_query_history_endpoint(
+    user_id: str,
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of items to return."),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page."),
+    session_id: Optional[str] = Query(None, description="Only return items from this session."),
+    preview: bool = Query(False, description="Return truncated previews of the responses, without structured_data."),
+    db_session: AsyncSession = Depends(get_db)
+):
     """
-    Retrieves the history of queries for a given user ID from the database.
+    Retrieves one page of the query history for a given user ID, newest first.
+    Pass the returned next_cursor to fetch the following page.
     """
     logger.info(f"Retrieving history for user_id: {user_id}")
-    db_history_items = await get_query_history_by_user_id(db_session, user_id)
 
-    formatted_history = [
-        HistoryItem(
+    page_size = min(limit or settings.HISTORY_PAGE_DEFAULT_LIMIT, settings.HISTORY_PAGE_MAX_LIMIT)
+    try:
+        decoded_cursor = decode_history_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    preview_chars = settings.HISTORY_PREVIEW_CHARS if preview else None
+    with stage_timer("db_read"):
+        db_history_items = await get_query_history_page(
+            db_session,
+            user_id,
+            limit=page_size,
+            cursor=decoded_cursor,
+            session_id=session_id,
+            preview_chars=preview_chars
+        )
+
+    has_more = len(db_history_items) > page_size
+    db_history_items = db_history_items[:page_size]
+
+    formatted_history = []
+    for item in db_history_items:
+        truncated = False
+        if preview_chars is None:
+            # Stored answers are rendered here, memoized by content hash.
+            structured_data, response_text = history_answer(item.response_text, item.answer_hash, item.structured_data)
+        else:
+            # Previews come from the database; only answers stored without a preview are rendered.
+            structured_data, response_text = None, item.response_text
+            if response_text is None:
+                _, response_text = history_answer(None, item.answer_hash, item.structured_data)
+            truncated = len(response_text) > preview_chars
+            response_text = response_text[:preview_chars]
+        # Rows come straight from the database, so validation is skipped.
+        formatted_history.append(HistoryItem.model_construct(
+            id=item.id,
             query=item.query_text,
-            ai_response=item.response_text,
+            ai_response=response_text,
+            structured_data=structured_data,
             session_id=item.session_id, # New
             user_id=item.user_id,
-            timestamp=item.timestamp
-        ) for item in db_history_items
+            timestamp=item.timestamp,
+            truncated=truncated
+        ))
+
+    next_cursor = None
+    if has_more:
+        last_item = db_history_items[-1]
+        next_cursor = encode_history_cursor(last_item.timestamp, last_item.id)
+
+    return model_response(QueryHistoryResponse.model_construct(history=formatted_history, user_id=user_id, next_cursor=next_cursor))
+
+@router.get("/export/history", status_code=status.HTTP_200_OK)
+async def export_history_endpoint(
+    user_id: Optional[str] = Query(None, description="Only export this user's history."),
+    start: Optional[datetime] = Query(None, description="Earliest timestamp, inclusive."),
+    end: Optional[datetime] = Query(None, description="Latest timestamp, exclusive."),
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="ndjson or csv."),
+):
+    """
+    Streams query history for a user as NDJSON or CSV, oldest first. Exporting a date range across
+    all users is only allowed with HISTORY_EXPORT_ALL_USERS; the offline export covers it otherwise.
+    """
+    if user_id is None and not settings.HISTORY_EXPORT_ALL_USERS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass user_id to export a user's history.")
+    if user_id is None and (start is None or end is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Pass user_id, or both start and end to export a date range.")
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end.")
+
+    logger.info(f"Exporting history (user_id={user_id}, start={start}, end={end}, format={export_format})")
+    filename = f"history-{user_id or 'range'}.{export_format}"
+    return StreamingResponse(
+        export_history(export_format, user_id=user_id, start=start, end=end),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/history/{user_id}/search", response_model=HistorySearchResponse, status_code=status.HTTP_200_OK)
+async def search_query_history_endpoint(
+    user_id: str,
+    q: str = Query(..., min_length=1, max_length=256, description="Search text. Supports quoted phrases, OR and -exclusions."),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of results to return."),
+    offset: int = Query(0, ge=0, description="next_offset from the previous page."),
+    db_session: AsyncSession = Depends(get_db)
+):
+    """
+    Full-text searches a user's query history, most relevant first, with highlighted snippets.
+    """
+    logger.info(f"Searching history for user_id: {user_id}")
+
+    if offset > settings.HISTORY_SEARCH_MAX_OFFSET:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"offset may be at most {settings.HISTORY_SEARCH_MAX_OFFSET}; refine the search instead.")
+
+    page_size = min(limit or settings.HISTORY_PAGE_DEFAULT_LIMIT, settings.HISTORY_PAGE_MAX_LIMIT)
+    with stage_timer("db_read"):
+        rows = await search_query_history(
+            db_session,
+            user_id,
+            q,
+            limit=page_size,
+            offset=offset,
+            snippet_words=settings.HISTORY_SEARCH_SNIPPET_WORDS
+        )
+
+    has_more = len(rows) > page_size
+    results = [
+        HistorySearchHit.model_construct(
+            id=row.id,
+            query=row.query_highlight,
+            snippet=row.snippet if row.snippet is not None else answer_snippet(row.answer_highlight),
+            session_id=row.session_id,
+            timestamp=row.timestamp,
+            rank=row.rank
+        )
+        for row in rows[:page_size]
     ]
 
-    return QueryHistoryResponse(history=formatted_history, user_id=user_id)
+    return model_response(HistorySearchResponse.model_construct(
+        results=results,
+        user_id=user_id,
+        q=q,
+        next_offset=offset + page_size if has_more else None
+    ))
+
+@router.get("/cache/stats", status_code=status.HTTP_200_OK)
+async def get_cache_stats_endpoint():
+    """
+    Returns hit/miss/eviction counters for the response cache and the stored answer renderer.
+    """
+    return {**get_cache_stats(), "answer_renderer": answer_renderer.stats()}
+
+@router.get("/llm/stats", status_code=status.HTTP_200_OK)
+async def get_llm_stats_endpoint():
+    """
+    Returns counters for upstream LLM calls, including how many were collapsed into an in-flight call.
+    """
+    return {"coalescing": llm_singleflight.stats(), "scheduler": gemini_scheduler.stats(), "admission": admission.stats(),
+            "session_summaries": session_summaries.stats(), "hedging": llm_hedging.stats()}
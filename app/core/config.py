@@ -1,5 +1,6 @@
 
 import os
+from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import logging
@@ -12,9 +13,146 @@ class Settings(BaseSettings):
     """
     model_config = SettingsConfigDict(env_file=".env", extra='ignore')
     GEMINI_API_KEY : str = Field(..., description='Gemini LLM api key')
+    GEMINI_API_BASE_URL: str = Field("https://generativelanguage.googleapis.com/v1beta", description="Base URL of the Gemini API")
+    GEMINI_MODEL: str = Field("gemini-2.5-flash-preview-05-20", description="Gemini model used to answer queries")
     
     DATABASE_URL: str = Field(..., description="Database URL")
 
+    # Shared HTTP client used for Gemini calls
+    LLM_HTTP2: bool = Field(False, description="Use HTTP/2 for Gemini calls (requires the 'h2' package)")
+    LLM_MAX_CONNECTIONS: int = Field(100, description="Maximum number of open connections to the LLM API")
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = Field(20, description="Maximum number of idle keep-alive connections")
+    LLM_KEEPALIVE_EXPIRY: float = Field(30.0, description="Seconds an idle keep-alive connection is kept open")
+    LLM_CONNECT_TIMEOUT: float = Field(5.0, description="Connect timeout in seconds for LLM calls")
+    LLM_READ_TIMEOUT: float = Field(60.0, description="Read timeout in seconds for LLM calls")
+    LLM_WRITE_TIMEOUT: float = Field(10.0, description="Write timeout in seconds for LLM calls")
+    LLM_POOL_TIMEOUT: float = Field(10.0, description="Seconds to wait for a free connection from the pool")
+
+    # Response cache for /api/v1/query
+    RESPONSE_CACHE_ENABLED: bool = Field(True, description="Serve repeated queries from the response cache")
+    RESPONSE_CACHE_TTL_SECONDS: int = Field(3600, description="Seconds a cached response stays fresh")
+    RESPONSE_CACHE_MAX_ENTRIES: int = Field(1024, description="Maximum number of entries in the in-process cache")
+    RESPONSE_CACHE_MAX_BYTES: int = Field(16 * 1024 * 1024, description="Maximum total size in bytes of the in-process cache")
+    RESPONSE_CACHE_PERSISTENT: bool = Field(False, description="Also store responses in the llm_response_cache table")
+
+    # Cache pre-warming from query history (python -m app.api.services.prewarm)
+    PREWARM_TOP_K: int = Field(200, description="Most frequent recent queries answered by each pre-warm run")
+    PREWARM_WINDOW_DAYS: int = Field(7, description="Days of query history ranked by the pre-warm job")
+    PREWARM_SCAN_LIMIT: int = Field(10000, description="Most frequent distinct query texts read from history before clustering")
+    PREWARM_RECENCY_HALF_LIFE_HOURS: float = Field(24.0, description="A query's count is halved for every this many hours since it was last asked")
+    PREWARM_RATE_PER_SECOND: float = Field(1.0, description="Upstream calls per second made by the pre-warm job")
+    PREWARM_CONCURRENCY: int = Field(4, description="Upstream calls the pre-warm job has in flight at once")
+    PREWARM_TTL_SECONDS: int = Field(7200, description="Seconds a pre-warmed answer stays fresh; refresh more often than this")
+    PREWARM_INTERVAL_SECONDS: float = Field(3600.0, description="Seconds between runs of the pre-warm job with --loop")
+    PREWARM_STARTUP_ENTRIES: int = Field(256, description="Pre-warmed answers loaded into the in-process cache at startup; 0 to disable")
+
+    HISTORY_PAGE_DEFAULT_LIMIT: int = Field(50, description="Default number of history items per page")
+    HISTORY_PAGE_MAX_LIMIT: int = Field(200, description="Maximum number of history items per page")
+    HISTORY_PREVIEW_CHARS: int = Field(280, description="Length of response previews returned with preview=true; answers keep a preview of this length when stored, so raising it does not lengthen existing previews")
+    HISTORY_SEARCH_MAX_OFFSET: int = Field(1000, description="Deepest offset accepted by history search")
+    HISTORY_SEARCH_SNIPPET_WORDS: int = Field(30, description="Maximum words in each highlighted search snippet")
+    HISTORY_EXPORT_BATCH_SIZE: int = Field(2000, description="Rows fetched per round trip by history exports")
+    HISTORY_EXPORT_ALL_USERS: bool = Field(False, description="Allow GET /export/history without user_id, exporting every user's history in a date range")
+    ANSWER_RENDER_CACHE_SIZE: int = Field(4096, description="Stored answers kept rendered as Markdown in process")
+
+    BATCH_MAX_ITEMS: int = Field(20, description="Maximum number of queries accepted by /query/batch")
+    BATCH_MAX_CONCURRENCY: int = Field(5, description="Maximum number of batch items answered concurrently")
+
+    LLM_SINGLEFLIGHT_ENABLED: bool = Field(True, description="Coalesce concurrent identical prompts into one upstream call")
+
+    # Model tiering
+    LLM_TIERING_ENABLED: bool = Field(False, description="Route short factual queries to the light model; answers then come from a different model")
+    LLM_LIGHT_MODEL: str = Field("gemini-2.5-flash-lite", description="Model used for the light tier")
+    LLM_LIGHT_MAX_WORDS: int = Field(12, description="Longest query, in words, that can be routed to the light tier")
+
+    # Session context
+    SESSION_CONTEXT_ENABLED: bool = Field(False, description="Send earlier turns of the session to the LLM with each query")
+    SESSION_CONTEXT_MAX_TURNS: int = Field(20, description="Most recent turns of a session fetched per query")
+    SESSION_CONTEXT_TOKEN_BUDGET: int = Field(2000, description="Approximate tokens of earlier turns sent verbatim")
+    SESSION_SUMMARY_TOKEN_BUDGET: int = Field(400, description="Approximate tokens of the rolling summary of older turns")
+    SESSION_SUMMARY_CACHE_SIZE: int = Field(10000, description="Sessions whose rolling summary is kept in process")
+    SESSION_CONTEXT_MAX_AGE_HOURS: int = Field(72, description="Turns older than this are not used as context")
+
+    # Upstream scheduler for LLM calls
+    LLM_MAX_RETRIES: int = Field(5, description="Maximum attempts per LLM call")
+    LLM_RATE_LIMIT_RPM: int = Field(0, description="Requests per minute allowed to the LLM API; 0 disables the limit")
+    LLM_RATE_LIMIT_BURST: int = Field(10, description="Requests that may be sent back to back before the per-minute rate applies")
+    LLM_MAX_CONCURRENCY: int = Field(32, description="Maximum number of concurrent calls to the LLM API")
+    LLM_QUEUE_TIMEOUT: float = Field(30.0, description="Seconds a call may wait for the scheduler before failing with 503")
+    LLM_BACKOFF_BASE: float = Field(1.0, description="Base delay in seconds for jittered exponential backoff")
+    LLM_BACKOFF_MAX: float = Field(30.0, description="Maximum backoff delay in seconds")
+    LLM_BREAKER_FAILURE_THRESHOLD: int = Field(5, description="Consecutive upstream failures that open the circuit breaker")
+    LLM_BREAKER_RESET_TIMEOUT: float = Field(30.0, description="Seconds the circuit breaker stays open before a probe call")
+
+    # Hedged LLM calls
+    LLM_HEDGING_ENABLED: bool = Field(False, description="Send a second identical request when the first one is slow")
+    LLM_HEDGE_QUANTILE: float = Field(0.9, description="Latency quantile of recent calls after which a hedge is sent")
+    LLM_HEDGE_MIN_DELAY: float = Field(0.5, description="Shortest wait in seconds before hedging")
+    LLM_HEDGE_BUDGET: float = Field(0.05, description="Maximum hedges as a fraction of LLM calls")
+    LLM_HEDGE_WINDOW: int = Field(500, description="Recent call latencies per model used to pick the hedge threshold")
+    LLM_HEDGE_MIN_SAMPLES: int = Field(50, description="Latencies needed for a model before its calls are hedged")
+
+    # Database engine and connection pool
+    DB_ECHO: bool = Field(False, description="Log every SQL statement (slow, for debugging only)")
+    DB_SSL: Optional[str] = Field("require", description="asyncpg ssl mode; empty to disable")
+    DB_POOL_ENABLED: bool = Field(True, description="Keep a pool of connections; when false every session opens a new connection")
+    DB_POOL_SIZE: int = Field(10, description="Number of connections kept open in the pool")
+    DB_MAX_OVERFLOW: int = Field(10, description="Extra connections allowed above DB_POOL_SIZE under load")
+    DB_POOL_TIMEOUT: float = Field(30.0, description="Seconds to wait for a free pooled connection")
+    DB_POOL_RECYCLE: int = Field(1800, description="Seconds after which a pooled connection is replaced")
+    DB_POOL_PRE_PING: bool = Field(True, description="Check connections for liveness when they are checked out")
+    DB_STATEMENT_CACHE_SIZE: int = Field(100, description="Size of the asyncpg prepared statement cache per connection")
+    DB_PGBOUNCER_MODE: bool = Field(False, description="Disable prepared statement caching for PgBouncer transaction pooling")
+    DB_POOL_WARMUP: int = Field(4, description="Number of connections to open at startup")
+
+    # Logging
+    LOG_LEVEL: str = Field("INFO", description="Level of the root logger")
+    LOG_FORMAT: str = Field("text", description="'text' for plain lines, 'json' for one JSON object per line with request and correlation IDs")
+    LOG_QUEUE_SIZE: int = Field(10000, description="Log records waiting for the writer thread; records beyond this are dropped")
+    LOG_MAX_MESSAGE_CHARS: int = Field(2000, description="Longer log messages are truncated")
+    LOG_SAMPLE_RATE: float = Field(1.0, description="Fraction of INFO and DEBUG records kept from LOG_SAMPLED_LOGGERS")
+    LOG_SAMPLED_LOGGERS: str = Field("httpx,uvicorn.access,app.api.v1.endpoints.qna,app.api.services.answer",
+                                     description="Comma-separated loggers whose INFO and DEBUG records are sampled")
+
+    # Metrics
+    METRICS_ENABLED: bool = Field(True, description="Record stage timings and counters and serve them on /metrics")
+    SERVER_TIMING_ENABLED: bool = Field(False, description="Allow clients to request a Server-Timing header with the X-Server-Timing: 1 request header")
+
+    # Write-behind persistence for query history
+    HISTORY_WRITE_BEHIND: bool = Field(False, description="Write query history from a background task instead of on the request path")
+    HISTORY_WRITE_QUEUE_SIZE: int = Field(10000, description="Maximum number of history rows waiting to be written")
+    HISTORY_WRITE_BATCH_SIZE: int = Field(500, description="Maximum number of rows per INSERT")
+    HISTORY_WRITE_FLUSH_INTERVAL: float = Field(0.5, description="Seconds to wait for a batch to fill before flushing it")
+    HISTORY_WRITE_ENQUEUE_TIMEOUT: float = Field(1.0, description="Seconds a request waits for queue space before writing directly")
+    HISTORY_WRITE_STOP_TIMEOUT: float = Field(10.0, description="Seconds shutdown waits for queued rows to be written before spilling the rest")
+    HISTORY_SPILL_PATH: Optional[str] = Field("history_spill.jsonl", description="File for rows that could not be written; empty to disable")
+
+    # query_hist partition maintenance (python -m app.db.partitions)
+    HISTORY_PARTITION_MONTHS_AHEAD: int = Field(3, description="Monthly partitions to keep created ahead of the current month")
+    HISTORY_RETENTION_MONTHS: int = Field(12, description="Full months of history kept in the database before archival")
+    HISTORY_ARCHIVE_DIR: str = Field("archive", description="Directory for gzip-compressed JSONL exports of dropped partitions")
+
+    # Asynchronous job mode (POST /api/v1/jobs)
+    JOBS_ENABLED: bool = Field(False, description="Accept queries as jobs and run in-process job workers")
+    JOB_WORKERS: int = Field(4, description="Job workers per process")
+    JOB_POLL_INTERVAL: float = Field(1.0, description="Seconds between job table polls when no job is waiting")
+    JOB_MAX_WAIT: float = Field(30.0, description="Longest long-poll wait allowed on GET /api/v1/jobs/{id}")
+    JOB_STALE_AFTER: float = Field(300.0, description="Seconds after which a running job is assumed abandoned and claimed again")
+    JOB_MAX_ATTEMPTS: int = Field(3, description="Attempts per job before a retryable upstream error fails it")
+
+    # Admission control and load shedding for query endpoints
+    ADMISSION_ENABLED: bool = Field(False, description="Limit concurrent queries and queue or shed the rest; queries are still refused while draining")
+    ADMISSION_MAX_CONCURRENCY: int = Field(64, description="Queries worked on at once per process")
+    ADMISSION_MAX_QUEUE: int = Field(256, description="Queries allowed to wait for a slot; more are shed with 503")
+    ADMISSION_QUEUE_TIMEOUT: float = Field(5.0, description="Seconds a query may wait for a slot before it is shed with 503")
+    USER_QUOTA_REQUESTS: int = Field(0, description="Queries per user_id (or client IP) per window; 0 disables the quota")
+    USER_QUOTA_WINDOW_SECONDS: float = Field(60.0, description="Length of the sliding quota window")
+
+    # Startup warm-up, readiness and graceful shutdown
+    LLM_WARMUP_CONNECTIONS: int = Field(1, description="Connections to the Gemini API opened at startup; 0 to disable")
+    READY_CHECK_TIMEOUT: float = Field(2.0, description="Seconds each dependency check of /ready may take")
+    SHUTDOWN_READY_DELAY: float = Field(5.0, description="Seconds between SIGTERM and the server closing its sockets, while /ready reports 503")
+    SHUTDOWN_DRAIN_TIMEOUT: float = Field(30.0, description="Seconds shutdown waits for in-flight queries and running jobs; pass the same value to uvicorn --timeout-graceful-shutdown")
     
 settings = Settings()
 
@@ -0,0 +1,168 @@
+"""
+Logging for the API process.
+
+Records are filtered, sampled and truncated on the calling thread, then put on a bounded queue.
+A listener thread formats them (JSON by default) and writes them to stdout, so the event loop
+never waits on log I/O. When the queue is full, records are dropped rather than blocking.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+import copy
+import logging
+import queue
+import random
+import sys
+
+import orjson
+
+from app.core.config import settings
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+correlation_id_var: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Loggers that uvicorn configures with handlers of its own; they are routed through the queue as well.
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Attributes every LogRecord has; anything else was passed with extra= and is emitted as a field.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id", "correlation_id",
+}
+
+dropped: Dict[str, int] = {"queue_full": 0, "sampled": 0}
+
+
+def _truncate(message: str, max_chars: int) -> str:
+    if max_chars <= 0 or len(message) <= max_chars:
+        return message
+    return f"{message[:max_chars]}... [{len(message) - max_chars} more chars]"
+
+
+def log_preview(text: str, max_chars: int = 100) -> str:
+    """
+    Shortens user-supplied text, such as a query, for a log message.
+    """
+    return _truncate(text, max_chars)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Attaches the request and correlation IDs of the current context and samples INFO and DEBUG
+    records from high-volume loggers. Runs on the calling thread, before the record is queued.
+    """
+
+    def __init__(self, sample_rate: float, sampled_loggers: Tuple[str, ...]):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_loggers = sampled_loggers
+
+    def _sampled(self, name: str) -> bool:
+        return any(name == prefix or name.startswith(prefix + ".") for prefix in self.sampled_loggers)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (self.sample_rate < 1.0 and record.levelno <= logging.INFO and self._sampled(record.name)
+                and random.random() >= self.sample_rate):
+            dropped["sampled"] += 1
+            return False
+        record.request_id = request_id_var.get()
+        record.correlation_id = correlation_id_var.get()
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that drops records when the queue is full and leaves formatting to the listener.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]", max_message_chars: int):
+        super().__init__(log_queue)
+        self.max_message_chars = max_message_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is resolved here, since args may change after the call returns.
+        # Tracebacks are kept as exc_info and formatted by the listener.
+        record = copy.copy(record)
+        record.msg = _truncate(record.getMessage(), self.max_message_chars)
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped["queue_full"] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "correlation_id": getattr(record, "correlation_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode("utf-8")
+
+
+_listener: Optional[QueueListener] = None
+
+
+def _set_root_handler(handler: logging.Handler) -> None:
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+
+
+def setup_logging() -> None:
+    """
+    Routes the root logger, and uvicorn's loggers, through a bounded queue to a writer thread.
+    Does nothing if it is already set up.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue, settings.LOG_MAX_MESSAGE_CHARS)
+    sampled_loggers = tuple(name.strip() for name in settings.LOG_SAMPLED_LOGGERS.split(",") if name.strip())
+    handler.addFilter(ContextFilter(settings.LOG_SAMPLE_RATE, sampled_loggers))
+
+    _set_root_handler(handler)
+    logging.getLogger().setLevel(settings.LOG_LEVEL.upper())
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """
+    Writes out the records still queued and stops the writer thread.
+    Records logged afterwards are written directly.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _set_root_handler(_listener.handlers[0])
+    _listener = None
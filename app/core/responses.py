@@ -0,0 +1,29 @@
+
+from typing import Any, Dict, Optional
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+import orjson
+import pydantic_core
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson. Used as the app's default response class.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def model_response(model: BaseModel, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serializes a Pydantic model straight to JSON bytes with pydantic-core, skipping the
+    response_model re-validation and jsonable_encoder pass FastAPI would otherwise do.
+    """
+    return Response(
+        content=pydantic_core.to_json(model),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json"
+    )
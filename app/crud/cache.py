@@ -0,0 +1,82 @@
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from typing import Optional, Dict, Any, List
+from datetime import datetime, timedelta, timezone
+
+from app.db.models import LLMResponseCache
+
+async def get_persistent_cache_entry(
+    db_session: AsyncSession,
+    cache_key: str
+) -> Optional[LLMResponseCache]:
+    """
+    Retrieves a non-expired cache entry by key.
+    """
+    result = await db_session.execute(
+        select(LLMResponseCache)
+        .filter(LLMResponseCache.cache_key == cache_key)
+        .filter(LLMResponseCache.expires_at > func.now())
+    )
+    return result.scalars().first()
+
+async def upsert_persistent_cache_entry(
+    db_session: AsyncSession,
+    cache_key: str,
+    template: str,
+    normalized_query: str,
+    response: Dict[str, Any],
+    ttl_seconds: int,
+    prewarmed: bool = False
+) -> None:
+    """
+    Inserts a cache entry or refreshes the existing one with the same key.
+    An entry stays marked as pre-warmed when an API process refreshes it.
+    """
+    now = datetime.now(timezone.utc)
+    stmt = insert(LLMResponseCache).values(
+        cache_key=cache_key,
+        template=template,
+        normalized_query=normalized_query,
+        response=response,
+        created_at=now,
+        expires_at=now + timedelta(seconds=ttl_seconds),
+        prewarmed=prewarmed
+    )
+    updates = {
+        "response": stmt.excluded.response,
+        "created_at": stmt.excluded.created_at,
+        "expires_at": stmt.excluded.expires_at,
+    }
+    if prewarmed:
+        updates["prewarmed"] = stmt.excluded.prewarmed
+    stmt = stmt.on_conflict_do_update(index_elements=[LLMResponseCache.cache_key], set_=updates)
+    await db_session.execute(stmt)
+    await db_session.commit()
+
+async def get_prewarmed_cache_entries(
+    db_session: AsyncSession,
+    limit: int
+) -> List[LLMResponseCache]:
+    """
+    Retrieves non-expired pre-warmed entries, most recently refreshed first.
+    """
+    result = await db_session.execute(
+        select(LLMResponseCache)
+        .filter(LLMResponseCache.prewarmed.is_(True))
+        .filter(LLMResponseCache.expires_at > func.now())
+        .order_by(LLMResponseCache.created_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+async def delete_expired_cache_entries(db_session: AsyncSession) -> int:
+    """
+    Deletes expired cache entries and returns how many were removed.
+    """
+    result = await db_session.execute(
+        delete(LLMResponseCache).where(LLMResponseCache.expires_at <= func.now())
+    )
+    await db_session.commit()
+    return result.rowcount
@@ -0,0 +1,109 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, or_, and_
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timezone
+import uuid
+
+from app.db.models import QueryJob
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_JOB_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+async def create_job(
+    db_session: AsyncSession,
+    user_id: str,
+    session_id: str,
+    query_text: str
+) -> QueryJob:
+    """
+    Creates a pending query job.
+    """
+    job = QueryJob(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        session_id=session_id,
+        query_text=query_text,
+        status=JOB_PENDING,
+        attempts=0,
+        created_at=datetime.now(timezone.utc)
+    )
+    db_session.add(job)
+    await db_session.commit()
+    return job
+
+async def get_job(
+    db_session: AsyncSession,
+    job_id: uuid.UUID
+) -> Optional[QueryJob]:
+    """
+    Retrieves a job by ID.
+    """
+    result = await db_session.execute(select(QueryJob).filter(QueryJob.id == job_id))
+    return result.scalars().first()
+
+async def claim_jobs(
+    db_session: AsyncSession,
+    limit: int,
+    stale_before: datetime
+) -> List[QueryJob]:
+    """
+    Marks up to limit jobs as running and returns them, oldest first.
+    Pending jobs are claimed, as are running jobs started before stale_before whose worker is presumed gone.
+    SKIP LOCKED lets workers in several processes claim concurrently without handing out the same job twice.
+    """
+    claimable = (
+        select(QueryJob.id)
+        .filter(or_(
+            QueryJob.status == JOB_PENDING,
+            and_(QueryJob.status == JOB_RUNNING, QueryJob.started_at < stale_before)
+        ))
+        .order_by(QueryJob.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    # One UPDATE ... RETURNING, so a job cannot be claimed twice even where SKIP LOCKED is unavailable.
+    result = await db_session.scalars(
+        update(QueryJob)
+        .filter(QueryJob.id.in_(claimable.scalar_subquery()))
+        .values(status=JOB_RUNNING, started_at=datetime.now(timezone.utc), attempts=QueryJob.attempts + 1)
+        .returning(QueryJob),
+        execution_options={"synchronize_session": False}
+    )
+    jobs = sorted(result.all(), key=lambda job: job.created_at)
+    await db_session.commit()
+    return jobs
+
+async def finish_job(
+    db_session: AsyncSession,
+    job_id: uuid.UUID,
+    result: Dict[str, Any]
+) -> None:
+    """
+    Stores a job's result and marks it succeeded.
+    """
+    await db_session.execute(
+        update(QueryJob)
+        .filter(QueryJob.id == job_id)
+        .values(status=JOB_SUCCEEDED, result=result, error=None, finished_at=datetime.now(timezone.utc))
+    )
+    await db_session.commit()
+
+async def fail_job(
+    db_session: AsyncSession,
+    job_id: uuid.UUID,
+    error: str,
+    retry: bool = False
+) -> None:
+    """
+    Records a job failure. With retry set, the job goes back to pending instead of failing for good.
+    """
+    values: Dict[str, Any] = {"error": error}
+    if retry:
+        values.update(status=JOB_PENDING, started_at=None)
+    else:
+        values.update(status=JOB_FAILED, finished_at=datetime.now(timezone.utc))
+    await db_session.execute(update(QueryJob).filter(QueryJob.id == job_id).values(**values))
+    await db_session.commit()
@@ -1,44 +1,325 @@
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import select, func, tuple_, literal, and_, union, case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import REGCONFIG, JSONB, TSVECTOR
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from datetime import datetime
+import base64
+import uuid
 
-from app.db.models import QueryHistory
+from app.db.models import QueryHistory, Answer, SEARCH_CONFIG
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+def dialect_insert(db_session: AsyncSession, model: Any) -> Any:
+    """
+    An INSERT for model that supports ON CONFLICT on the session's database.
+    """
+    return (postgresql.insert if db_session.get_bind().dialect.name == "postgresql" else sqlite.insert)(model)
+
+async def store_answers(
+    db_session: AsyncSession,
+    answers: Dict[str, Dict[str, Any]],
+    previews: Optional[Dict[str, Optional[str]]] = None
+) -> None:
+    """
+    Inserts structured answers keyed by content hash, with the preview text of each, keeping any
+    that are already stored. A stored answer without a preview gets one. Does not commit.
+
+    An answer that already exists is locked with a no-op update rather than skipped, so retention
+    (app/db/partitions.py, prune_answers) cannot delete it before the rows referencing it are committed.
+    """
+    if not answers:
+        return
+    # Sorted so concurrent writers take the row locks in the same order.
+    previews = previews or {}
+    stmt = dialect_insert(db_session, Answer).values([
+        {"content_hash": content_hash, "structured_data": answers[content_hash], "preview_text": previews.get(content_hash)}
+        for content_hash in sorted(answers)
+    ])
+    await db_session.execute(stmt.on_conflict_do_update(
+        index_elements=[Answer.content_hash],
+        set_={
+            "content_hash": stmt.excluded.content_hash,
+            "preview_text": func.coalesce(Answer.preview_text, stmt.excluded.preview_text)
+        }
+    ))
 
 async def create_query_history(
     db_session: AsyncSession,
     user_id: str,
     session_id: str,
     query_text: str,
-    response_text: str,
-    timestamp: datetime
-) -> QueryHistory:
+    response_text: Optional[str],
+    timestamp: datetime,
+    answer_hash: Optional[str] = None,
+    structured_data: Optional[Dict[str, Any]] = None,
+    answer_preview: Optional[str] = None,
+    id: Optional[uuid.UUID] = None
+) -> None:
     """
     Creates a new query history entry in the database.
+    A structured answer is stored in the answers table, once per content hash, and referenced by answer_hash.
+    With id set, a row already stored under that id and timestamp is kept and nothing is written.
     """
-    db_query = QueryHistory(
+    if answer_hash is not None and structured_data is not None:
+        await store_answers(db_session, {answer_hash: structured_data}, {answer_hash: answer_preview})
+    await db_session.execute(dialect_insert(db_session, QueryHistory).values(
+        id=id or uuid.uuid4(),
         user_id=user_id,
         session_id=session_id,
         query_text=query_text,
         response_text=response_text,
+        answer_hash=answer_hash,
         timestamp=timestamp
-    )
-    db_session.add(db_query)
+    ).on_conflict_do_nothing())
+    await db_session.commit()
+
+async def bulk_create_query_history(
+    db_session: AsyncSession,
+    rows: List[Dict[str, Any]]
+) -> int:
+    """
+    Inserts many query history rows with a single multi-row INSERT and returns how many were handled.
+    Rows may carry an answer_hash and its structured_data; each distinct answer is stored once.
+    Rows whose id and timestamp are already stored are skipped, so replaying a batch is safe.
+    """
+    if not rows:
+        return 0
+    answers = {row["answer_hash"]: row["structured_data"] for row in rows if row.get("structured_data") is not None}
+    previews = {row["answer_hash"]: row.get("answer_preview") for row in rows if row.get("structured_data") is not None}
+    history_rows = [
+        {"answer_hash": None, **{key: value for key, value in row.items() if key not in ("structured_data", "answer_preview")}}
+        for row in rows
+    ]
+    await store_answers(db_session, answers, previews)
+    await db_session.execute(dialect_insert(db_session, QueryHistory).on_conflict_do_nothing(), history_rows)
     await db_session.commit()
-    await db_session.refresh(db_query)
-    return db_query
+    return len(rows)
+
+def encode_history_cursor(timestamp: datetime, row_id: uuid.UUID) -> str:
+    """
+    Encodes the (timestamp, id) position of a history row as an opaque cursor.
+    """
+    raw = f"{timestamp.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """
+    Decodes a cursor produced by encode_history_cursor. Raises ValueError if it is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), uuid.UUID(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid history cursor: {cursor}") from e
+
+async def get_query_history_page(
+    db_session: AsyncSession,
+    user_id: str,
+    limit: int,
+    cursor: Optional[Tuple[datetime, uuid.UUID]] = None,
+    session_id: Optional[str] = None,
+    preview_chars: Optional[int] = None
+) -> List[Any]:
+    """
+    Retrieves one page of a user's query history, newest first, using keyset pagination on (timestamp, id).
+    Returns up to limit + 1 rows so the caller can tell whether another page exists.
+    Rows that reference a stored answer come with its structured_data and a NULL response_text.
+    With preview_chars set, response_text holds the first preview_chars + 1 characters of the row's
+    text or of its answer's stored preview, and structured_data is only loaded for answers without one.
+    """
+    response_column = QueryHistory.response_text
+    structured_column = Answer.structured_data
+    if preview_chars is not None:
+        response_column = func.substr(func.coalesce(QueryHistory.response_text, Answer.preview_text), 1, preview_chars + 1)
+        structured_column = case((Answer.preview_text.is_(None), Answer.structured_data), else_=None)
+
+    stmt = (
+        select(
+            QueryHistory.id,
+            QueryHistory.user_id,
+            QueryHistory.session_id,
+            QueryHistory.query_text,
+            response_column.label("response_text"),
+            QueryHistory.answer_hash,
+            structured_column.label("structured_data"),
+            QueryHistory.timestamp
+        )
+        .outerjoin(Answer, Answer.content_hash == QueryHistory.answer_hash)
+        .filter(QueryHistory.user_id == user_id)
+    )
+    if session_id is not None:
+        stmt = stmt.filter(QueryHistory.session_id == session_id)
+    if cursor is not None:
+        stmt = stmt.filter(tuple_(QueryHistory.timestamp, QueryHistory.id) < tuple_(*cursor))
+
+    result = await db_session.execute(
+        stmt.order_by(QueryHistory.timestamp.desc(), QueryHistory.id.desc()).limit(limit + 1)
+    )
+    return result.all()
+
+async def get_recent_session_turns(
+    db_session: AsyncSession,
+    user_id: str,
+    session_id: str,
+    limit: int,
+    since: Optional[datetime] = None
+) -> List[Any]:
+    """
+    Retrieves the latest turns of a session, newest first, with one range scan of
+    ix_query_hist_session_id_timestamp_id. since bounds the scan to recent partitions.
+    Rows that reference a stored answer come with its structured_data and a NULL response_text.
+    """
+    stmt = (
+        select(
+            QueryHistory.id,
+            QueryHistory.query_text,
+            QueryHistory.response_text,
+            QueryHistory.answer_hash,
+            Answer.structured_data,
+            QueryHistory.timestamp
+        )
+        .outerjoin(Answer, Answer.content_hash == QueryHistory.answer_hash)
+        .filter(QueryHistory.session_id == session_id)
+        .filter(QueryHistory.user_id == user_id)
+    )
+    if since is not None:
+        stmt = stmt.filter(QueryHistory.timestamp >= since)
+
+    result = await db_session.execute(
+        stmt.order_by(QueryHistory.timestamp.desc(), QueryHistory.id.desc()).limit(limit)
+    )
+    return result.all()
 
-async def get_query_history_by_user_id(
+async def get_frequent_queries(
     db_session: AsyncSession,
-    user_id: str
-) -> List[QueryHistory]:
+    since: datetime,
+    limit: int
+) -> List[Any]:
     """
-    Retrieves query history for a given user ID, ordered by timestamp descending.
+    Retrieves the most frequent query texts asked since `since`, with how often and when they were last asked.
     """
+    asked = func.count().label("asked")
     result = await db_session.execute(
-        select(QueryHistory)
+        select(
+            QueryHistory.query_text,
+            asked,
+            func.max(QueryHistory.timestamp).label("last_asked")
+        )
+        .filter(QueryHistory.timestamp >= since)
+        .group_by(QueryHistory.query_text)
+        .order_by(asked.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+async def search_query_history(
+    db_session: AsyncSession,
+    user_id: str,
+    search_text: str,
+    limit: int,
+    offset: int = 0,
+    snippet_words: int = 30
+) -> List[Any]:
+    """
+    Full-text searches a user's query history and returns up to limit + 1 rows ordered by relevance.
+    Rows matching on their own search_vector and rows whose stored answer matches are found separately,
+    so each lookup can use its GIN index, and only their union is ranked. Highlighted snippets are built only for the returned page. For stored answers, answer_highlight holds
+    the answer with matches highlighted in each string value and snippet is NULL.
+    """
+    search_config = literal(SEARCH_CONFIG).cast(REGCONFIG)
+    ts_query = func.websearch_to_tsquery(search_config, search_text)
+    answer_vector = func.coalesce(Answer.search_vector, literal("").cast(TSVECTOR))
+    rank = func.ts_rank_cd(QueryHistory.search_vector.op("||")(answer_vector), ts_query)
+
+    matching_answers = select(Answer.content_hash).filter(Answer.search_vector.op("@@")(ts_query))
+    matches = union(
+        select(QueryHistory.id, QueryHistory.timestamp)
+        .filter(QueryHistory.user_id == user_id)
+        .filter(QueryHistory.search_vector.op("@@")(ts_query)),
+        select(QueryHistory.id, QueryHistory.timestamp)
         .filter(QueryHistory.user_id == user_id)
-        .order_by(QueryHistory.timestamp.desc())
+        .filter(QueryHistory.answer_hash.in_(matching_answers))
+    ).subquery()
+
+    page = (
+        select(
+            QueryHistory.id,
+            QueryHistory.user_id,
+            QueryHistory.session_id,
+            QueryHistory.query_text,
+            QueryHistory.response_text,
+            Answer.structured_data,
+            QueryHistory.timestamp,
+            rank.label("rank")
+        )
+        .select_from(matches)
+        .join(QueryHistory, and_(QueryHistory.id == matches.c.id, QueryHistory.timestamp == matches.c.timestamp))
+        .outerjoin(Answer, Answer.content_hash == QueryHistory.answer_hash)
+        .order_by(rank.desc(), QueryHistory.timestamp.desc(), QueryHistory.id.desc())
+        .limit(limit + 1)
+        .offset(offset)
+        .subquery()
+    )
+
+    headline_options = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}"
+    snippet_options = f"{headline_options}, MaxWords={snippet_words}, MinWords={max(snippet_words // 2, 1)}, MaxFragments=2"
+    result = await db_session.execute(
+        select(
+            page.c.id,
+            page.c.user_id,
+            page.c.session_id,
+            page.c.timestamp,
+            page.c.rank,
+            func.ts_headline(search_config, page.c.query_text, ts_query,
+                             f"{headline_options}, HighlightAll=true").label("query_highlight"),
+            func.ts_headline(search_config, page.c.response_text, ts_query,
+                             snippet_options).label("snippet"),
+            func.ts_headline(search_config, page.c.structured_data, ts_query,
+                             snippet_options, type_=JSONB).label("answer_highlight")
+        )
+        .order_by(page.c.rank.desc(), page.c.timestamp.desc(), page.c.id.desc())
+    )
+    return result.all()
+
+async def stream_query_history(
+    db_session: AsyncSession,
+    user_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = 1000
+) -> AsyncIterator[List[Any]]:
+    """
+    Streams query history rows, oldest first, through a server-side cursor.
+    Yields lists of at most batch_size rows so memory use does not grow with the size of the export.
+    Rows that reference a stored answer come with its structured_data and a NULL response_text.
+    """
+    stmt = (
+        select(
+            QueryHistory.id,
+            QueryHistory.user_id,
+            QueryHistory.session_id,
+            QueryHistory.query_text,
+            QueryHistory.response_text,
+            QueryHistory.answer_hash,
+            Answer.structured_data,
+            QueryHistory.timestamp
+        )
+        .outerjoin(Answer, Answer.content_hash == QueryHistory.answer_hash)
+    )
+    if user_id is not None:
+        stmt = stmt.filter(QueryHistory.user_id == user_id)
+    if start is not None:
+        stmt = stmt.filter(QueryHistory.timestamp >= start)
+    if end is not None:
+        stmt = stmt.filter(QueryHistory.timestamp < end)
+
+    result = await db_session.stream(
+        stmt.order_by(QueryHistory.timestamp, QueryHistory.id).execution_options(yield_per=batch_size)
     )
-    return result.scalars().all()
+    async for rows in result.partitions(batch_size):
+        yield rows
@@ -1,28 +1,116 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.pool import NullPool
+from sqlalchemy.engine import make_url
+from sqlalchemy import text
+from typing import Dict, Any
 from app.core.config import settings
+import asyncio
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    connect_args={"ssl": "require"},
-    echo=True,
-    poolclass=NullPool
-)
+
+def _engine_options() -> Dict[str, Any]:
+    """
+    Builds create_async_engine options from settings.
+    """
+    url = make_url(settings.DATABASE_URL)
+    connect_args: Dict[str, Any] = {}
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO}
+
+    if url.get_driver_name() == "asyncpg":
+        if settings.DB_SSL:
+            connect_args["ssl"] = settings.DB_SSL
+        if settings.DB_PGBOUNCER_MODE:
+            # PgBouncer in transaction mode can hand each statement to a different server
+            # connection, so prepared statements must be neither cached nor reused by name.
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+        else:
+            connect_args["prepared_statement_cache_size"] = settings.DB_STATEMENT_CACHE_SIZE
+
+    if settings.DB_POOL_ENABLED:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING
+        )
+    else:
+        options["poolclass"] = NullPool
+
+    options["connect_args"] = connect_args
+    return options
+
+
+engine = create_async_engine(settings.DATABASE_URL, **_engine_options())
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
     expire_on_commit=False
 )
 
+async def warm_up_pool(connections: int) -> None:
+    """
+    Opens the given number of pooled connections concurrently so the first requests do not pay for connection setup.
+    """
+    async def _open():
+        conn = engine.connect()
+        await conn.start()
+        await conn.execute(text("SELECT 1"))
+        return conn
+
+    # All connections are held until every one is open, otherwise the pool would hand out the same one again.
+    results = await asyncio.gather(*(_open() for _ in range(connections)), return_exceptions=True)
+    opened = [conn for conn in results if not isinstance(conn, BaseException)]
+    for conn in opened:
+        await conn.close()
+
+    errors = [e for e in results if isinstance(e, BaseException)]
+    if errors:
+        logger.warning(f"Database pool warm-up opened {len(opened)}/{connections} connections. First error: {errors[0]}")
+    else:
+        logger.info(f"Database pool warmed up with {connections} connections.")
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Returns the current state of the connection pool.
+    """
+    pool = engine.pool
+    if isinstance(pool, NullPool):
+        return {"pooled": False}
+    return {
+        "pooled": True,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+async def ping_db() -> None:
+    """
+    Runs a trivial query; raises if the database cannot be reached.
+    """
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
 async def init_db():
-    async with engine.begin() as conn:
-        logger.info("Database initialization skipped, alembic should be used for migration")
+    """
+    Opens DB_POOL_WARMUP pooled connections and checks that the database answers.
+    Schema changes are left to alembic.
+    """
+    if settings.DB_POOL_ENABLED and settings.DB_POOL_WARMUP > 0:
+        await warm_up_pool(min(settings.DB_POOL_WARMUP, settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW))
+    await ping_db()
         
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -1,19 +1,119 @@
-from sqlalchemy import Column, String, DateTime, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, DateTime, Text, Index, Computed, Integer, Boolean
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 import uuid
 from app.db.database import Base
 
+# Text search configuration used by the generated search_vector column and by history search queries.
+SEARCH_CONFIG = 'english'
+
 class QueryHistory(Base):
     __tablename__ = 'query_hist'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default= uuid.uuid4, index=True)
-    user_id = Column(String, index=True, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default= uuid.uuid4)
+    user_id = Column(String, nullable=False)
     # query_id = Column(String, unique=True, nullable=False)
-    session_id = Column(String, index=True, nullable=False)
+    session_id = Column(String, nullable=False)
     query_text = Column(Text, nullable=False)
-    response_text = Column(Text, nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Only set for answers without structured data; structured answers are stored once in answers.
+    response_text = Column(Text, nullable=True)
+    answer_hash = Column(String(64), nullable=True)
+    # Partition key, so it is part of the primary key.
+    timestamp = Column(DateTime(timezone=True), primary_key=True, server_default=func.now(), nullable=False)
+    # Maintained by Postgres from query_text and response_text; deferred so normal reads never load it.
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            f"to_tsvector('{SEARCH_CONFIG}', coalesce(query_text, '') || ' ' || coalesce(response_text, ''))",
+            persisted=True
+        )
+    ))
+
+    __table_args__ = (
+        # Serves keyset-paginated history reads: one index range scan per page.
+        Index('ix_query_hist_user_id_timestamp_id', user_id, timestamp.desc(), id.desc()),
+        # Serves session filters and fetching the latest turns of a session for prompt context.
+        Index('ix_query_hist_session_id_timestamp_id', session_id, timestamp.desc(), id.desc()),
+        Index('ix_query_hist_search_vector', 'search_vector', postgresql_using='gin'),
+        # Lets retention find answers that are no longer referenced.
+        Index('ix_query_hist_answer_hash', answer_hash, postgresql_where=(answer_hash.isnot(None))),
+        # Partitioned by month; see app/db/partitions.py for partition maintenance and retention.
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+    # Don't ask for search_vector back with RETURNING on every insert.
+    __mapper_args__ = {'eager_defaults': False}
     
     def __repr__(self):
-        return f'[QueryHistory(user_id={self.user_id}, query_id={self.query_id}, timestamp={self.timestamp})]'
\ No newline at end of file
+        return f'[QueryHistory(user_id={self.user_id}, query_id={self.query_id}, timestamp={self.timestamp})]'
+
+
+class Answer(Base):
+    __tablename__ = 'answers'
+
+    # sha256 of the canonical JSON of structured_data, so identical answers share one row.
+    content_hash = Column(String(64), primary_key=True)
+    structured_data = Column(JSONB, nullable=False)
+    # Start of the rendered answer, so history previews do not load structured_data.
+    # NULL for answers stored before previews were kept.
+    preview_text = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Indexes every string value of the answer for history search.
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{SEARCH_CONFIG}', structured_data)", persisted=True)
+    ))
+
+    __table_args__ = (
+        Index('ix_answers_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+    __mapper_args__ = {'eager_defaults': False}
+
+    def __repr__(self):
+        return f'[Answer(content_hash={self.content_hash})]'
+
+
+class LLMResponseCache(Base):
+    __tablename__ = 'llm_response_cache'
+
+    cache_key = Column(String(64), primary_key=True)
+    template = Column(String, nullable=False)
+    normalized_query = Column(Text, nullable=False)
+    response = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
+    # Written by the pre-warm job (python -m app.api.services.prewarm); loaded into memory at startup.
+    prewarmed = Column(Boolean, nullable=False, default=False, server_default='false')
+
+    __table_args__ = (
+        Index('ix_llm_response_cache_prewarmed_created_at', created_at.desc(), postgresql_where=(prewarmed.is_(True))),
+    )
+
+    def __repr__(self):
+        return f'[LLMResponseCache(cache_key={self.cache_key}, expires_at={self.expires_at})]'
+
+
+class QueryJob(Base):
+    __tablename__ = 'query_jobs'
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(String, nullable=False)
+    session_id = Column(String, nullable=False)
+    query_text = Column(Text, nullable=False)
+    # pending -> running -> succeeded | failed; running jobs go back to pending to be retried.
+    status = Column(String(16), nullable=False, default='pending', server_default='pending')
+    attempts = Column(Integer, nullable=False, default=0, server_default='0')
+    result = Column(JSONB, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Workers claim the oldest pending jobs and reclaim running jobs whose worker went away.
+        Index('ix_query_jobs_pending_created_at', created_at, postgresql_where=(status == 'pending')),
+        Index('ix_query_jobs_running_started_at', started_at, postgresql_where=(status == 'running')),
+    )
+
+    def __repr__(self):
+        return f'[QueryJob(id={self.id}, status={self.status}, attempts={self.attempts})]'
@@ -0,0 +1,268 @@
+"""
+Maintenance for the monthly partitions of query_hist.
+
+    python -m app.db.partitions create --months-ahead 3
+    python -m app.db.partitions retention --retain-months 12 --archive-dir archive
+
+`create` adds the partitions for the current month and the next few months, moving any matching
+rows out of the default partition first. `retention` exports every partition older than the
+retention window to gzip-compressed JSONL, with the structured data of referenced answers inlined,
+and then drops it; answers no longer referenced by any row are deleted afterwards, and so are
+expired entries of the persistent response cache. Both are safe to re-run and are meant to be
+scheduled (e.g. daily from cron).
+"""
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.core.config import settings
+from app.crud.cache import delete_expired_cache_entries
+from app.db import database
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "query_hist"
+DEFAULT_PARTITION = "query_hist_default"
+ANSWERS_TABLE = "answers"
+EXPORT_COLUMNS = ("id", "user_id", "session_id", "query_text", "response_text", "answer_hash", "timestamp")
+
+_PARTITION_NAME = re.compile(r"^query_hist_p(\d{4})_(\d{2})$")
+
+
+def month_start(value: datetime) -> datetime:
+    """
+    Returns midnight UTC on the first day of the month containing value.
+    """
+    value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + (month.month - 1) + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def _bounds(month: datetime) -> Tuple[str, str]:
+    return month.isoformat(), add_months(month, 1).isoformat()
+
+
+async def list_partitions(conn: AsyncConnection) -> List[Tuple[str, datetime]]:
+    """
+    Returns the monthly partitions of query_hist as (name, month start), oldest first.
+    The default partition is not included.
+    """
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARENT_TABLE})
+    partitions = []
+    for (name,) in result:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def create_partition(conn: AsyncConnection, month: datetime) -> bool:
+    """
+    Creates the partition for one month. Returns False if it already exists.
+    Rows for that month that landed in the default partition are moved into the new partition.
+    """
+    name = partition_name(month)
+    if await conn.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is not None:
+        return False
+
+    lower, upper = _bounds(month)
+    bounds = {"lower": lower, "upper": upper}
+    has_default_rows = await conn.scalar(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= CAST(:lower AS timestamptz) "
+        f"AND timestamp < CAST(:upper AS timestamptz))"
+    ), bounds)
+
+    if not has_default_rows:
+        await conn.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        ))
+        return True
+
+    # A partition cannot be attached while the default partition holds rows in its range,
+    # so those rows are moved into a standalone table that is then attached.
+    columns = ", ".join(EXPORT_COLUMNS)
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING GENERATED)"))
+    moved = await conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= CAST(:lower AS timestamptz) "
+        f"AND timestamp < CAST(:upper AS timestamptz) RETURNING {columns}) "
+        f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+    ), bounds)
+    await conn.execute(text(
+        f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+    logger.info(f"Moved {moved.rowcount} rows from {DEFAULT_PARTITION} into {name}.")
+    return True
+
+
+async def ensure_partitions(engine: AsyncEngine, months_ahead: int, now: Optional[datetime] = None) -> List[str]:
+    """
+    Creates any missing partitions from the current month through months_ahead months from now.
+    Returns the names of the partitions that were created.
+    """
+    current = month_start(now or datetime.now(timezone.utc))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        # One transaction per partition keeps the parent's lock short.
+        async with engine.begin() as conn:
+            if await create_partition(conn, month):
+                created.append(partition_name(month))
+    if created:
+        logger.info(f"Created query history partitions: {', '.join(created)}")
+    return created
+
+
+async def export_partition(engine: AsyncEngine, name: str, path: str, batch_size: int = 5000) -> int:
+    """
+    Streams every row of a partition into a gzip-compressed JSONL file and returns the row count.
+    The file is written under a temporary name and renamed only once it is complete.
+    """
+    tmp_path = f"{path}.tmp"
+    rows_written = 0
+    async with engine.connect() as conn:
+        result = await conn.stream(
+            text(
+                f"SELECT {', '.join(f'h.{column}' for column in EXPORT_COLUMNS)}, a.structured_data "
+                f"FROM {name} h LEFT JOIN {ANSWERS_TABLE} a ON a.content_hash = h.answer_hash "
+                f"ORDER BY h.timestamp, h.id"
+            ),
+            execution_options={"yield_per": batch_size}
+        )
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+                async for rows in result.partitions(batch_size):
+                    archive.write(b"".join(orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE) for row in rows))
+                    rows_written += len(rows)
+            raw.flush()
+            os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return rows_written
+
+
+async def apply_retention(
+    engine: AsyncEngine,
+    retain_months: int,
+    archive_dir: str,
+    now: Optional[datetime] = None,
+    dry_run: bool = False
+) -> List[Tuple[str, int]]:
+    """
+    Archives and drops every partition that ends before the retention window.
+    Each partition is detached first so no new rows reach it, exported, and only then dropped;
+    if the export fails it is attached again. Returns (partition, archived rows) pairs.
+    """
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retain_months)
+    async with engine.connect() as conn:
+        expired = [(name, month) for name, month in await list_partitions(conn) if add_months(month, 1) <= cutoff]
+
+    archived = []
+    if dry_run:
+        for name, _ in expired:
+            logger.info(f"Would archive and drop {name}.")
+        return archived
+
+    os.makedirs(archive_dir, exist_ok=True)
+    for name, month in expired:
+        lower, upper = _bounds(month)
+        async with engine.begin() as conn:
+            await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        try:
+            rows = await export_partition(engine, name, os.path.join(archive_dir, f"{name}.jsonl.gz"))
+        except Exception:
+            async with engine.begin() as conn:
+                await conn.execute(text(
+                    f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+                    f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+                ))
+            raise
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        logger.info(f"Archived {rows} rows from {name} and dropped it.")
+        archived.append((name, rows))
+
+    if archived:
+        await prune_answers(engine, cutoff)
+    return archived
+
+
+async def prune_answers(engine: AsyncEngine, created_before: datetime) -> int:
+    """
+    Deletes stored answers created before created_before that no history row references any more.
+
+    Writers that reuse an answer lock its row until they commit (see store_answers). Candidates are
+    locked first, skipping rows a writer holds, and then checked again by the DELETE: its fresh
+    snapshot sees every history row committed by a writer that held the lock before us.
+    """
+    unreferenced = f"NOT EXISTS (SELECT 1 FROM {PARENT_TABLE} h WHERE h.answer_hash = a.content_hash)"
+    async with engine.begin() as conn:
+        locked = (await conn.execute(text(
+            f"SELECT a.content_hash FROM {ANSWERS_TABLE} a WHERE a.created_at < :created_before "
+            f"AND {unreferenced} FOR UPDATE SKIP LOCKED"
+        ), {"created_before": created_before})).scalars().all()
+        deleted = 0
+        if locked:
+            result = await conn.execute(text(
+                f"DELETE FROM {ANSWERS_TABLE} a WHERE a.content_hash = ANY(:hashes) AND {unreferenced}"
+            ), {"hashes": list(locked)})
+            deleted = result.rowcount
+    logger.info(f"Deleted {deleted} answers no longer referenced by query history.")
+    return deleted
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of query_hist.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Create partitions for upcoming months.")
+    create.add_argument("--months-ahead", type=int, default=settings.HISTORY_PARTITION_MONTHS_AHEAD)
+
+    retention = commands.add_parser("retention", help="Archive and drop partitions older than the retention window, "
+                                                      "and delete expired response cache entries.")
+    retention.add_argument("--retain-months", type=int, default=settings.HISTORY_RETENTION_MONTHS)
+    retention.add_argument("--archive-dir", default=settings.HISTORY_ARCHIVE_DIR)
+    retention.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    async def run() -> None:
+        try:
+            if args.command == "create":
+                await ensure_partitions(database.engine, args.months_ahead)
+            else:
+                await apply_retention(database.engine, args.retain_months, args.archive_dir, dry_run=args.dry_run)
+                if not args.dry_run:
+                    async with database.AsyncSessionLocal() as db_session:
+                        purged = await delete_expired_cache_entries(db_session)
+                    logger.info(f"Deleted {purged} expired response cache entries.")
+        finally:
+            await database.engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,87 @@
 
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import FastAPI, HTTPException, status, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.db.database import init_db
+from fastapi.responses import PlainTextResponse
+from contextlib import asynccontextmanager
+from app.db.database import init_db, AsyncSessionLocal
+from app.api.services.http_client import init_http_client, close_http_client, warm_up_http_client
+from app.api.services.history_writer import history_writer
+from app.api.services.jobs import job_workers
+from app.api.services.cache import load_prewarmed_responses
+from app.api.services.admission import admission
+from app.api.services.lifecycle import lifecycle
+from app.api.services.llm import warm_up_prompts
+from app.api.services.metrics import registry, register_default_collectors, start_server_timing, format_server_timing
+from app.core.config import settings
+from app.core.responses import ORJSONResponse
+from app.core.logging_config import setup_logging, shutdown_logging, request_id_var, correlation_id_var
+import asyncio
 import logging
+import time
+import uuid
 
 
-from app.api.v1.endpoints import qna
+from app.api.v1.endpoints import qna, jobs
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+setup_logging()
 logger = logging.getLogger(__name__)
 
+
+async def _load_prewarmed_responses() -> None:
+    async with AsyncSessionLocal() as db_session:
+        loaded = await load_prewarmed_responses(db_session, settings.PREWARM_STARTUP_ENTRIES)
+    if loaded:
+        logger.info(f"Loaded {loaded} pre-warmed answers into the response cache.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    On startup, warms the database pool, the LLM HTTP client, the prompt paths, the OpenAPI schema and the
+    response cache, then starts the history writer and the job workers. /ready reports ready only after that.
+    On SIGTERM, stops admitting queries and fails /ready for SHUTDOWN_READY_DELAY before uvicorn closes its
+    sockets and waits for in-flight requests (see Lifecycle.install_signal_handlers). On shutdown, waits up to
+    SHUTDOWN_DRAIN_TIMEOUT for queries still in flight and running jobs, flushes pending history rows and
+    closes the client.
+    """
+    setup_logging()
+    started = time.monotonic()
+    logger.info("Application startup: Warming up...")
+    admission.draining = False
+    await init_http_client()
+    warm_up_prompts()
+    app.openapi()
+    # Independent network round trips; the slowest one bounds startup.
+    await asyncio.gather(
+        init_db(),
+        warm_up_http_client(f"{settings.GEMINI_API_BASE_URL}/models", settings.LLM_WARMUP_CONNECTIONS),
+        _load_prewarmed_responses()
+    )
+    if settings.HISTORY_WRITE_BEHIND:
+        await history_writer.start()
+    if settings.JOBS_ENABLED:
+        await job_workers.start()
+    lifecycle.mark_started(time.monotonic() - started)
+    logger.info(f"Application startup complete in {lifecycle.startup_seconds:.2f}s.")
+    lifecycle.install_signal_handlers(settings.SHUTDOWN_READY_DELAY)
+    yield
+    lifecycle.restore_signal_handlers()
+    logger.info("Application shutdown: Draining in-flight queries...")
+    drain_started = time.monotonic()
+    if not await admission.drain(settings.SHUTDOWN_DRAIN_TIMEOUT):
+        logger.warning(f"{admission.in_flight} queries were still in flight after {settings.SHUTDOWN_DRAIN_TIMEOUT}s.")
+    if settings.JOBS_ENABLED:
+        logger.info("Application shutdown: Stopping job workers...")
+        await job_workers.stop(max(0.0, settings.SHUTDOWN_DRAIN_TIMEOUT - (time.monotonic() - drain_started)))
+    if settings.HISTORY_WRITE_BEHIND:
+        logger.info("Application shutdown: Flushing pending query history...")
+        await history_writer.stop()
+    logger.info("Application shutdown: Closing LLM HTTP client...")
+    await close_http_client()
+    shutdown_logging()
+
+
 app = FastAPI(
     title="Interactive Q&A System Backend",
     description="""
@@ -18,7 +89,9 @@ app = FastAPI(
     """,
     version="1.0.0",
     redoc_url="/redoc",
-    docs_url="/docs"
+    docs_url="/docs",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 origins = [
@@ -43,26 +116,74 @@ app.add_middleware(
 
 
 app.include_router(qna.router, tags=["Q&A"], prefix="/api/v1")
+app.include_router(jobs.router, tags=["Jobs"], prefix="/api/v1")
+
+register_default_collectors()
 
 
-@app.on_event("startup")
-async def startup_event():
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
     """
-    Event handler to initialize the database connection pool on application startup.
+    Gives each request an ID and a correlation ID (taken from X-Correlation-ID when the caller sends one),
+    attaches both to every log record written while handling it and echoes them as response headers.
     """
-    logger.info("Application startup: Initializing database...")
-    await init_db()
-    logger.info("Database initialized.")
+    request_id = uuid.uuid4().hex
+    correlation_id = request.headers.get("x-correlation-id", "")[:128] or request_id
+    request_token = request_id_var.set(request_id)
+    correlation_token = correlation_id_var.set(correlation_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(request_token)
+        correlation_id_var.reset(correlation_token)
+    response.headers["X-Request-ID"] = request_id
+    response.headers["X-Correlation-ID"] = correlation_id
+    return response
+
+
+@app.middleware("http")
+async def server_timing_middleware(request: Request, call_next):
+    """
+    Adds a Server-Timing header with per-stage durations when the client sends X-Server-Timing: 1.
+    """
+    if not (settings.SERVER_TIMING_ENABLED and settings.METRICS_ENABLED and request.headers.get("x-server-timing") == "1"):
+        return await call_next(request)
+    timings = start_server_timing()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = format_server_timing(timings)
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """
+    Exposes metrics in the Prometheus text format.
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled.")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 
 @app.get("/health", status_code=status.HTTP_200_OK)
 async def health_check():
     """
-    Health check endpoint to verify the backend service is running.
+    Liveness check: the process is up and serving requests. Use /ready to decide where to send traffic.
     """
     return {"status": "ok", "message": "Backend is healthy and running."}
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness check: 200 once startup has finished and the database and LLM client are usable,
+    503 while starting, draining for shutdown or when a dependency check fails.
+    """
+    ready, checks = await lifecycle.readiness()
+    return ORJSONResponse(
+        {"status": "ready" if ready else "not_ready", "checks": checks, "startup_seconds": round(lifecycle.startup_seconds, 3)},
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
 @app.get("/")
 async def read_root():
     """
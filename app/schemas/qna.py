@@ -2,6 +2,7 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
+from uuid import UUID
 
 class QueryRequest(BaseModel):
     """
@@ -35,17 +36,49 @@ class QueryResponse(BaseModel):
     session_id: str = Field(..., description="The ID for the current conversation session.")
     user_id: str = Field(..., description="The user ID associated with this query.")
     timestamp: datetime = Field(..., description="Timestamp of the query.")
+    cached: bool = Field(False, description="True if the response was served from the response cache.")
+
+
+class BatchQueryRequest(BaseModel):
+    """
+    Schema for a batch of user queries answered in one request.
+    """
+    items: List[QueryRequest] = Field(..., min_length=1, description="The queries to answer.")
+
+class BatchQueryError(BaseModel):
+    """
+    Schema for the error of a single failed item in a batch.
+    """
+    status_code: int = Field(..., description="HTTP status code the item would have failed with on /query.")
+    detail: str = Field(..., description="Description of the error.")
+
+class BatchQueryItemResult(BaseModel):
+    """
+    Schema for the result of a single item in a batch. Exactly one of response and error is set.
+    """
+    index: int = Field(..., description="Position of the item in the request.")
+    response: Optional[QueryResponse] = Field(None, description="The answer, if the item succeeded.")
+    error: Optional[BatchQueryError] = Field(None, description="The error, if the item failed.")
+
+class BatchQueryResponse(BaseModel):
+    """
+    Schema for the API's response to a batch of queries, in request order.
+    """
+    results: List[BatchQueryItemResult] = Field(..., description="Per-item results in the order of the request.")
 
 
 class HistoryItem(BaseModel):
     """
     Schema for a single item in the query history.
     """
+    id: Optional[UUID] = Field(None, description="The ID of the history entry.")
     query: str = Field(..., description="The original query.")
     ai_response: str = Field(..., description="The AI-generated response.")
+    structured_data: Optional[LLMResponseContent] = Field(None, description="Structured data from the AI response, if it had any.")
     session_id: str = Field(..., description="The session ID for this conversation.")
     user_id: str = Field(..., description="The user ID associated with this query.")
     timestamp: datetime = Field(..., description="Timestamp of the query.")
+    truncated: bool = Field(False, description="True if ai_response is a shortened preview.")
 
 class QueryHistoryResponse(BaseModel):
     """
@@ -53,4 +86,37 @@ class QueryHistoryResponse(BaseModel):
     """
     history: List[HistoryItem] = Field(..., description="List of previous queries and their responses.")
     user_id: str = Field(..., description="The user ID for which the history is retrieved.")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, or null if this is the last page.")
+
+
+class HistorySearchHit(BaseModel):
+    """
+    Schema for a single full-text search match in the query history.
+    """
+    id: UUID = Field(..., description="The ID of the history entry.")
+    query: str = Field(..., description="The original query, with matching terms highlighted.")
+    snippet: str = Field(..., description="Highlighted excerpt of the AI response around the matching terms.")
+    session_id: str = Field(..., description="The session ID for this conversation.")
+    timestamp: datetime = Field(..., description="Timestamp of the query.")
+    rank: float = Field(..., description="Relevance score; higher is more relevant.")
+
+class HistorySearchResponse(BaseModel):
+    """
+    Schema for the response to a query history search.
+    """
+    results: List[HistorySearchHit] = Field(..., description="Matches ordered by relevance.")
+    user_id: str = Field(..., description="The user ID whose history was searched.")
+    q: str = Field(..., description="The search text.")
+    next_offset: Optional[int] = Field(None, description="Offset for the next page, or null if this is the last page.")
 
+class JobResponse(BaseModel):
+    """
+    Schema for the state of an asynchronous query job.
+    """
+    job_id: UUID = Field(..., description="The ID of the job.")
+    status: str = Field(..., description="pending, running, succeeded or failed.")
+    attempts: int = Field(0, description="How many times a worker has started the job.")
+    created_at: datetime = Field(..., description="When the job was submitted.")
+    finished_at: Optional[datetime] = Field(None, description="When the job succeeded or failed.")
+    result: Optional[QueryResponse] = Field(None, description="The answer, once the job has succeeded.")
+    error: Optional[str] = Field(None, description="The last error, if an attempt failed.")
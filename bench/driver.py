@@ -0,0 +1,176 @@
+"""
+Closed-loop load driver for the Q&A API.
+
+Keeps a fixed number of requests in flight against one scenario for a fixed
+duration and reports throughput, latency percentiles and error rates:
+
+    python -m bench.driver --base-url http://127.0.0.1:8000 --scenario query --concurrency 1 8 32 --duration 20
+"""
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+
+import httpx
+
+QUESTIONS = [
+    "What travel documents do I need from Kenya to Ireland?",
+    "Do I need a visa to travel from Nigeria to the United Kingdom?",
+    "What documents are required for travel from India to Germany?",
+    "Which vaccinations are needed to travel from Brazil to Kenya?",
+    "What are the passport requirements for travel from the USA to Japan?",
+    "What visa documents do I need for travel from Ghana to Canada?",
+    "How long must my passport be valid to travel to the Schengen area?",
+    "What documents does a student need for travel from Kenya to Australia?",
+]
+
+
+@dataclass
+class LevelResult:
+    scenario: str
+    concurrency: int
+    duration_seconds: float
+    requests: int
+    errors: int
+    error_rate: float
+    requests_per_second: float
+    latency_ms: Dict[str, float]
+    status_codes: Dict[str, int] = field(default_factory=dict)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(scenario: str, concurrency: int, elapsed: float, samples: List[Tuple[float, str]]) -> LevelResult:
+    latencies = sorted(latency for latency, _ in samples)
+    status_codes: Dict[str, int] = {}
+    for _, code in samples:
+        status_codes[code] = status_codes.get(code, 0) + 1
+    errors = sum(count for code, count in status_codes.items() if not code.startswith("2"))
+    return LevelResult(
+        scenario=scenario,
+        concurrency=concurrency,
+        duration_seconds=round(elapsed, 3),
+        requests=len(samples),
+        errors=errors,
+        error_rate=round(errors / len(samples), 4) if samples else 0.0,
+        requests_per_second=round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        latency_ms={
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        status_codes=status_codes,
+    )
+
+
+RequestFactory = Callable[[random.Random], Tuple[str, str, Optional[dict]]]
+
+
+def query_scenario(users: int, unique_ratio: float) -> RequestFactory:
+    """
+    POST /api/v1/query. unique_ratio is the fraction of questions made unique, so they miss every cache.
+    """
+    def make(rng: random.Random):
+        question = rng.choice(QUESTIONS)
+        if rng.random() < unique_ratio:
+            question = f"{question} (trip {rng.randrange(10**9)})"
+        return "POST", "/api/v1/query", {"query": question, "user_id": f"bench-user-{rng.randrange(users)}"}
+    return make
+
+
+def history_scenario(users: int, limit: Optional[int]) -> RequestFactory:
+    """
+    GET /api/v1/history/{user_id}.
+    """
+    def make(rng: random.Random):
+        path = f"/api/v1/history/bench-user-{rng.randrange(users)}"
+        if limit:
+            path += f"?limit={limit}"
+        return "GET", path, None
+    return make
+
+
+async def seed_history(client: httpx.AsyncClient, users: int, per_user: int, concurrency: int = 16) -> None:
+    """
+    Creates history rows through the API so the history scenario has something to read.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    rng = random.Random(1)
+
+    async def one(user: int, index: int):
+        async with semaphore:
+            await client.post("/api/v1/query", json={"query": f"{rng.choice(QUESTIONS)} #{index}", "user_id": f"bench-user-{user}"})
+
+    await asyncio.gather(*(one(user, index) for user in range(users) for index in range(per_user)))
+
+
+async def run_level(client: httpx.AsyncClient, scenario: str, factory: RequestFactory, concurrency: int, duration: float, seed: int = 0) -> LevelResult:
+    samples: List[Tuple[float, str]] = []
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int):
+        rng = random.Random(seed * 10007 + worker_id)
+        while time.perf_counter() < deadline:
+            method, path, body = factory(rng)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                code = str(response.status_code)
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+            samples.append((time.perf_counter() - started, code))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return summarize(scenario, concurrency, time.perf_counter() - started, samples)
+
+
+async def run_levels(base_url: str, scenario: str, factory: RequestFactory, levels: List[int], duration: float, timeout: float = 120.0) -> List[LevelResult]:
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for concurrency in levels:
+            result = await run_level(client, scenario, factory, concurrency, duration)
+            print(format_result(result))
+            results.append(result)
+    return results
+
+
+def format_result(result: LevelResult) -> str:
+    latency = result.latency_ms
+    return (f"{result.scenario:<8} c={result.concurrency:<4} req={result.requests:<6} rps={result.requests_per_second:<9} "
+            f"p50={latency['p50']:<9} p95={latency['p95']:<9} p99={latency['p99']:<9} err={result.error_rate:.2%}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Drive load against a running API.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=["query", "history"], default="query")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--unique-ratio", type=float, default=1.0)
+    parser.add_argument("--history-limit", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.scenario == "query":
+        factory = query_scenario(args.users, args.unique_ratio)
+    else:
+        factory = history_scenario(args.users, args.history_limit)
+    results = asyncio.run(run_levels(args.base_url, args.scenario, factory, args.concurrency, args.duration))
+    print(json.dumps([asdict(result) for result in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Local stand-in for the Gemini generateContent / streamGenerateContent endpoints.
+
+Latency, error injection and response size are configurable so the API can be
+benchmarked without a network connection or an API key:
+
+    python -m bench.fake_gemini --port 8001 --latency-ms 800 --distribution lognormal --rate-429 0.02
+"""
+from dataclasses import dataclass
+from typing import Any, Dict
+import argparse
+import asyncio
+import json
+import math
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+
+@dataclass
+class FakeGeminiConfig:
+    latency_ms: float = 800.0
+    distribution: str = "lognormal"
+    sigma: float = 0.5
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    retry_after: float = 1.0
+    response_bytes: int = 1500
+    stream_chunks: int = 10
+    seed: int = 0
+
+
+def sample_latency(config: FakeGeminiConfig, rng: random.Random) -> float:
+    """
+    Returns a latency in seconds. latency_ms is the median for every distribution.
+    """
+    median = config.latency_ms / 1000.0
+    if config.distribution == "fixed":
+        return median
+    if config.distribution == "uniform":
+        return rng.uniform(median * (1 - config.sigma), median * (1 + config.sigma))
+    if config.distribution == "lognormal":
+        return rng.lognormvariate(math.log(median), config.sigma) if median > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {config.distribution}")
+
+
+def build_answer(prompt: str, size: int) -> Dict[str, Any]:
+    """
+    Builds a structured answer of roughly `size` bytes once serialized.
+    """
+    item = "Valid passport with at least six months of validity and two blank pages."
+    items_needed = max(1, size // (len(item) * 4 + 16))
+    return {
+        "required_visa_documentation": [item] * items_needed,
+        "passport_requirements": [item] * items_needed,
+        "additional_necessary_documents": [item] * items_needed,
+        "relevant_travel_advisories": [item] * items_needed,
+        "general_response": f"Benchmark answer for a prompt of {len(prompt)} characters.",
+    }
+
+
+def _usage(prompt: str, answer_text: str) -> Dict[str, int]:
+    prompt_tokens = len(prompt) // 4
+    answer_tokens = len(answer_text) // 4
+    return {"promptTokenCount": prompt_tokens, "candidatesTokenCount": answer_tokens, "totalTokenCount": prompt_tokens + answer_tokens}
+
+
+def _candidate(text: str) -> Dict[str, Any]:
+    return {"content": {"role": "model", "parts": [{"text": text}]}}
+
+
+def create_app(config: FakeGeminiConfig) -> FastAPI:
+    app = FastAPI(title="Fake Gemini")
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "429": 0, "5xx": 0}
+
+    def injected_error():
+        roll = rng.random()
+        if roll < config.rate_429:
+            stats["429"] += 1
+            return JSONResponse({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}, status_code=429,
+                                headers={"Retry-After": str(config.retry_after)})
+        if roll < config.rate_429 + config.rate_5xx:
+            stats["5xx"] += 1
+            return JSONResponse({"error": {"code": 503, "status": "UNAVAILABLE"}}, status_code=503)
+        return None
+
+    @app.post("/v1beta/models/{model_method}")
+    async def generate(model_method: str, request: Request):
+        stats["requests"] += 1
+        body = await request.json()
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+        latency = sample_latency(config, rng)
+
+        error = injected_error()
+        if error is not None:
+            await asyncio.sleep(latency / 10)
+            return error
+
+        answer_text = json.dumps(build_answer(prompt, config.response_bytes))
+
+        if model_method.endswith(":streamGenerateContent"):
+            async def chunks():
+                chunk_size = max(1, math.ceil(len(answer_text) / config.stream_chunks))
+                for start in range(0, len(answer_text), chunk_size):
+                    await asyncio.sleep(latency / config.stream_chunks)
+                    chunk = {"candidates": [_candidate(answer_text[start:start + chunk_size])],
+                             "usageMetadata": _usage(prompt, answer_text[:start + chunk_size])}
+                    yield f"data: {json.dumps(chunk)}\r\n\r\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency)
+        return {"candidates": [_candidate(answer_text)], "usageMetadata": _usage(prompt, answer_text)}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run a local fake Gemini API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=FakeGeminiConfig.latency_ms, help="Median upstream latency.")
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default=FakeGeminiConfig.distribution)
+    parser.add_argument("--sigma", type=float, default=FakeGeminiConfig.sigma, help="Spread of the latency distribution.")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fraction of requests answered with 503.")
+    parser.add_argument("--retry-after", type=float, default=FakeGeminiConfig.retry_after, help="Retry-After sent with 429s.")
+    parser.add_argument("--response-bytes", type=int, default=FakeGeminiConfig.response_bytes, help="Approximate answer size.")
+    parser.add_argument("--stream-chunks", type=int, default=FakeGeminiConfig.stream_chunks)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    config = FakeGeminiConfig(
+        latency_ms=args.latency_ms,
+        distribution=args.distribution,
+        sigma=args.sigma,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        retry_after=args.retry_after,
+        response_bytes=args.response_bytes,
+        stream_chunks=args.stream_chunks,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
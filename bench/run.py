@@ -0,0 +1,158 @@
+"""
+End-to-end benchmark: starts the fake Gemini server and the API against a local
+database, drives /api/v1/query and /api/v1/history/{user_id} at fixed concurrency
+levels and writes a JSON report.
+
+    python -m bench.run --label baseline
+    python -m bench.run --label my-change --baseline bench/results/baseline.json --max-regression 10
+
+Extra app settings can be passed with --app-env KEY=VALUE (e.g. HISTORY_WRITE_BEHIND=true).
+"""
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.db_profile import DEFAULT_SQLITE_URL, app_environment, prepare_database
+from bench.driver import history_scenario, query_scenario, run_levels, seed_history
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout} seconds.")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline: List[Dict], max_regression: float) -> List[str]:
+    """
+    Compares throughput and p95 latency per (scenario, concurrency) with a baseline report.
+    Returns the regressions larger than max_regression percent.
+    """
+    regressions = []
+    previous = {(row["scenario"], row["concurrency"]): row for row in baseline}
+    for row in results:
+        before = previous.get((row["scenario"], row["concurrency"]))
+        if before is None:
+            continue
+        rps_change = (row["requests_per_second"] - before["requests_per_second"]) / before["requests_per_second"] * 100 if before["requests_per_second"] else 0.0
+        p95_change = (row["latency_ms"]["p95"] - before["latency_ms"]["p95"]) / before["latency_ms"]["p95"] * 100 if before["latency_ms"]["p95"] else 0.0
+        print(f"{row['scenario']:<8} c={row['concurrency']:<4} rps {rps_change:+.1f}%  p95 {p95_change:+.1f}%")
+        if rps_change < -max_regression:
+            regressions.append(f"{row['scenario']} c={row['concurrency']}: throughput {rps_change:+.1f}%")
+        if p95_change > max_regression:
+            regressions.append(f"{row['scenario']} c={row['concurrency']}: p95 latency {p95_change:+.1f}%")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the API benchmark suite.")
+    parser.add_argument("--label", default=datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+    parser.add_argument("--database-url", default=DEFAULT_SQLITE_URL)
+    parser.add_argument("--app-port", type=int, default=8000)
+    parser.add_argument("--fake-port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per concurrency level.")
+    parser.add_argument("--scenarios", nargs="+", choices=["query", "history"], default=["query", "history"])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--unique-ratio", type=float, default=1.0, help="Fraction of queries that miss every cache.")
+    parser.add_argument("--history-per-user", type=int, default=20)
+    parser.add_argument("--history-limit", type=int, default=None)
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--distribution", default="lognormal")
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--response-bytes", type=int, default=1500)
+    parser.add_argument("--app-env", nargs="*", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--output", default=None, help="Report path (default: bench/results/<label>.json).")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against.")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="Percent change that fails the comparison.")
+    args = parser.parse_args(argv)
+
+    asyncio.run(prepare_database(args.database_url, reset=True))
+
+    fake_cmd = [sys.executable, "-m", "bench.fake_gemini", "--port", str(args.fake_port),
+                "--latency-ms", str(args.latency_ms), "--distribution", args.distribution, "--sigma", str(args.sigma),
+                "--rate-429", str(args.rate_429), "--rate-5xx", str(args.rate_5xx), "--response-bytes", str(args.response_bytes)]
+    app_env = dict(os.environ)
+    app_env.update({
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_API_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1beta",
+    })
+    app_env.update(app_environment(args.database_url))
+    app_env.update(dict(item.split("=", 1) for item in args.app_env))
+    app_cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.app_port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+
+    fake = subprocess.Popen(fake_cmd)
+    app = subprocess.Popen(app_cmd, env=app_env)
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    results = []
+    try:
+        _wait_until_up(f"http://127.0.0.1:{args.fake_port}/stats")
+        _wait_until_up(f"{base_url}/ready")
+
+        if "query" in args.scenarios:
+            results += asyncio.run(run_levels(base_url, "query", query_scenario(args.users, args.unique_ratio), args.concurrency, args.duration))
+        if "history" in args.scenarios:
+            async def seed():
+                async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+                    await seed_history(client, args.users, args.history_per_user)
+            asyncio.run(seed())
+            results += asyncio.run(run_levels(base_url, "history", history_scenario(args.users, args.history_limit), args.concurrency, args.duration))
+    finally:
+        app.terminate()
+        fake.terminate()
+        app.wait(timeout=30)
+        fake.wait(timeout=30)
+
+    report = {
+        "label": args.label,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": [asdict(result) for result in results],
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.label}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"Report written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(report["results"], json.load(baseline_file)["results"], args.max_regression)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
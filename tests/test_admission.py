@@ -0,0 +1,200 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.services import admission as admission_module
+from app.api.services.admission import (
+    AdmissionController, SlidingWindowQuota, PRIORITY_CACHED, PRIORITY_CHEAP, PRIORITY_FULL, quota_key
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_quota_allows_up_to_the_limit_per_window(clock):
+    quota = SlidingWindowQuota(limit=3, window=60)
+    assert [quota.hit("alice") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert quota.hit("alice") == pytest.approx(60)
+    assert quota.hit("bob") == 0.0
+
+
+def test_quota_window_slides(clock):
+    quota = SlidingWindowQuota(limit=2, window=60)
+    quota.hit("alice")
+    clock[0] += 30
+    quota.hit("alice")
+
+    assert quota.hit("alice") == pytest.approx(30)
+    clock[0] += 30
+    assert quota.hit("alice") == 0.0
+    assert quota.hit("alice") == pytest.approx(30)
+
+
+def test_rejected_hits_are_not_recorded(clock):
+    quota = SlidingWindowQuota(limit=1, window=10)
+    quota.hit("alice")
+    for _ in range(5):
+        quota.hit("alice")
+    clock[0] += 10
+    assert quota.hit("alice") == 0.0
+
+
+def test_quota_cost_counts_several_requests(clock):
+    quota = SlidingWindowQuota(limit=5, window=60)
+    assert quota.hit("alice", cost=4) == 0.0
+    assert quota.hit("alice", cost=2) == pytest.approx(60)
+    assert quota.hit("alice", cost=1) == 0.0
+    assert quota.hit("bob", cost=6) == 60
+
+
+def test_quota_tracks_only_the_most_recent_keys(clock):
+    quota = SlidingWindowQuota(limit=1, window=60, max_keys=2)
+    quota.hit("a")
+    quota.hit("b")
+    quota.hit("c")
+    assert quota.tracked_keys() == 2
+    assert quota.hit("a") == 0.0
+
+
+def test_quota_key_falls_back_to_the_client_address():
+    assert quota_key("alice", "10.0.0.1") == "alice"
+    assert quota_key(None, "10.0.0.1") == "ip:10.0.0.1"
+    assert quota_key("", None) == "ip:unknown"
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=1.0)
+        order = []
+        await controller.acquire()
+
+        async def wait(name, priority):
+            await controller.acquire(priority)
+            order.append(name)
+            controller.release()
+
+        waiters = [
+            asyncio.ensure_future(wait("full", PRIORITY_FULL)),
+            asyncio.ensure_future(wait("cheap-1", PRIORITY_CHEAP)),
+            asyncio.ensure_future(wait("cached", PRIORITY_CACHED)),
+            asyncio.ensure_future(wait("cheap-2", PRIORITY_CHEAP)),
+        ]
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(*waiters)
+        return controller, order
+
+    controller, order = asyncio.run(scenario())
+    assert order == ["cached", "cheap-1", "cheap-2", "full"]
+    assert controller.in_flight == 0
+    assert controller.admitted == 5
+
+
+def test_full_queue_is_shed_with_503():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=1.0)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await controller.acquire()
+        controller.release()
+        await waiter
+        controller.release()
+        return controller, rejected.value
+
+    controller, rejected = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert "Retry-After" in rejected.headers
+    assert controller.shed["queue_full"] == 1
+    assert controller.in_flight == 0
+
+
+def test_waiter_is_shed_after_the_queue_timeout():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=0.01)
+        await controller.acquire()
+        with pytest.raises(HTTPException):
+            await controller.acquire()
+        controller.release()
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.shed["deadline"] == 1
+    assert controller.waiting == 0
+    assert controller.in_flight == 0
+
+
+def test_cancelled_waiter_does_not_take_a_slot():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=1.0)
+        await controller.acquire()
+        gone = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+
+        controller.release()
+        await controller.acquire()
+        controller.release()
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.waiting == 0
+    assert controller.in_flight == 0
+
+
+def test_slot_handed_to_a_waiter_that_is_cancelled_is_released():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=1.0)
+        await controller.acquire()
+
+        async def query():
+            async with controller.admit():
+                await asyncio.sleep(0)
+
+        waiter = asyncio.ensure_future(query())
+        await asyncio.sleep(0)
+        controller.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller.in_flight == 0
+
+
+def test_draining_rejects_new_queries_and_waits_for_admitted_ones():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=4, max_queue=10, queue_timeout=1.0, enabled=False)
+
+        async def query():
+            async with controller.admit():
+                await asyncio.sleep(0.05)
+
+        running = asyncio.ensure_future(query())
+        await asyncio.sleep(0)
+        assert controller.in_flight == 1
+        drained = await controller.drain(timeout=1.0)
+        with pytest.raises(HTTPException):
+            await controller.acquire()
+        await running
+        return controller, drained
+
+    controller, drained = asyncio.run(scenario())
+    assert drained
+    assert controller.shed["draining"] == 1
+
+
+def test_drain_gives_up_after_the_timeout():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=1.0)
+        await controller.acquire()
+        return await controller.drain(timeout=0.05)
+
+    assert asyncio.run(scenario()) is False
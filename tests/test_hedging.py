@@ -0,0 +1,228 @@
+import asyncio
+
+import pytest
+
+from app.api.services.hedging import HedgedRequests
+
+
+def make_hedger(budget=1.0, min_samples=3, min_delay=0.01, window=10):
+    return HedgedRequests(enabled=True, quantile=0.9, min_delay=min_delay, budget=budget,
+                          window=window, min_samples=min_samples)
+
+
+def prime(hedger, latency=0.01, key="model"):
+    for _ in range(hedger.min_samples):
+        hedger._record(key, latency)
+
+
+class Upstream:
+    """
+    Fake upstream whose calls take the given times in order, after an optional wait for a local slot.
+    """
+
+    def __init__(self, latencies, queue_wait=0.0):
+        self.latencies = list(latencies)
+        self.queue_wait = queue_wait
+        self.started = 0
+
+    async def request(self, sent):
+        index = self.started
+        self.started += 1
+        await asyncio.sleep(self.queue_wait)
+        sent.set()
+        latency = self.latencies[index]
+        await asyncio.sleep(latency)
+        return index, latency
+
+
+def send(hedger, upstream, **options):
+    return asyncio.run(hedger.send("model", upstream.request, is_failure=lambda result: False,
+                                   latency=lambda result: result[1], **options))
+
+
+def test_threshold_needs_min_samples_and_respects_min_delay():
+    hedger = make_hedger(min_samples=3, min_delay=0.5)
+    hedger._record("model", 0.1)
+    hedger._record("model", 0.2)
+    assert hedger.threshold("model") is None
+
+    hedger._record("model", 0.3)
+    assert hedger.threshold("model") == 0.5
+    for _ in range(10):
+        hedger._record("model", 2.0)
+    assert hedger.threshold("model") == 2.0
+
+
+def test_latency_window_is_bounded():
+    hedger = make_hedger(window=3)
+    for latency in (9.0, 1.0, 1.0, 1.0):
+        hedger._record("model", latency)
+    assert hedger.threshold("model") == 1.0
+
+
+def test_disabled_hedger_runs_the_request_once():
+    hedger = HedgedRequests(enabled=False, quantile=0.9, min_delay=0.01, budget=1.0, window=10, min_samples=1)
+    upstream = Upstream([0.02])
+    assert send(hedger, upstream) == (0, 0.02)
+    assert upstream.started == 1
+    assert hedger.calls == 0
+
+
+def test_slow_call_is_hedged_and_the_hedge_wins():
+    hedger = make_hedger()
+    prime(hedger)
+    upstream = Upstream([0.5, 0.01])
+
+    assert send(hedger, upstream) == (1, 0.01)
+    assert upstream.started == 2
+    assert hedger.hedged == 1
+    assert hedger.hedge_wins == 1
+    assert hedger.latency_saved >= 0
+
+
+def test_fast_call_is_not_hedged_and_its_upstream_latency_is_recorded():
+    hedger = make_hedger()
+    prime(hedger, latency=0.2)
+    upstream = Upstream([0.01])
+
+    send(hedger, upstream)
+    assert upstream.started == 1
+    assert hedger._latencies["model"][-1] == 0.01
+
+
+def test_time_waiting_for_a_slot_does_not_trigger_a_hedge():
+    hedger = make_hedger()
+    prime(hedger, latency=0.05)
+    upstream = Upstream([0.01], queue_wait=0.2)
+
+    send(hedger, upstream)
+    assert upstream.started == 1
+    assert hedger.hedged == 0
+    assert hedger._latencies["model"][-1] == 0.01
+
+
+def test_no_hedge_without_spare_capacity():
+    hedger = make_hedger()
+    prime(hedger)
+    upstream = Upstream([0.1, 0.01])
+
+    assert send(hedger, upstream, has_capacity=lambda: False) == (0, 0.1)
+    assert upstream.started == 1
+    assert hedger.saturated == 1
+    assert hedger.hedged == 0
+
+
+def test_budget_limits_hedges_to_a_fraction_of_calls():
+    hedger = make_hedger(budget=0.5)
+    prime(hedger)
+
+    first = Upstream([0.1, 0.01])
+    send(hedger, first)
+    assert first.started == 1
+    assert hedger.budget_denied == 1
+
+    second = Upstream([0.1, 0.01])
+    send(hedger, second)
+    assert second.started == 2
+    assert hedger.hedged == 1
+    assert hedger.stats()["hedge_rate"] == 0.5
+
+
+def test_saved_credits_are_capped():
+    hedger = make_hedger(budget=0.5, window=2)
+    prime(hedger, latency=1.0)
+    for _ in range(10):
+        send(hedger, Upstream([0.01]))
+    assert hedger._credits == pytest.approx(hedger._max_credits)
+    assert hedger._max_credits == 2.0
+
+
+def test_failed_result_loses_to_a_usable_one():
+    hedger = make_hedger()
+    prime(hedger)
+
+    calls = 0
+
+    async def request(sent):
+        nonlocal calls
+        calls += 1
+        sent.set()
+        if calls == 1:
+            await asyncio.sleep(0.05)
+            return "failed", 0.05
+        await asyncio.sleep(0.1)
+        return "ok", 0.1
+
+    result = asyncio.run(hedger.send("model", request, is_failure=lambda result: result[0] == "failed",
+                                     latency=lambda result: result[1]))
+    assert result == ("ok", 0.1)
+
+
+def test_when_both_fail_the_primary_result_is_returned():
+    hedger = make_hedger()
+    prime(hedger)
+    calls = 0
+
+    async def request(sent):
+        nonlocal calls
+        calls += 1
+        index = calls
+        sent.set()
+        await asyncio.sleep(0.05 if index == 1 else 0.02)
+        return index, 0.0
+
+    result = asyncio.run(hedger.send("model", request, is_failure=lambda result: True, latency=lambda result: result[1]))
+    assert calls == 2
+    assert result == (1, 0.0)
+
+
+def test_when_the_primary_raises_a_failed_result_is_preferred():
+    hedger = make_hedger()
+    prime(hedger)
+    calls = 0
+
+    async def request(sent):
+        nonlocal calls
+        calls += 1
+        index = calls
+        sent.set()
+        await asyncio.sleep(0.05)
+        if index == 1:
+            raise ConnectionError("reset")
+        return "failed", 0.05
+
+    result = asyncio.run(hedger.send("model", request, is_failure=lambda result: True, latency=lambda result: result[1]))
+    assert result == ("failed", 0.05)
+
+
+def test_primary_exception_is_raised_when_every_request_raises():
+    hedger = make_hedger(min_samples=100)
+
+    async def request(sent):
+        sent.set()
+        raise ConnectionError("reset")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(hedger.send("model", request, is_failure=lambda result: False, latency=lambda result: 0.0))
+
+
+def test_losing_request_is_cancelled():
+    hedger = make_hedger()
+    prime(hedger)
+    cancelled = []
+    calls = 0
+
+    async def request(sent):
+        nonlocal calls
+        calls += 1
+        index = calls
+        sent.set()
+        try:
+            await asyncio.sleep(1.0 if index == 1 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        return index, 0.01
+
+    assert asyncio.run(hedger.send("model", request, is_failure=lambda result: False, latency=lambda result: result[1]))[0] == 2
+    assert cancelled == [1]
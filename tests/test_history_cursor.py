@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+import uuid
+
+import pytest
+
+from app.crud.query import encode_history_cursor, decode_history_cursor
+
+
+def test_cursor_round_trip_keeps_timestamp_and_id():
+    timestamp = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    row_id = uuid.uuid4()
+    assert decode_history_cursor(encode_history_cursor(timestamp, row_id)) == (timestamp, row_id)
+
+
+def test_cursor_round_trip_keeps_naive_timestamps_naive():
+    timestamp = datetime(2026, 3, 1, 12, 30)
+    decoded, _ = decode_history_cursor(encode_history_cursor(timestamp, uuid.uuid4()))
+    assert decoded == timestamp
+    assert decoded.tzinfo is None
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_history_cursor(datetime.now(timezone.utc), uuid.uuid4())
+    assert all(char.isalnum() or char in "-_=" for char in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bm8tc2VwYXJhdG9y", "MjAyNi0wMy0wMXxub3QtYS11dWlk", "é"])
+def test_malformed_cursors_raise_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_history_cursor(cursor)
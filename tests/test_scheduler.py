@@ -0,0 +1,172 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.services import scheduler
+from app.api.services.scheduler import CircuitBreaker, TokenBucket, UpstreamScheduler, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(scheduler.time, "monotonic", fake)
+    return fake
+
+
+def test_token_bucket_starts_full_and_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    for _ in range(3):
+        asyncio.run(bucket.acquire())
+    assert bucket.tokens == pytest.approx(0)
+
+    clock.now += 1.0
+    assert bucket.tokens == pytest.approx(2)
+    clock.now += 10.0
+    assert bucket.tokens == pytest.approx(3)
+
+
+def test_token_bucket_waits_for_the_next_token():
+    async def scenario():
+        bucket = TokenBucket(rate=50.0, capacity=1)
+        await bucket.acquire()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await bucket.acquire()
+        return loop.time() - started
+
+    assert asyncio.run(scenario()) >= 0.015
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+    assert breaker.retry_after() == pytest.approx(10)
+
+
+def test_breaker_lets_one_probe_through_after_the_reset_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+    assert not breaker.allow()
+
+
+def test_lost_probe_is_replaced_after_the_reset_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+
+    clock.now += 5
+    assert not breaker.allow()
+    clock.now += 6
+    assert breaker.allow()
+
+
+def test_parse_retry_after_accepts_seconds_and_dates():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after("soon") is None
+
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert parse_retry_after(format_datetime(retry_at, usegmt=True)) == pytest.approx(30, abs=2)
+
+
+def make_scheduler(max_concurrency=1, queue_timeout=1.0, breaker=None):
+    return UpstreamScheduler(
+        requests_per_minute=0,
+        burst=1,
+        max_concurrency=max_concurrency,
+        queue_timeout=queue_timeout,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        breaker=breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    )
+
+
+def test_backoff_never_undercuts_retry_after():
+    upstream = make_scheduler()
+    for attempt in range(6):
+        assert 0 <= upstream.backoff_delay(attempt) <= 8.0
+    assert upstream.backoff_delay(0, retry_after=20) == 20
+
+
+def test_slot_rejects_with_503_when_the_queue_times_out():
+    async def scenario():
+        upstream = make_scheduler(max_concurrency=1, queue_timeout=0.01)
+        async with upstream.slot():
+            assert not upstream.has_capacity()
+            with pytest.raises(HTTPException) as rejected:
+                async with upstream.slot():
+                    pass
+        return upstream, rejected.value
+
+    upstream, rejected = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    assert upstream.timed_out == 1
+    assert upstream.in_flight == 0
+    assert upstream.has_capacity()
+
+
+def test_slot_rejects_while_the_breaker_is_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    upstream = make_scheduler(breaker=breaker)
+
+    async def scenario():
+        async with upstream.slot():
+            pass
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(scenario())
+    assert rejected.value.status_code == 503
+
+
+def test_pause_removes_capacity_until_it_ends(clock):
+    upstream = make_scheduler()
+    upstream.pause(5)
+    assert not upstream.has_capacity()
+    clock.now += 5
+    assert upstream.has_capacity()
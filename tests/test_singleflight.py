@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from app.api.services.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        executions = 0
+
+        async def fetch():
+            nonlocal executions
+            executions += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+        return flight, executions, results
+
+    flight, executions, results = asyncio.run(scenario())
+    assert results == ["answer"] * 5
+    assert executions == 1
+    assert flight.stats() == {"in_flight": 0, "calls": 5, "executions": 1, "collapsed": 4, "abandoned": 0}
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fetch(value):
+            await asyncio.sleep(0)
+            return value
+
+        return flight, await asyncio.gather(flight.do("a", lambda: fetch(1)), flight.do("b", lambda: fetch(2)))
+
+    flight, results = asyncio.run(scenario())
+    assert results == [1, 2]
+    assert flight.executions == 2
+
+
+def test_exception_reaches_every_caller():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        return await asyncio.gather(flight.do("key", fetch), flight.do("key", fetch), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+
+
+def test_cancelling_the_first_caller_keeps_the_call_for_others():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "answer"
+
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return flight, await second
+
+    flight, result = asyncio.run(scenario())
+    assert result == "answer"
+    assert flight.abandoned == 0
+
+
+def test_call_is_cancelled_once_every_caller_has_gone():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = False
+
+        async def fetch():
+            nonlocal cancelled
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        callers = [asyncio.ensure_future(flight.do("key", fetch)) for _ in range(2)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flight, cancelled
+
+    flight, cancelled = asyncio.run(scenario())
+    assert cancelled
+    assert flight.abandoned == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_key_is_forgotten_after_the_call_finishes():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fetch():
+            return object()
+
+        first = await flight.do("key", fetch)
+        second = await flight.do("key", fetch)
+        return flight, first, second
+
+    flight, first, second = asyncio.run(scenario())
+    assert first is not second
+    assert flight.executions == 2
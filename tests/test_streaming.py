@@ -0,0 +1,56 @@
+from app.api.services.streaming import StructuredFieldParser, format_sse
+
+
+def feed_in_chunks(text, size):
+    parser = StructuredFieldParser()
+    fields = []
+    for start in range(0, len(text), size):
+        fields.extend(parser.feed(text[start:start + size]))
+    return parser, fields
+
+
+ANSWER = (
+    '{"general_response": "Visa needed, see \\"notes\\", {not a field}",'
+    ' "passport_requirements": ["6 months, valid", "2 blank pages"],'
+    ' "relevant_travel_advisories": {"level": 2, "areas": ["north"]}}'
+)
+EXPECTED = [
+    ("general_response", 'Visa needed, see "notes", {not a field}'),
+    ("passport_requirements", ["6 months, valid", "2 blank pages"]),
+    ("relevant_travel_advisories", {"level": 2, "areas": ["north"]}),
+]
+
+
+def test_fields_are_reported_whole_whatever_the_chunk_size():
+    for size in (1, 2, 7, 50, len(ANSWER)):
+        parser, fields = feed_in_chunks(ANSWER, size)
+        assert fields == EXPECTED, size
+        assert parser.done
+
+
+def test_field_is_reported_as_soon_as_it_is_complete():
+    parser = StructuredFieldParser()
+    assert parser.feed('{"general_response": "hel') == []
+    assert parser.feed('lo", "passport') == [("general_response", "hello")]
+    assert parser.feed('_requirements": []}') == [("passport_requirements", [])]
+
+
+def test_escaped_backslash_before_a_quote_ends_the_string():
+    _, fields = feed_in_chunks('{"general_response": "C:\\\\", "x": 1}', 3)
+    assert fields == [("general_response", "C:\\"), ("x", 1)]
+
+
+def test_text_after_the_object_is_ignored():
+    parser = StructuredFieldParser()
+    assert parser.feed('{"a": 1} trailing {"b": 2}') == [("a", 1)]
+    assert parser.feed('{"c": 3}') == []
+
+
+def test_empty_object_and_malformed_fields_yield_nothing():
+    assert StructuredFieldParser().feed("{}") == []
+    _, fields = feed_in_chunks('{"a": nope, "b": 2}', 4)
+    assert fields == [("b", 2)]
+
+
+def test_format_sse():
+    assert format_sse("field", {"name": "a", "value": 1}) == 'event: field\ndata: {"name":"a","value":1}\n\n'